@@ -0,0 +1,378 @@
+import argparse
+import glob
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import zstandard
+
+from busca import id_aula
+from cache import PASTA_CACHE_PADRAO
+from functions import salvar_resumo_json
+
+NIVEL_COMPRESSAO = 6
+# Campos grandes, gravados comprimidos à parte e lidos só quando a aula é aberta
+CAMPOS_CONTEUDO = ("resumo", "transcricao", "chat")
+TAMANHO_PREVIA = 240
+FORMATO_DATA = "%Y-%m-%d %H:%M:%S"
+
+def _comprimir(valor):
+    # Devolve (dados comprimidos, tamanho original em bytes)
+    original = json.dumps(valor, ensure_ascii=False).encode("utf-8")
+    return zstandard.compress(original, NIVEL_COMPRESSAO), len(original)
+
+def _descomprimir(dados):
+    return json.loads(zstandard.decompress(dados))
+
+def _nome_arquivo(titulo, usados):
+    # Mesmo saneamento de salvar_resumo_json, com sufixo para aulas de mesmo título não se sobrescreverem
+    base = "".join(c if c.isalnum() or c in " _-" else "_" for c in titulo) or "aula"
+    nome, n = base, 2
+    while nome.lower() in usados:
+        nome, n = f"{base} ({n})", n + 1
+    usados.add(nome.lower())
+    return nome
+
+class AcervoAulas:
+    # Todas as aulas já resumidas num SQLite só. A tabela `aulas` guarda o que a listagem precisa (título,
+    # modelo, datas, prévia) e tem índices por data e modelo; resumo, transcrição e histórico do chat ficam
+    # comprimidos com zstd em `conteudos`, uma linha por campo, e só são lidos ao abrir a aula.
+    # Cada geração de resumo (gerar, regenerar, escolher na comparação) é uma entrada nova, numerada por
+    # usuário, aula (hash da transcrição) e modelo; os ajustes do chat atualizam a entrada de onde vieram
+    # (audio_info["id_acervo"]), então regenerar não apaga o chat da versão anterior.
+    # `usuario` é o espaço de trabalho (usuarios.py); o vazio é o da credencial única.
+    TABELA_AULAS = """
+        CREATE TABLE IF NOT EXISTS {nome} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT NOT NULL DEFAULT '',
+            aula TEXT NOT NULL, modelo TEXT NOT NULL, versao INTEGER NOT NULL DEFAULT 1, titulo TEXT NOT NULL,
+            criado_em REAL NOT NULL, atualizado_em REAL NOT NULL,
+            ajustes INTEGER NOT NULL DEFAULT 0, previa TEXT NOT NULL DEFAULT '',
+            indice_transcricao TEXT, tamanho INTEGER NOT NULL DEFAULT 0, tamanho_original INTEGER NOT NULL DEFAULT 0
+        );
+    """
+    ESQUEMA = TABELA_AULAS.format(nome="aulas") + """
+        CREATE INDEX IF NOT EXISTS aulas_criado_em ON aulas (usuario, criado_em DESC);
+        CREATE INDEX IF NOT EXISTS aulas_modelo ON aulas (usuario, modelo, criado_em DESC);
+        CREATE INDEX IF NOT EXISTS aulas_versoes ON aulas (usuario, aula, modelo, versao);
+        CREATE TABLE IF NOT EXISTS conteudos (
+            id_aula INTEGER NOT NULL REFERENCES aulas (id) ON DELETE CASCADE, campo TEXT NOT NULL,
+            dados BLOB NOT NULL, tamanho_original INTEGER NOT NULL,
+            PRIMARY KEY (id_aula, campo)
+        );
+    """
+
+    def __init__(self, caminho=None):
+        caminho = caminho or os.path.join(PASTA_CACHE_PADRAO, "acervo.sqlite3")
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._migrar_esquema()
+        self._conexao.execute("PRAGMA foreign_keys=ON")
+        self._conexao.executescript(self.ESQUEMA)
+
+    def _migrar_esquema(self):
+        # Acervos criados antes dos espaços por usuário ou das versões: a UNIQUE antiga sai, então a tabela é
+        # recriada. Com as chaves estrangeiras desligadas o DROP não apaga os conteúdos, que seguem apontando
+        # para os mesmos ids
+        colunas = [linha[1] for linha in self._conexao.execute("PRAGMA table_info(aulas)")]
+        if not colunas or "versao" in colunas:
+            return
+        lista = ", ".join(colunas)
+        self._conexao.executescript(f"""
+            BEGIN;
+            {self.TABELA_AULAS.format(nome="aulas_nova")}
+            INSERT INTO aulas_nova ({lista}) SELECT {lista} FROM aulas;
+            DROP TABLE aulas;
+            ALTER TABLE aulas_nova RENAME TO aulas;
+            COMMIT;
+        """)
+
+    def _executar(self, sql, parametros=()):
+        with self._lock:
+            return self._conexao.execute(sql, parametros).fetchall()
+
+    def salvar(self, audio_info, chat=None, aula=None, criado_em=None, usuario=""):
+        # Devolve o id da entrada: a de audio_info["id_acervo"] (ajuste de uma entrada já gravada) ou uma nova.
+        # A transcrição só é gravada quando a entrada é criada (não muda depois)
+        resumo = audio_info["resumo"]
+        modelo = audio_info.get("modelo_escolhido") or ""
+        # Sem transcrição não há hash: todas essas aulas cairiam no mesmo id_aula("")
+        aula = aula or (id_aula(audio_info["transcricao"]) if audio_info.get("transcricao") else None)
+        agora = time.time()
+        ajustes = sum(1 for mensagem in chat or () if mensagem["role"] == "user")
+        previa = (resumo.get("resumo_pratico") or resumo.get("pontos_principais") or "")[:TAMANHO_PREVIA]
+        conteudos = {"resumo": resumo, "chat": chat or [{"role": "assistant", "content": resumo}]}
+        # Comprime fora do lock: a transcrição de uma aula longa leva alguns milissegundos
+        comprimidos = {campo: _comprimir(valor) for campo, valor in conteudos.items()}
+        transcricao = _comprimir(audio_info["transcricao"]) if audio_info.get("transcricao") else None
+        with self._lock:
+            # IMMEDIATE: o número da versão não é disputado com o processar_lote.py gravando ao mesmo tempo
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self._conexao.execute(
+                    "SELECT id FROM aulas WHERE id = ? AND usuario = ?", (audio_info.get("id_acervo"), usuario)
+                ).fetchone()
+                if linha is None:
+                    # Entrada nova (ou a do ajuste foi apagada do histórico enquanto isso)
+                    if aula is None:
+                        raise ValueError("Aula sem transcrição: informe `aula` para gravar no acervo")
+                    id_entrada = self._conexao.execute(
+                        "INSERT INTO aulas (usuario, aula, modelo, versao, titulo, criado_em, atualizado_em) "
+                        "SELECT ?, ?, ?, COALESCE(MAX(versao), 0) + 1, ?, ?, ? FROM aulas "
+                        "WHERE usuario = ? AND aula = ? AND modelo = ?",
+                        (usuario, aula, modelo, audio_info["titulo"], criado_em or agora, agora, usuario, aula, modelo)
+                    ).lastrowid
+                    if transcricao is not None:
+                        comprimidos["transcricao"] = transcricao
+                else:
+                    id_entrada = linha[0]
+                for campo, (dados, original) in comprimidos.items():
+                    self._conexao.execute(
+                        "INSERT OR REPLACE INTO conteudos (id_aula, campo, dados, tamanho_original) VALUES (?, ?, ?, ?)",
+                        (id_entrada, campo, dados, original)
+                    )
+                # O modelo acompanha a entrada: uma aula importada sem modelo passa a ter o escolhido para os ajustes
+                self._conexao.execute(
+                    "UPDATE aulas SET titulo = ?, modelo = ?, atualizado_em = ?, ajustes = ?, previa = ?, "
+                    "indice_transcricao = COALESCE(?, indice_transcricao), "
+                    "tamanho = (SELECT SUM(LENGTH(dados)) FROM conteudos WHERE id_aula = ?), "
+                    "tamanho_original = (SELECT SUM(tamanho_original) FROM conteudos WHERE id_aula = ?) WHERE id = ?",
+                    (audio_info["titulo"], modelo, agora, ajustes, previa, audio_info.get("indice_transcricao"),
+                     id_entrada, id_entrada, id_entrada)
+                )
+                self._conexao.execute("COMMIT")
+            except BaseException:
+                self._conexao.execute("ROLLBACK")
+                raise
+        return id_entrada
+
+    @staticmethod
+    def _filtros(usuario=None, titulo=None, modelo=None, desde=None, ate=None):
+        # usuario=None: todos os espaços (linha de comando)
+        condicoes, parametros = [], []
+        if usuario is not None:
+            condicoes.append("usuario = ?")
+            parametros.append(usuario)
+        if titulo:
+            condicoes.append("titulo LIKE ? ESCAPE '\\'")
+            parametros.append("%" + titulo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+        if modelo:
+            condicoes.append("modelo = ?")
+            parametros.append(modelo)
+        if desde is not None:
+            condicoes.append("criado_em >= ?")
+            parametros.append(desde)
+        if ate is not None:
+            condicoes.append("criado_em < ?")
+            parametros.append(ate)
+        return (f"WHERE {' AND '.join(condicoes)}" if condicoes else ""), parametros
+
+    def listar(self, limite=100, deslocamento=0, **filtros):
+        # Só metadados, do mais recente para o mais antigo; datas em timestamp
+        onde, parametros = self._filtros(**filtros)
+        linhas = self._executar(
+            "SELECT id, aula, titulo, modelo, versao, criado_em, atualizado_em, ajustes, previa, tamanho, tamanho_original "
+            f"FROM aulas {onde} ORDER BY criado_em DESC, id DESC LIMIT ? OFFSET ?",
+            (*parametros, -1 if limite is None else limite, deslocamento)
+        )
+        colunas = ("id", "aula", "titulo", "modelo", "versao", "criado_em", "atualizado_em", "ajustes", "previa",
+                   "tamanho", "tamanho_original")
+        return [dict(zip(colunas, linha)) for linha in linhas]
+
+    def contar(self, **filtros):
+        onde, parametros = self._filtros(**filtros)
+        return self._executar(f"SELECT COUNT(*) FROM aulas {onde}", parametros)[0][0]
+
+    def modelos(self, usuario=None):
+        onde, parametros = self._filtros(usuario=usuario)
+        return [modelo for (modelo,) in self._executar(f"SELECT DISTINCT modelo FROM aulas {onde} ORDER BY modelo",
+                                                       parametros)]
+
+    def carregar(self, id_entrada, campos=CAMPOS_CONTEUDO, usuario=None):
+        # Metadados mais os campos pedidos, descomprimidos; None se a entrada não existe (ou é de outro usuário)
+        linhas = self._executar(
+            "SELECT titulo, modelo, criado_em, indice_transcricao FROM aulas WHERE id = ? AND usuario = COALESCE(?, usuario)",
+            (id_entrada, usuario)
+        )
+        if not linhas:
+            return None
+        titulo, modelo, criado_em, indice_transcricao = linhas[0]
+        marcadores = ", ".join("?" * len(campos))
+        conteudos = dict(self._executar(
+            f"SELECT campo, dados FROM conteudos WHERE id_aula = ? AND campo IN ({marcadores})", (id_entrada, *campos)
+        ))
+        entrada = {"id": id_entrada, "titulo": titulo, "modelo": modelo, "criado_em": criado_em,
+                   "indice_transcricao": indice_transcricao}
+        entrada.update({campo: _descomprimir(dados) for campo, dados in conteudos.items()})
+        return entrada
+
+    def audio_info(self, id_entrada, usuario=None):
+        # No formato de st.session_state.audio_info, para reabrir a aula no app
+        entrada = self.carregar(id_entrada, usuario=usuario)
+        if entrada is None:
+            return None, None
+        indice = entrada["indice_transcricao"]
+        audio_info = {
+            "titulo": entrada["titulo"],
+            "resumo": entrada["resumo"],
+            "transcricao": entrada.get("transcricao", ""),
+            "data_criacao": datetime.fromtimestamp(entrada["criado_em"]).strftime(FORMATO_DATA),
+            "modelo_escolhido": entrada["modelo"] or None,
+            "indice_transcricao": indice if indice and os.path.isdir(indice) else None,
+            # Os ajustes feitos depois de reabrir continuam nesta entrada
+            "id_acervo": id_entrada,
+        }
+        return audio_info, entrada.get("chat")
+
+    def remover(self, id_entrada, usuario=None):
+        self._executar("DELETE FROM aulas WHERE id = ? AND usuario = COALESCE(?, usuario)", (id_entrada, usuario))
+
+    def do_usuario(self, usuario):
+        return AcervoUsuario(self, usuario)
+
+    def _exportar(self, entradas, gravar):
+        usados = set()
+        for item in entradas:
+            entrada = self.carregar(item["id"], campos=("resumo",))
+            dados = {"titulo": entrada["titulo"], "resumo": entrada["resumo"],
+                     "data_criacao": datetime.fromtimestamp(entrada["criado_em"]).strftime(FORMATO_DATA)}
+            gravar(dados, _nome_arquivo(entrada["titulo"], usados))
+        return len(usados)
+
+    def exportar_json(self, pasta_destino, **filtros):
+        # Um JSON por entrada, no formato de salvar_resumo_json; devolve quantos foram gravados
+        os.makedirs(pasta_destino, exist_ok=True)
+        return self._exportar(
+            self.listar(limite=None, **filtros),
+            lambda dados, nome: salvar_resumo_json(dados, nome, pasta_destino=pasta_destino)
+        )
+
+    def exportar_zip(self, **filtros):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+            self._exportar(
+                self.listar(limite=None, **filtros),
+                lambda dados, nome: arquivo_zip.writestr(
+                    f"{nome}.json", salvar_resumo_json(dados, nome, return_bytes=True).getvalue()
+                )
+            )
+        return buffer.getvalue()
+
+    def importar_jsons(self, entradas, log=print, usuario=""):
+        # JSONs gravados por salvar_resumo_json (só o resumo: o JSON não guarda transcrição nem modelo)
+        arquivos = []
+        for entrada in entradas:
+            arquivos += glob.glob(os.path.join(entrada, "*.json")) if os.path.isdir(entrada) else glob.glob(entrada)
+        importados = 0
+        for arquivo in sorted(set(arquivos)):
+            with open(arquivo, encoding="utf-8") as f:
+                dados = json.load(f)
+            try:
+                criado_em = datetime.strptime(dados.get("data_criacao", ""), FORMATO_DATA).timestamp()
+            except ValueError:
+                criado_em = os.path.getmtime(arquivo)
+            aula = "json:" + os.path.abspath(arquivo)
+            # Importar a mesma pasta de novo não duplica as aulas
+            if self._executar("SELECT 1 FROM aulas WHERE usuario = ? AND aula = ?", (usuario, aula)):
+                log(f"[já importado] {arquivo}")
+                continue
+            audio_info = {"titulo": dados.get("titulo") or os.path.splitext(os.path.basename(arquivo))[0],
+                          "resumo": dados["resumo"], "transcricao": ""}
+            self.salvar(audio_info, aula=aula, criado_em=criado_em, usuario=usuario)
+            importados += 1
+            log(f"[importado] {arquivo}")
+        return importados
+
+    def estatisticas(self):
+        entradas, tamanho, original = self._executar(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0), COALESCE(SUM(tamanho_original), 0) FROM aulas"
+        )[0]
+        return {"entradas": entradas, "bytes": tamanho, "bytes_originais": original,
+                "arquivo_bytes": os.path.getsize(self.caminho)}
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+class AcervoUsuario:
+    # O acervo visto por um usuário: o que ele grava fica no seu espaço, e listar, abrir e exportar só veem o dele.
+    # É o que o app e os jobs recebem no lugar do AcervoAulas
+    def __init__(self, acervo, usuario):
+        self.acervo = acervo
+        self.usuario = usuario
+
+    def salvar(self, audio_info, chat=None, aula=None, criado_em=None):
+        return self.acervo.salvar(audio_info, chat, aula=aula, criado_em=criado_em, usuario=self.usuario)
+
+    def listar(self, limite=100, deslocamento=0, **filtros):
+        return self.acervo.listar(limite, deslocamento, usuario=self.usuario, **filtros)
+
+    def contar(self, **filtros):
+        return self.acervo.contar(usuario=self.usuario, **filtros)
+
+    def modelos(self):
+        return self.acervo.modelos(usuario=self.usuario)
+
+    def audio_info(self, id_entrada):
+        return self.acervo.audio_info(id_entrada, usuario=self.usuario)
+
+    def remover(self, id_entrada):
+        self.acervo.remover(id_entrada, usuario=self.usuario)
+
+    def exportar_zip(self, **filtros):
+        return self.acervo.exportar_zip(usuario=self.usuario, **filtros)
+
+    def exportar_json(self, pasta_destino, **filtros):
+        return self.acervo.exportar_json(pasta_destino, usuario=self.usuario, **filtros)
+
+def _timestamp(data):
+    return datetime.strptime(data, "%Y-%m-%d").timestamp() if data else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Acervo das aulas resumidas: listar, exportar e importar JSONs.")
+    parser.add_argument("--banco", default=None, help="arquivo SQLite do acervo")
+    parser.add_argument("--usuario", default=None,
+                        help="espaço de um usuário (login do app); sem isso lista e exporta todos e importa no padrão")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    for nome, ajuda in (("listar", "lista as aulas do acervo"), ("exportar", "grava um JSON por aula")):
+        comando = sub.add_parser(nome, help=ajuda)
+        comando.add_argument("--titulo", help="parte do título")
+        comando.add_argument("--modelo")
+        comando.add_argument("--desde", help="AAAA-MM-DD")
+        comando.add_argument("--ate", help="AAAA-MM-DD (exclusive)")
+        if nome == "exportar":
+            comando.add_argument("pasta")
+    importar = sub.add_parser("importar", help="importa JSONs de resumo (pastas ou globs)")
+    importar.add_argument("entradas", nargs="+")
+    args = parser.parse_args(argv)
+
+    acervo = AcervoAulas(args.banco)
+    if args.comando == "importar":
+        print(f"{acervo.importar_jsons(args.entradas, usuario=args.usuario or '')} JSON(s) importado(s)")
+        return 0
+    filtros = {"usuario": args.usuario, "titulo": args.titulo, "modelo": args.modelo, "desde": _timestamp(args.desde),
+               "ate": _timestamp(args.ate)}
+    if args.comando == "exportar":
+        print(f"{acervo.exportar_json(args.pasta, **filtros)} JSON(s) gravado(s) em {args.pasta}")
+        return 0
+    for item in acervo.listar(limite=None, **filtros):
+        data = datetime.fromtimestamp(item["criado_em"]).strftime("%Y-%m-%d %H:%M")
+        print(f"{item['id']:>6}  {data}  {item['modelo'] or '-':<12} v{item['versao']:<3} {item['ajustes']:>2} ajuste(s)  "
+              f"{item['titulo']}")
+    estatisticas = acervo.estatisticas()
+    print(f"{estatisticas['entradas']} aula(s), {estatisticas['bytes'] / 2**20:.1f} MB comprimidos "
+          f"({estatisticas['bytes_originais'] / 2**20:.1f} MB sem compressão)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
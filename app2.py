@@ -1,17 +1,14 @@
 import streamlit as st
-from functions import (
-    transcrever_audio_whisper, gerar_resumo, get_openai_client, salvar_resumo_json, ajustar_resumo
-)
+import html
+import math
 import os
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
 import streamlit.components.v1 as components
-import time
+from usuarios import autenticar, pasta_do_espaco, ESPACO_COMPARTILHADO
 
 st.set_page_config(page_title="Gerador de Resumos", layout="wide")
 
-api_key = st.secrets["openai"]["api_key"]
-client = get_openai_client(api_key)
-
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
 if "chat_history" not in st.session_state:
@@ -22,27 +19,13 @@ if "processing" not in st.session_state:
     st.session_state.processing = False
 if "audio_info" not in st.session_state:
     st.session_state.audio_info = {"titulo": "", "resumo": None, "transcricao": "", "data_criacao": "", "modelo_escolhido": None}
-
-def handle_chat_input():
-    if st.session_state.processing:
-        st.rerun()
-
-def process_pending_messages():
-    if st.session_state.processing:
-        try:
-            historico = st.session_state.chat_history
-            user_message = historico[-1]["content"]
-            modelo = st.session_state.audio_info["modelo_escolhido"]
-            adjusted_resumo = ajustar_resumo(historico, user_message, client, modelo)
-            st.session_state.chat_history.append({"role": "assistant", "content": adjusted_resumo})
-            st.session_state.last_output = adjusted_resumo
-            st.session_state.audio_info["resumo"] = adjusted_resumo
-        except Exception as e:
-            st.session_state.chat_history.append(
-                {"role": "assistant", "content": f"Erro ao ajustar o resumo: {str(e)}"}
-            )
-        st.session_state.processing = False
-        st.rerun()
+if "comparacao" not in st.session_state:
+    st.session_state.comparacao = None
+if "id_sessao" not in st.session_state:
+    st.session_state.id_sessao = uuid.uuid4().hex
+if "job_ativo" not in st.session_state:
+    # Depois de um refresh, o id do job em andamento volta pela URL
+    st.session_state.job_ativo = st.query_params.get("job")
 
 def login_screen():
     st.title("Login - Gerador de Resumos")
@@ -51,27 +34,183 @@ def login_screen():
         password = st.text_input("Senha", type="password")
         submit_button = st.form_submit_button(label="Entrar")
     if submit_button:
-        stored_username = st.secrets["credentials"]["user"]
-        stored_password = st.secrets["credentials"]["password"]
-        if username == stored_username and password == stored_password:
+        espaco = autenticar(st.secrets["credentials"], username, password)
+        if espaco is not None:
             st.session_state.logged_in = True
+            st.session_state.usuario = username
+            # Histórico, índice de busca e temporários do usuário ficam no espaço dele
+            st.session_state.espaco = espaco
             st.success("Login bem-sucedido!")
             st.rerun()
         else:
             st.error("Usuário ou senha incorretos!")
 
-def sanitize_filename(filename):
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    return filename
+if not st.session_state.logged_in:
+    # A tela de login só precisa do Streamlit: caches, índice de busca, ffmpeg e o SDK da OpenAI são
+    # carregados depois do login (e continuam em sys.modules nos reruns seguintes)
+    login_screen()
+    st.stop()
+
+from functions import get_openai_client, salvar_resumo_json, variantes_resumo, SECOES_RESUMO
+from cache import CacheTranscricoes, CacheResumos
+from metricas import registro as registro_metricas
+from tokens import contar_tokens
+from indice_transcricao import TranscricaoIndexada, formatar_tempo
+from busca import IndiceBusca, criar_embedder, PASTA_INDICE_BUSCA
+from entrada_audio import AudioEntrada, PASTA_TEMPORARIA
+from acervo import AcervoAulas, TAMANHO_PREVIA
+from jobs import (
+    GerenciadorJobs, CotaExcedida, ESTADOS_ATIVOS, job_transcrever, job_transcrever_mensagem, job_gerar_resumo,
+    job_ajustar_resumo, job_comparar_modelos, agendar_indexacao, arquivar
+)
+
+# Jobs disparados pelo chat de ajustes: o progresso e os erros aparecem no próprio chat
+ERROS_JOBS_CHAT = {"ajuste": "Erro ao ajustar o resumo", "microfone": "Erro ao transcrever o áudio"}
+
+@st.cache_resource
+def obter_cliente_openai(api_key):
+    # Um por processo; o SDK da OpenAI só é importado na primeira chamada à API (transport.py)
+    return get_openai_client(api_key)
+
+@st.cache_resource
+def obter_cache_transcricoes():
+    return CacheTranscricoes()
+
+@st.cache_resource
+def obter_cache_resumos():
+    return CacheResumos()
+
+@st.cache_resource
+def obter_indice_busca(espaco):
+    # Um por usuário, aberto na primeira busca ou no primeiro resumo, não a cada sessão
+    return IndiceBusca(pasta=pasta_do_espaco(PASTA_INDICE_BUSCA, espaco), embedder=criar_embedder(client=client))
+
+@st.cache_resource
+def obter_acervo():
+    return AcervoAulas()
 
-def estimate_tokens(text):
-    if not text:
-        return 0
-    words = len(text.split())
-    chars = len(text)
-    return max(words, chars // 4)
+@st.cache_resource
+def obter_gerenciador_jobs():
+    # Compartilhado por todas as sessões do processo: os jobs sobrevivem a reruns e refresh, e os workers são
+    # divididos entre os usuários com cota por usuário (GERADOR_JOBS_POR_USUARIO, GERADOR_FILA_POR_USUARIO)
+    return GerenciadorJobs()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def contar_tokens_tela(texto, modelo=None):
+    # O texto exibido quase nunca muda entre reruns, e contar uma transcrição longa leva dezenas de ms
+    return contar_tokens(texto, modelo)
+
+# O resumo só muda a cada geração ou ajuste; com o próprio resumo como chave do cache_data, os reruns
+# reaproveitam as seções separadas, a contagem de tokens e o JSON de download
+@st.cache_data(max_entries=32, show_spinner=False)
+def secoes_resumo_tela(resumo, modelo=None):
+    secoes = [(cabecalho, resumo.get(chave, "Não disponível")) for chave, cabecalho in SECOES_RESUMO]
+    return secoes, contar_tokens(" ".join(resumo[chave] for chave, _ in SECOES_RESUMO), modelo)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def json_resumo_tela(titulo, data_criacao, resumo):
+    dados = {"titulo": titulo, "data_criacao": data_criacao, "resumo": resumo}
+    return salvar_resumo_json(dados, titulo, return_bytes=True).getvalue()
+
+client = obter_cliente_openai(st.secrets["openai"]["api_key"])
+cache_transcricoes = obter_cache_transcricoes()
+cache_resumos = obter_cache_resumos()
+espaco = st.session_state.get("espaco", ESPACO_COMPARTILHADO)
+acervo = obter_acervo().do_usuario(espaco)
+gerenciador_jobs = obter_gerenciador_jobs()
+pasta_temporaria = pasta_do_espaco(PASTA_TEMPORARIA, espaco)
+# Com a credencial única, cada sessão é um dono para a fila de jobs
+dono_jobs = espaco or f"sessao:{st.session_state.id_sessao}"
+
+def handle_chat_input():
+    if st.session_state.processing:
+        st.rerun()
+
+def mostrar_secoes(secoes):
+    for chave, cabecalho in SECOES_RESUMO:
+        st.write(f"{cabecalho}:")
+        st.write(secoes.get(chave) or "_Gerando..._")
+
+def iniciar_job(tipo, funcao, *args, **kwargs):
+    try:
+        st.session_state.job_ativo = gerenciador_jobs.submeter(tipo, funcao, *args, dono=dono_jobs, **kwargs)
+    except CotaExcedida as e:
+        st.session_state.processing = False
+        if tipo in ERROS_JOBS_CHAT:
+            st.session_state.chat_history.append({"role": "assistant", "content": f"{ERROS_JOBS_CHAT[tipo]}: {e}"})
+        else:
+            st.session_state.erro_job = str(e)
+        st.rerun()
+    st.query_params["job"] = st.session_state.job_ativo
+    st.rerun()
+
+def obter_job_ativo():
+    if not st.session_state.job_ativo:
+        return None
+    job = gerenciador_jobs.obter(st.session_state.job_ativo)
+    # Um id de job colado na URL por outro usuário não abre o resultado dele. Com a credencial única o dono é a
+    # sessão, que muda no refresh, então vale qualquer job de sessão
+    if job is not None and job["dono"] != dono_jobs and (espaco or not (job["dono"] or "sessao:").startswith("sessao:")):
+        job = None
+    if job is None:
+        st.session_state.job_ativo = None
+        st.query_params.pop("job", None)
+    return job
+
+def aplicar_resultado_job(job):
+    resultado = job["resultado"]
+    if job["tipo"] == "transcricao":
+        st.session_state.audio_info.update(resultado)
+        return
+    if job["tipo"] == "microfone":
+        # A instrução transcrita vai para a caixa de texto, para o usuário revisar antes de enviar
+        if resultado["mensagem"] and resultado["mensagem"].strip():
+            st.session_state.input_value = resultado["mensagem"]
+        return
+    if job["tipo"] == "comparacao":
+        # Todos os resultados ficam na sessão; o usuário escolhe qual segue para o chat
+        st.session_state.comparacao = resultado["comparacao"]
+        return
+    st.session_state.audio_info = resultado["audio_info"]
+    st.session_state.last_output = resultado["audio_info"]["resumo"]
+    st.session_state.chat_history = resultado.get(
+        "chat_history", [{"role": "assistant", "content": resultado["audio_info"]["resumo"]}]
+    )
+
+@st.fragment(run_every=1.0)
+def acompanhar_job():
+    # Só este trecho é reexecutado a cada segundo enquanto o job roda
+    job = obter_job_ativo()
+    if job is not None and job["estado"] in ESTADOS_ATIVOS:
+        st.progress(job["progresso"])
+        st.text(job["mensagem"] or "Aguardando na fila...")
+        if job["parcial"] and job["tipo"] == "comparacao":
+            mostrar_comparacao(job["parcial"])
+        elif job["parcial"]:
+            mostrar_secoes(job["parcial"])
+        return
+
+    st.session_state.job_ativo = None
+    st.query_params.pop("job", None)
+    st.session_state.processing = False
+    if job is not None and job["estado"] == "concluido":
+        aplicar_resultado_job(job)
+    elif job is not None:
+        mensagem = f"Erro ({job['estado']}): {job['erro']}"
+        if job["tipo"] in ERROS_JOBS_CHAT:
+            st.session_state.chat_history.append(
+                {"role": "assistant", "content": f"{ERROS_JOBS_CHAT[job['tipo']]}: {mensagem}"}
+            )
+        else:
+            st.session_state.erro_job = mensagem
+    st.rerun()
+
+def process_pending_messages():
+    if st.session_state.processing and not st.session_state.job_ativo:
+        iniciar_job(
+            "ajuste", job_ajustar_resumo,
+            list(st.session_state.chat_history), dict(st.session_state.audio_info), client, acervo=acervo
+        )
 
 def show_chat(titulo):
     st.subheader(f"Chat de ajustes - {titulo} (Modelo: {st.session_state.audio_info['modelo_escolhido']})")
@@ -92,6 +231,12 @@ def show_chat(titulo):
                     st.chat_message("assistant").write(texto_completo)
                 else:
                     st.chat_message("assistant").write(msg["content"])
+        # O ajuste (ou a transcrição do microfone) em andamento aparece logo abaixo do histórico
+        process_pending_messages()
+        job = obter_job_ativo()
+        if job is not None and job["tipo"] in ERROS_JOBS_CHAT:
+            with st.chat_message("assistant"):
+                acompanhar_job()
     
     st.markdown(
         """
@@ -100,112 +245,176 @@ def show_chat(titulo):
         unsafe_allow_html=True
     )
     
-    with st.container():
-        col_input, col_mic = st.columns([5, 1])
-        with col_input:
-            if "input_value" not in st.session_state:
-                st.session_state.input_value = ""
-            user_input = st.text_input(
-                "Digite ou fale sua solicitação de ajuste",
-                key="user_message",
-                placeholder="Digite aqui ou use o microfone ao lado...",
-                value=st.session_state.input_value,
-                on_change=lambda: st.session_state.update({"input_value": st.session_state["user_message"]})
-            )
-        with col_mic:
-            audio_value = st.audio_input(
-                "",
-                key="audio_input",
-                label_visibility="collapsed"
-            )
-        
-        col_submit = st.columns([5, 1])[1]
-        with col_submit:
-            if st.button("Enviar", key="send_button"):
-                if user_input and user_input.strip():
-                    st.session_state.chat_history.append({"role": "user", "content": user_input})
-                    st.session_state.processing = True
-                    st.session_state.input_value = ""
-                    if "audio_processed" in st.session_state:
-                        del st.session_state.audio_processed
-                    st.rerun()
-        
-        if audio_value is not None and "audio_processed" not in st.session_state:
-            with st.spinner("Transcrevendo áudio..."):
-                safe_file_key = sanitize_filename(titulo)
-                temp_audio_path = f"temp_chat_audio_{safe_file_key}.mp3"
-                with open(temp_audio_path, "wb") as f:
-                    f.write(audio_value.read())
-                transcricao = transcrever_audio_whisper(temp_audio_path, client)
-                if os.path.exists(temp_audio_path):
-                    os.remove(temp_audio_path)
-                if transcricao and transcricao.strip():
-                    st.session_state.input_value = transcricao
-                    st.session_state.audio_processed = True
-                    st.rerun()
-
-def transcrever_audio(uploaded_file):
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    if not st.session_state.audio_info["modelo_escolhido"]:
+        # Aula importada de JSON: os ajustes precisam de um modelo para chamar a API
+        st.info("Esta aula não tem modelo registrado. Escolha um para fazer ajustes pelo chat.")
+        modelo = st.selectbox("Modelo dos ajustes", MODELOS_RESUMO, index=None, key="modelo_ajustes")
+        if modelo is None:
+            return
+        st.session_state.audio_info["modelo_escolhido"] = modelo
+    entrada_chat()
+
+@st.fragment
+def entrada_chat():
+    # Digitar, gravar e transcrever a mensagem reexecuta só este trecho; enviar recarrega a página toda
+    col_input, col_mic = st.columns([5, 1])
+    with col_input:
+        if "input_value" not in st.session_state:
+            st.session_state.input_value = ""
+        user_input = st.text_input(
+            "Digite ou fale sua solicitação de ajuste",
+            key="user_message",
+            placeholder="Digite aqui ou use o microfone ao lado...",
+            value=st.session_state.input_value,
+            on_change=lambda: st.session_state.update({"input_value": st.session_state["user_message"]})
+        )
+    with col_mic:
+        audio_value = st.audio_input(
+            "",
+            key="audio_input",
+            label_visibility="collapsed"
+        )
     
-    try:
-        nome_sem_extensao = os.path.splitext(uploaded_file.name)[0]
-        caminho_temp = f"temp_{nome_sem_extensao}.mp3"
-        with open(caminho_temp, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
-        def update_status(message):
-            status_text.text(message)
-        
-        status_text.text("Iniciando transcrição...")
-        transcricao = transcrever_audio_whisper(caminho_temp, client, status_callback=update_status)
-        
-        progress_bar.progress(100)
-        status_text.text("Transcrição concluída com sucesso!")
-        time.sleep(1)
-        progress_bar.empty()
-        status_text.empty()
-        
-        st.session_state.audio_info.update({
-            "titulo": nome_sem_extensao,
-            "transcricao": transcricao,
-            "data_criacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        
-        if os.path.exists(caminho_temp):
-            os.remove(caminho_temp)
-        
-        st.rerun()
-    except Exception as e:
-        progress_bar.empty()
-        status_text.empty()
-        st.error(f"Erro ao transcrever o arquivo: {str(e)}")
-
-def gerar_resumo_com_modelo(modelo):
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    col_submit = st.columns([5, 1])[1]
+    with col_submit:
+        if st.button("Enviar", key="send_button", disabled=bool(st.session_state.job_ativo)):
+            if user_input and user_input.strip():
+                st.session_state.chat_history.append({"role": "user", "content": user_input})
+                st.session_state.processing = True
+                st.session_state.input_value = ""
+                if "audio_processed" in st.session_state:
+                    del st.session_state.audio_processed
+                st.rerun()
     
-    try:
-        status_text.text(f"Gerando resumo com {modelo}...")
-        progress_bar.progress(50)
-        resumo_secoes = gerar_resumo(st.session_state.audio_info["transcricao"], client, modelo)
-        
-        st.session_state.chat_history = [{"role": "assistant", "content": resumo_secoes}]
-        st.session_state.last_output = resumo_secoes
-        st.session_state.audio_info["resumo"] = resumo_secoes
-        st.session_state.audio_info["modelo_escolhido"] = modelo
-        
-        progress_bar.progress(100)
-        status_text.text("Resumo gerado com sucesso!")
-        time.sleep(1)
-        progress_bar.empty()
-        status_text.empty()
-        
+    if audio_value is not None and "audio_processed" not in st.session_state and not st.session_state.job_ativo:
+        # Vai para a fila de jobs como os uploads (e conta na cota do usuário); a gravação segue direto do buffer
+        # do Streamlit para o Whisper, e o texto volta para a caixa de mensagem quando o job termina
+        st.session_state.audio_processed = True
+        iniciar_job(
+            "microfone", job_transcrever_mensagem,
+            AudioEntrada.de_upload(audio_value, nome="microfone.wav", pasta=pasta_temporaria), client
+        )
+
+def transcrever_audio(uploaded_file, usar_cache=True):
+    nome_sem_extensao = os.path.splitext(uploaded_file.name)[0]
+    # Uploads pequenos seguem no buffer do Streamlit; os grandes são gravados uma vez fora do diretório de
+    # trabalho, com a extensão real para o ffmpeg fatiar sem recodificar. O job fecha a entrada ao terminar.
+    entrada = AudioEntrada.de_upload(uploaded_file, pasta=pasta_temporaria)
+    iniciar_job(
+        "transcricao", job_transcrever, entrada, nome_sem_extensao, client,
+        cache=cache_transcricoes, usar_cache=usar_cache
+    )
+
+def gerar_resumo_todos_modelos(forcar_novo=False):
+    st.session_state.comparacao = None
+    iniciar_job(
+        "comparacao", job_comparar_modelos, dict(st.session_state.audio_info), client, list(MODELOS_RESUMO),
+        cache=cache_resumos, forcar_novo=forcar_novo
+    )
+
+def _rotulo_aba(modelo, resultado):
+    marcador = {"concluido": "✅", "erro": "❌"}.get(resultado["estado"], "⏳")
+    return f"{marcador} {modelo}"
+
+def mostrar_comparacao(resultados, permitir_escolha=False):
+    modelos = list(resultados)
+    for aba, modelo in zip(st.tabs([_rotulo_aba(m, resultados[m]) for m in modelos]), modelos):
+        resultado = resultados[modelo]
+        with aba:
+            if resultado["estado"] == "erro":
+                st.error(resultado["erro"])
+                continue
+            if resultado["estado"] == "concluido":
+                if resultado.get("cache"):
+                    detalhes = f"do cache em {resultado['duracao']:.1f}s"
+                else:
+                    detalhes = f"{resultado['duracao']:.1f}s"
+                    if resultado.get("primeiro_token") is not None:
+                        detalhes += f" (primeiro token em {resultado['primeiro_token']:.1f}s)"
+                    if resultado.get("tokens_prompt") is not None:
+                        detalhes += f" · {resultado['tokens_prompt']} + {resultado['tokens_resposta']} tokens"
+                    if resultado.get("custo_usd"):
+                        detalhes += f" · US$ {resultado['custo_usd']:.4f}"
+                st.caption(detalhes)
+            mostrar_secoes(resultado["secoes"] or {})
+            if permitir_escolha and resultado["estado"] == "concluido":
+                if st.button(f"Continuar com {modelo}", key=f"escolher_{modelo}"):
+                    escolher_resultado_comparacao(modelo, resultado["secoes"])
+
+def escolher_resultado_comparacao(modelo, secoes):
+    audio_info = st.session_state.audio_info
+    audio_info["resumo"] = secoes
+    audio_info["modelo_escolhido"] = modelo
+    st.session_state.last_output = secoes
+    st.session_state.chat_history = [{"role": "assistant", "content": secoes}]
+    agendar_indexacao(obter_indice_busca(espaco), dict(audio_info), secoes)
+    arquivar(acervo, audio_info, nova_versao=True)
+    st.rerun()
+
+def gerar_resumo_com_modelo(modelo, forcar_novo=False):
+    # Sem forcar_novo, um resumo já gerado para esta transcrição e modelo volta direto do cache
+    iniciar_job(
+        "resumo", job_gerar_resumo, dict(st.session_state.audio_info), client, modelo,
+        cache=cache_resumos, forcar_novo=forcar_novo, indice_busca=obter_indice_busca(espaco), acervo=acervo
+    )
+
+def escolher_variante_resumo():
+    audio_info = st.session_state.audio_info
+    # Aulas importadas de JSON não têm transcrição nem modelo para procurar no cache
+    if not audio_info["transcricao"] or not audio_info["modelo_escolhido"]:
+        return
+    variantes = variantes_resumo(audio_info["transcricao"], audio_info["modelo_escolhido"], cache_resumos)
+    if len(variantes) < 2:
+        return
+    opcoes = {
+        f"Versão {i + 1} ({datetime.fromtimestamp(v['criado_em']).strftime('%d/%m %H:%M')})": v["secoes"]
+        for i, v in enumerate(variantes)
+    }
+    escolha = st.selectbox(
+        f"Gerações anteriores com {audio_info['modelo_escolhido']}", list(opcoes),
+        index=None, placeholder="Abrir uma versão anterior...", key="variante_resumo"
+    )
+    if escolha and st.button("Usar esta versão", key="usar_variante"):
+        audio_info["resumo"] = opcoes[escolha]
+        st.session_state.last_output = opcoes[escolha]
+        st.session_state.chat_history = [{"role": "assistant", "content": opcoes[escolha]}]
+        arquivar(acervo, audio_info, nova_versao=True)
         st.rerun()
-    except Exception as e:
-        progress_bar.empty()
-        status_text.empty()
-        st.error(f"Erro ao gerar o resumo: {str(e)}")
+
+MODELOS_RESUMO = ("gpt-4o-mini", "o1-mini", "o3-mini")
+
+# Minutos exibidos de início; o resto da transcrição só é lido do índice quando o trecho muda
+JANELA_TRANSCRICAO_MINUTOS = 5
+
+@st.cache_resource(max_entries=8)
+def abrir_indice_transcricao(caminho):
+    return TranscricaoIndexada.abrir(caminho)
+
+@st.fragment
+def mostrar_transcricao(audio_info):
+    # Mover o trecho reexecuta só a transcrição, não a página inteira
+    caminho = audio_info.get("indice_transcricao")
+    if caminho and os.path.isdir(caminho):
+        indice = abrir_indice_transcricao(caminho)
+        minutos_total = max(1, math.ceil(indice.duracao / 60))
+        inicio, fim = st.slider(
+            "Trecho da aula (minutos)", 0, minutos_total, (0, min(JANELA_TRANSCRICAO_MINUTOS, minutos_total)),
+            key=f"trecho_{os.path.basename(caminho)}"
+        )
+        conteudo = "<br>".join(
+            f"<b>[{formatar_tempo(inicio_segmento)}]</b> {html.escape(texto)}"
+            for inicio_segmento, _, texto in indice.segmentos(inicio * 60, fim * 60)
+        ) or "Nada foi dito nesse trecho."
+    else:
+        conteudo = audio_info["transcricao"]
+    st.markdown(
+        f"""
+        <div style="max-height: 150px; overflow-y: auto; border: 1px solid #ccc; padding: 10px; background-color: #f9f9f9;">
+            {conteudo}
+        </div>
+        """,
+        unsafe_allow_html=True
+    )
 
 def generate_interface():
     st.title("Gerar Resumo de Áudio")
@@ -219,34 +428,41 @@ def generate_interface():
         accept_multiple_files=False
     )
     
+    job = obter_job_ativo()
+    ocupado = job is not None
+    # Jobs do chat aparecem no chat; depois de um refresh, sem resumo na sessão, aparecem aqui
+    if job is not None and (job["tipo"] not in ERROS_JOBS_CHAT or not st.session_state.audio_info["resumo"]):
+        acompanhar_job()
+    if "erro_job" in st.session_state:
+        st.error(st.session_state.pop("erro_job"))
+    
     if uploaded_file and not st.session_state.audio_info["transcricao"]:
-        if st.button("Transcrever Áudio", key="transcribe_button"):
-            transcrever_audio(uploaded_file)
+        ignorar_cache = st.checkbox("Ignorar cache e transcrever novamente", key="ignorar_cache")
+        if st.button("Transcrever Áudio", key="transcribe_button", disabled=ocupado):
+            transcrever_audio(uploaded_file, usar_cache=not ignorar_cache)
     
     if st.session_state.audio_info["transcricao"]:
         st.subheader("Transcrição do Áudio")
-        st.markdown(
-            f"""
-            <div style="max-height: 150px; overflow-y: auto; border: 1px solid #ccc; padding: 10px; background-color: #f9f9f9;">
-                {st.session_state.audio_info["transcricao"]}
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
-        transcricao_tokens = estimate_tokens(st.session_state.audio_info["transcricao"])
-        st.write(f"**Estimativa de Tokens da Transcrição:** ~{transcricao_tokens} tokens")
+        mostrar_transcricao(st.session_state.audio_info)
+        transcricao_tokens = contar_tokens_tela(st.session_state.audio_info["transcricao"])
+        st.write(f"**Tokens da Transcrição:** {transcricao_tokens}")
         
         st.subheader("Escolha um Modelo para Gerar o Resumo")
         col1, col2, col3 = st.columns(3)
         with col1:
-            if st.button("Gerar com GPT-4o Mini", key="gpt4o_mini"):
+            if st.button("Gerar com GPT-4o Mini", key="gpt4o_mini", disabled=ocupado):
                 gerar_resumo_com_modelo("gpt-4o-mini")
         with col2:
-            if st.button("Gerar com o1-mini", key="o1-mini"):
+            if st.button("Gerar com o1-mini", key="o1-mini", disabled=ocupado):
                 gerar_resumo_com_modelo("o1-mini")
         with col3:
-            if st.button("Gerar com o3-mini", key="o3-mini"):
+            if st.button("Gerar com o3-mini", key="o3-mini", disabled=ocupado):
                 gerar_resumo_com_modelo("o3-mini")
+        if st.button("Gerar com todos e comparar", key="todos_modelos", disabled=ocupado):
+            gerar_resumo_todos_modelos()
+        if st.session_state.comparacao:
+            st.subheader("Comparação entre modelos")
+            mostrar_comparacao(st.session_state.comparacao, permitir_escolha=True)
     
     if st.session_state.audio_info["resumo"]:
         st.success(f"Resumo gerado com {st.session_state.audio_info['modelo_escolhido']}!")
@@ -254,42 +470,37 @@ def generate_interface():
         st.write(f"**Arquivo:** {st.session_state.audio_info['titulo']}")
         st.write("**Último Resumo Atualizado:**")
         ultimo_resumo = st.session_state.last_output if st.session_state.last_output else st.session_state.audio_info["resumo"]
-        st.write("1) Pontos principais em formato de tópicos detalhados:")
-        st.write(ultimo_resumo.get("pontos_principais", "Não disponível"))
-        st.write("2) Resumo prático e completo da transcrição:")
-        st.write(ultimo_resumo.get("resumo_pratico", "Não disponível"))
-        st.write("3) Perguntas e respostas baseadas no texto:")
-        st.write(ultimo_resumo.get("perguntas_respostas", "Não disponível"))
-        st.write("4) Exemplos de copy:")
-        st.write(ultimo_resumo.get("exemplos_copy", "Não disponível"))
+        secoes_tela, resumo_tokens = secoes_resumo_tela(ultimo_resumo, st.session_state.audio_info["modelo_escolhido"])
+        for cabecalho, texto in secoes_tela:
+            st.write(f"{cabecalho}:")
+            st.write(texto)
         
-        resumo_tokens = estimate_tokens(
-            ultimo_resumo["pontos_principais"] + " " +
-            ultimo_resumo["resumo_pratico"] + " " +
-            ultimo_resumo["perguntas_respostas"] + " " +
-            ultimo_resumo["exemplos_copy"]
-        )
-        st.write(f"**Estimativa de Tokens do Resumo:** ~{resumo_tokens} tokens")
+        st.write(f"**Tokens do Resumo:** {resumo_tokens}")
         
         if st.download_button(
             label="Baixar JSON",
-            data=salvar_resumo_json(st.session_state.audio_info, st.session_state.audio_info["titulo"], return_bytes=True),
+            data=json_resumo_tela(st.session_state.audio_info["titulo"], st.session_state.audio_info["data_criacao"],
+                                  st.session_state.audio_info["resumo"]),
             file_name=f"{st.session_state.audio_info['titulo']}.json",
             mime="application/json"
         ):
             st.success("JSON baixado com sucesso!")
         
+        escolher_variante_resumo()
+        
         st.subheader("Tente Outro Modelo")
+        sem_transcricao = not st.session_state.audio_info["transcricao"]
+        ajuda_regenerar = "Aula importada sem transcrição: não há o que resumir de novo." if sem_transcricao else None
         col1, col2, col3 = st.columns(3)
         with col1:
-            if st.button("Regenerar com GPT-4o Mini", key="regen_gpt4o_mini"):
-                gerar_resumo_com_modelo("gpt-4o-mini")
+            if st.button("Regenerar com GPT-4o Mini", key="regen_gpt4o_mini", disabled=ocupado or sem_transcricao, help=ajuda_regenerar):
+                gerar_resumo_com_modelo("gpt-4o-mini", forcar_novo=True)
         with col2:
-            if st.button("Regenerar com o1-mini", key="regen_o1-mini"):
-                gerar_resumo_com_modelo("o1-mini")
+            if st.button("Regenerar com o1-mini", key="regen_o1-mini", disabled=ocupado or sem_transcricao, help=ajuda_regenerar):
+                gerar_resumo_com_modelo("o1-mini", forcar_novo=True)
         with col3:
-            if st.button("Regenerar com o3-mini", key="regen_o3-mini"):
-                gerar_resumo_com_modelo("o3-mini")
+            if st.button("Regenerar com o3-mini", key="regen_o3-mini", disabled=ocupado or sem_transcricao, help=ajuda_regenerar):
+                gerar_resumo_com_modelo("o3-mini", forcar_novo=True)
         
         st.markdown(
             """
@@ -304,13 +515,146 @@ def generate_interface():
         st.session_state.audio_info = {"titulo": "", "resumo": None, "transcricao": "", "data_criacao": "", "modelo_escolhido": None}
         st.session_state.chat_history = []
         st.session_state.last_output = None
+        st.session_state.comparacao = None
         st.rerun()
 
+def painel_metricas():
+    with st.expander("Métricas do pipeline (este servidor)"):
+        resumo = registro_metricas.resumo_por_etapa()
+        if not resumo:
+            st.write("Nenhuma etapa medida ainda.")
+            return
+        st.dataframe(
+            [{
+                "Etapa": item["etapa"],
+                "Execuções": item["quantidade"],
+                "Erros": item["erros"],
+                "Tempo médio (s)": round(item["duracao_media"], 2),
+                "Tempo máx. (s)": round(item["duracao_max"], 2),
+                "MB": round(item["bytes"] / 2**20, 1),
+                "MB copiados": round(item["bytes_copiados"] / 2**20, 1),
+                "Tokens prompt": item["tokens_prompt"],
+                "Tokens resposta": item["tokens_resposta"],
+                "Retentativas": item["retentativas"],
+                "Espera limite (s)": round(item["espera_limite"], 1),
+                "Custo (US$)": round(item["custo_usd"], 4),
+            } for item in resumo],
+            hide_index=True
+        )
+        por_modelo = registro_metricas.resumo_por_modelo()
+        if por_modelo:
+            st.write("Chamadas de chat por modelo")
+            st.dataframe(
+                [{
+                    "Modelo": item["modelo"],
+                    "Chamadas": item["quantidade"],
+                    "Erros": item["erros"],
+                    "Tempo médio (s)": round(item["duracao_media"], 2),
+                    "Tempo p95 (s)": round(item["duracao_p95"], 2),
+                    "Primeiro token (s)": None if item["primeiro_token_medio"] is None
+                    else round(item["primeiro_token_medio"], 2),
+                    "Tokens prompt": item["tokens_prompt"],
+                    "Tokens resposta": item["tokens_resposta"],
+                    "Custo (US$)": round(item["custo_usd"], 4),
+                } for item in por_modelo],
+                hide_index=True
+            )
+        st.download_button(
+            "Baixar métricas (Prometheus)", registro_metricas.texto_prometheus(),
+            file_name="metricas.prom", mime="text/plain"
+        )
+
+@st.fragment
+def painel_busca():
+    with st.expander("Buscar em todas as aulas"):
+        consulta = st.text_input("O que você procura?", key="consulta_busca")
+        if not consulta.strip():
+            return
+        inicio = datetime.now()
+        resultados = obter_indice_busca(espaco).buscar(consulta, k=10)
+        decorrido = (datetime.now() - inicio).total_seconds()
+        st.caption(f"{len(resultados)} resultado(s) em {decorrido * 1000:.0f} ms")
+        for resultado in resultados:
+            local = resultado["secao"] or "transcrição"
+            if resultado["inicio"] is not None:
+                local += f" [{formatar_tempo(resultado['inicio'])}]"
+            trecho = resultado["texto"][:300] + ("..." if len(resultado["texto"]) > 300 else "")
+            st.markdown(f"**{resultado['titulo']}** · {local} · {resultado['pontuacao']:.2f}")
+            st.caption(trecho)
+
+PAGINAS = ("Gerar resumo", "Histórico")
+AULAS_POR_PAGINA_HISTORICO = 20
+
+def abrir_do_acervo(id_entrada):
+    # Callback do botão: roda antes do script, então ainda pode trocar a página do menu lateral
+    audio_info, chat = acervo.audio_info(id_entrada)
+    if audio_info is None:
+        return
+    st.session_state.audio_info = audio_info
+    st.session_state.last_output = audio_info["resumo"]
+    st.session_state.chat_history = chat or [{"role": "assistant", "content": audio_info["resumo"]}]
+    st.session_state.comparacao = None
+    st.session_state.pop("exportacao_acervo", None)
+    st.session_state.pagina = PAGINAS[0]
+
+def filtros_historico():
+    col_titulo, col_modelo, col_periodo = st.columns([3, 2, 2])
+    with col_titulo:
+        titulo = st.text_input("Título contém", key="filtro_titulo")
+    with col_modelo:
+        modelo = st.selectbox("Modelo", ["Todos", *[m for m in acervo.modelos() if m]], key="filtro_modelo")
+    with col_periodo:
+        periodo = st.date_input("Período", value=(), format="DD/MM/YYYY", key="filtro_periodo")
+    filtros = {"titulo": titulo.strip() or None, "modelo": None if modelo == "Todos" else modelo}
+    if len(periodo) >= 1:
+        filtros["desde"] = datetime.combine(periodo[0], datetime.min.time()).timestamp()
+        # O último dia entra inteiro
+        filtros["ate"] = datetime.combine(periodo[-1] + timedelta(days=1), datetime.min.time()).timestamp()
+    return filtros
+
+def pagina_historico():
+    st.title("Histórico")
+    filtros = filtros_historico()
+    total = acervo.contar(**filtros)
+    paginas = max(1, math.ceil(total / AULAS_POR_PAGINA_HISTORICO))
+    pagina = st.number_input("Página", 1, paginas, 1, key="pagina_historico") if paginas > 1 else 1
+    st.caption(f"{total} aula(s) no histórico")
+    # Só os metadados de uma página; resumo, transcrição e chat são lidos ao abrir
+    for item in acervo.listar(limite=AULAS_POR_PAGINA_HISTORICO, deslocamento=(pagina - 1) * AULAS_POR_PAGINA_HISTORICO,
+                              **filtros):
+        with st.container(border=True):
+            col_info, col_abrir = st.columns([6, 1])
+            with col_info:
+                data = datetime.fromtimestamp(item["criado_em"]).strftime("%d/%m/%Y %H:%M")
+                versao = f" (versão {item['versao']})" if item["versao"] > 1 else ""
+                st.markdown(f"**{item['titulo']}** · {item['modelo'] or 'modelo não informado'}{versao} · {data} · "
+                            f"{item['ajustes']} ajuste(s)")
+                st.caption(item["previa"] + ("..." if len(item["previa"]) >= TAMANHO_PREVIA else ""))
+            with col_abrir:
+                st.button("Abrir", key=f"abrir_{item['id']}", on_click=abrir_do_acervo, args=(item["id"],),
+                          disabled=bool(st.session_state.job_ativo))
+    if total:
+        if st.button(f"Exportar {total} aula(s) em JSON", key="exportar_acervo"):
+            st.session_state.exportacao_acervo = acervo.exportar_zip(**filtros)
+        if st.session_state.get("exportacao_acervo"):
+            st.download_button(
+                "Baixar ZIP", st.session_state.exportacao_acervo, file_name="resumos.zip", mime="application/zip"
+            )
+
+def sair():
+    # A sessão inteira: quem entrar depois no mesmo navegador não vê a aula aberta
+    st.session_state.clear()
+
 def main_screen():
-    process_pending_messages()
+    pagina = st.sidebar.radio("Página", PAGINAS, key="pagina")
+    if st.session_state.get("usuario"):
+        st.sidebar.caption(f"Usuário: {st.session_state.usuario}")
+    st.sidebar.button("Sair", on_click=sair)
+    if pagina == PAGINAS[1]:
+        pagina_historico()
+        return
     generate_interface()
+    painel_busca()
+    painel_metricas()
 
-if not st.session_state.logged_in:
-    login_screen()
-else:
-    main_screen()
+main_screen()
@@ -0,0 +1,88 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from segmentacao import TAXA_ANALISE, energias_em_blocos, planejar_cortes
+
+
+def gerar_fala_sintetica(caminho, minutos, semente=0, fracao_sem_pausa=0.1):
+    # "Fala": ruído modulado por sílabas de ~5 Hz com frases de 2 a 15 s; pausas de 0,3 a 1,5 s com ruído de fundo.
+    # Uma fração das frases vem sem pausa depois (fala corrida), para exercitar o corte forçado.
+    # Devolve os intervalos de silêncio reais, em segundos.
+    rng = np.random.default_rng(semente)
+    total = int(minutos * 60 * TAXA_ANALISE)
+    sinal = rng.normal(0, 30, total).astype(np.float32)  # piso de ruído (~ -60 dBFS)
+    silencios = []
+    posicao = 0
+    while posicao < total:
+        frase = int(rng.uniform(2, 15) * TAXA_ANALISE)
+        fim_frase = min(total, posicao + frase)
+        t = np.arange(fim_frase - posicao) / TAXA_ANALISE
+        envelope = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 6) * t)
+        sinal[posicao:fim_frase] += rng.normal(0, 3000, fim_frase - posicao) * envelope
+        posicao = fim_frase
+        if rng.random() < fracao_sem_pausa:
+            continue
+        pausa = int(rng.uniform(0.3, 1.5) * TAXA_ANALISE)
+        silencios.append((posicao / TAXA_ANALISE, min(total, posicao + pausa) / TAXA_ANALISE))
+        posicao += pausa
+    with wave.open(caminho, "wb") as arquivo:
+        arquivo.setnchannels(1)
+        arquivo.setsampwidth(2)
+        arquivo.setframerate(TAXA_ANALISE)
+        arquivo.writeframes(np.clip(sinal, -32768, 32767).astype(np.int16).tobytes())
+    return silencios
+
+
+def dentro_de_silencio(instante, silencios):
+    inicios = np.array([s[0] for s in silencios])
+    i = np.searchsorted(inicios, instante, side="right") - 1
+    return i >= 0 and instante <= silencios[i][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Velocidade da análise de energia e acerto dos cortes em pausas, em áudio sintético fala + silêncio."
+    )
+    parser.add_argument("--minutos", type=int, default=60)
+    parser.add_argument("--alvo", type=float, default=180, help="duração alvo de cada chunk em segundos")
+    parser.add_argument("--janela", type=float, default=20)
+    parser.add_argument("--fracao-sem-pausa", type=float, default=0.1, help="fração das frases emendadas na seguinte")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, "fala.wav")
+        print(f"Gerando {args.minutos} minutos de fala sintética...")
+        silencios = gerar_fala_sintetica(arquivo, args.minutos, fracao_sem_pausa=args.fracao_sem_pausa)
+
+        inicio = time.perf_counter()
+        quadros = sum(len(bloco) for bloco in energias_em_blocos(arquivo))
+        tempo_decodificacao = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        cortes = list(planejar_cortes(arquivo, args.alvo, args.janela))
+        tempo_total = time.perf_counter() - inicio
+
+    fronteiras = [(fim, forcado) for _, fim, forcado in cortes[:-1]]
+    em_pausa = sum(dentro_de_silencio(fim, silencios) for fim, _ in fronteiras)
+    forcados = sum(forcado for _, forcado in fronteiras)
+    fixos = np.arange(args.alvo, args.minutos * 60, args.alvo)
+    fixos_em_pausa = sum(dentro_de_silencio(t, silencios) for t in fixos)
+    duracoes = [fim - ini for ini, fim, _ in cortes]
+
+    print(f"quadros analisados: {quadros} ({args.minutos * 60 / tempo_total:,.0f}x tempo real)")
+    print(f"decodificação + energia: {tempo_decodificacao:.2f}s | com escolha dos cortes: {tempo_total:.2f}s")
+    print(f"chunks: {len(cortes)} (duração média {np.mean(duracoes):.1f}s, máx {max(duracoes):.1f}s)")
+    print(f"cortes em pausa real: {em_pausa}/{len(fronteiras)} | forçados (sem pausa na janela): {forcados}")
+    print(f"referência, cortes fixos a cada {args.alvo:.0f}s em pausa real: {fixos_em_pausa}/{len(fixos)}")
+
+
+if __name__ == "__main__":
+    main()
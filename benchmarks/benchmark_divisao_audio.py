@@ -0,0 +1,129 @@
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import imageio_ffmpeg
+import psutil
+
+
+def dividir_com_moviepy(arquivo_audio, pasta_destino, duracao_maxima=180):
+    # Implementação anterior de dividir_audio_em_chunks, mantida aqui só como referência
+    from moviepy.editor import AudioFileClip
+
+    audio = AudioFileClip(arquivo_audio)
+    duracao_total = audio.duration
+    for i in range(math.ceil(duracao_total / duracao_maxima)):
+        inicio = i * duracao_maxima
+        fim = min((i + 1) * duracao_maxima, duracao_total)
+        caminho = os.path.join(pasta_destino, f"temp_chunk_{i}.mp3")
+        audio.subclip(inicio, fim).write_audiofile(caminho, logger=None)
+        yield caminho
+    audio.close()
+
+
+def dividir_com_ffmpeg(arquivo_audio, pasta_destino):
+    from functions import dividir_audio_em_chunks
+
+    for caminho, _, _ in dividir_audio_em_chunks(arquivo_audio, pasta_destino=pasta_destino):
+        yield caminho
+
+
+def gerar_tom(caminho, minutos):
+    subprocess.run([
+        imageio_ffmpeg.get_ffmpeg_exe(), "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={minutos * 60}",
+        "-b:a", "128k", caminho,
+    ], check=True)
+
+
+class AmostradorRSS(threading.Thread):
+    # Amostra o RSS do processo e dos filhos (ffmpeg); ru_maxrss dos filhos não serve porque
+    # o fork herda o RSS do Python antes do exec
+    def __init__(self, intervalo=0.02):
+        super().__init__(daemon=True)
+        self.intervalo = intervalo
+        self.pico_python = 0
+        self.pico_total = 0
+        self._parar = threading.Event()
+
+    def run(self):
+        processo = psutil.Process()
+        while not self._parar.is_set():
+            try:
+                python = processo.memory_info().rss
+                filhos = sum(f.memory_info().rss for f in processo.children(recursive=True))
+            except psutil.Error:
+                continue
+            self.pico_python = max(self.pico_python, python)
+            self.pico_total = max(self.pico_total, python + filhos)
+            time.sleep(self.intervalo)
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+def executar(implementacao, arquivo_audio):
+    funcoes = {"moviepy": dividir_com_moviepy, "ffmpeg": dividir_com_ffmpeg}
+    amostrador = AmostradorRSS()
+    amostrador.start()
+    with tempfile.TemporaryDirectory() as pasta:
+        inicio = time.perf_counter()
+        primeiro = None
+        chunks = 0
+        for _ in funcoes[implementacao](arquivo_audio, pasta):
+            chunks += 1
+            primeiro = primeiro or time.perf_counter() - inicio
+        decorrido = time.perf_counter() - inicio
+    amostrador.parar()
+
+    print(json.dumps({
+        "implementacao": implementacao,
+        "chunks": chunks,
+        "tempo_total": decorrido,
+        "tempo_primeiro_chunk": primeiro,
+        "rss_pico_python_mb": amostrador.pico_python / 2**20,
+        "rss_pico_total_mb": amostrador.pico_total / 2**20,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara tempo e memória de pico da divisão de áudio (moviepy x ffmpeg segment).")
+    parser.add_argument("--minutos", type=int, default=60)
+    parser.add_argument("--executar", choices=["moviepy", "ffmpeg"], help=argparse.SUPPRESS)
+    parser.add_argument("--arquivo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        executar(args.executar, args.arquivo)
+        return
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, "tom.mp3")
+        print(f"Gerando tom de teste de {args.minutos} minutos...")
+        gerar_tom(arquivo, args.minutos)
+
+        # Cada implementação roda num processo próprio para o pico de RSS não se misturar
+        for implementacao in ("moviepy", "ffmpeg"):
+            saida = subprocess.run(
+                [sys.executable, __file__, "--executar", implementacao, "--arquivo", arquivo],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            r = json.loads(saida.strip().splitlines()[-1])
+            print(
+                f"{r['implementacao']:<8} chunks={r['chunks']:<3} total={r['tempo_total']:7.2f}s "
+                f"primeiro_chunk={r['tempo_primeiro_chunk']:6.2f}s "
+                f"rss_python={r['rss_pico_python_mb']:7.1f}MB rss_python+ffmpeg={r['rss_pico_total_mb']:7.1f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
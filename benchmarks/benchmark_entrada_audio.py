@@ -0,0 +1,63 @@
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import entrada_audio
+from entrada_audio import AudioEntrada
+from functions import transcrever_audio_indexado
+from metricas import registro
+from transport import ClienteResiliente
+from cliente_falso import ClienteOpenAIFalso
+
+
+def como_antes(dados, nome, client):
+    # O app antigo: upload inteiro gravado num temporário e sempre dividido pelo ffmpeg
+    descritor, caminho = tempfile.mkstemp(suffix=os.path.splitext(nome)[1])
+    with os.fdopen(descritor, "wb") as f:
+        f.write(dados)
+    limite = entrada_audio.LIMITE_ENVIO_DIRETO
+    entrada_audio.LIMITE_ENVIO_DIRETO = 0
+    try:
+        return transcrever_audio_indexado(caminho, client), len(dados)
+    finally:
+        entrada_audio.LIMITE_ENVIO_DIRETO = limite
+        os.remove(caminho)
+
+
+def com_entrada(dados, nome, client):
+    with AudioEntrada.de_upload(io.BytesIO(dados), nome) as entrada:
+        return transcrever_audio_indexado(entrada, client), entrada.bytes_copiados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes copiados e tempo até a transcrição, por caminho de upload.")
+    parser.add_argument("arquivos", nargs="+", help="Áudios de teste (um pequeno e um grande mostram os dois caminhos)")
+    parser.add_argument("--latencia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    client = ClienteResiliente(ClienteOpenAIFalso(latencia=args.latencia), espera_base=0.01)
+    for arquivo in args.arquivos:
+        with open(arquivo, "rb") as f:
+            dados = f.read()
+        print(f"{os.path.basename(arquivo)} ({len(dados) / 2**20:.1f} MB)")
+        for nome, funcao in (("antes", como_antes), ("AudioEntrada", com_entrada)):
+            registro.limpar()
+            inicio = time.perf_counter()
+            indice, copiados_upload = funcao(dados, os.path.basename(arquivo), client)
+            decorrido = time.perf_counter() - inicio
+            etapas = {item["etapa"]: item for item in registro.resumo_por_etapa()}
+            copiados_chunks = etapas.get("divisao_audio", {}).get("bytes_copiados", 0)
+            chamadas = etapas.get("transcricao_chunk", {}).get("quantidade", 0)
+            print(f"  {nome:<13} {decorrido:6.2f}s chamadas={chamadas} segmentos={len(indice)} "
+                  f"copiado: upload={copiados_upload / 2**20:.1f} MB chunks={copiados_chunks / 2**20:.1f} MB")
+    shutil.rmtree(os.path.join(tempfile.gettempdir(), "gerador-resumos"), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
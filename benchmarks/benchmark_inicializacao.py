@@ -0,0 +1,135 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Módulos pesados que a tela de login não deveria precisar carregar
+MODULOS_PESADOS = ("openai", "httpx", "numpy", "faiss", "imageio_ffmpeg", "moviepy", "zstandard", "tiktoken")
+
+CODIGO_IMPORTACAO = """
+import sys, time
+sys.path.insert(0, {raiz!r})
+inicio = time.perf_counter()
+import {modulos}
+decorrido = time.perf_counter() - inicio
+pesados = [m for m in {pesados!r} if m in sys.modules]
+print(f"{{decorrido:.4f}} {{','.join(pesados) or '-'}}")
+"""
+
+
+def medir_importacao(modulos, repeticoes):
+    # Cada repetição num processo novo: é o custo de um servidor Streamlit recém-iniciado
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, "-c", CODIGO_IMPORTACAO.format(raiz=RAIZ, modulos=modulos, pesados=MODULOS_PESADOS)],
+            capture_output=True, text=True, check=True, cwd=RAIZ,
+        ).stdout.split()
+        tempos.append(float(saida[0]))
+    return statistics.median(tempos), saida[1]
+
+
+CODIGO_INICIO_FRIO = """
+import sys, time
+sys.path.insert(0, {raiz!r})
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file({app!r}, default_timeout=60)
+app.secrets["openai"] = {{"api_key": "sk-falsa"}}
+app.secrets["credentials"] = {{"user": "u", "password": "p"}}
+inicio = time.perf_counter()
+app.run()
+decorrido = time.perf_counter() - inicio
+pesados = [m for m in {pesados!r} if m in sys.modules]
+print(f"{{decorrido:.4f}} {{','.join(pesados) or '-'}}")
+"""
+
+
+def medir_inicio_frio(repeticoes):
+    # Primeira execução do app2.py (tela de login) num processo com só o Streamlit carregado
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, "-c", CODIGO_INICIO_FRIO.format(raiz=RAIZ, app=os.path.join(RAIZ, "app2.py"),
+                                                             pesados=MODULOS_PESADOS)],
+            capture_output=True, text=True, check=True, cwd=RAIZ,
+            env={**os.environ, "GERADOR_CACHE_DIR": tempfile.mkdtemp(prefix="bench_cache_")},
+        ).stdout.split()
+        tempos.append(float(saida[0]))
+    return statistics.median(tempos), saida[1]
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+
+def medir_reruns(reruns, caracteres_transcricao):
+    # Tempo de cada rerun da tela principal com uma aula aberta (resumo, transcrição e chat na tela)
+    os.environ.setdefault("GERADOR_CACHE_DIR", tempfile.mkdtemp(prefix="bench_cache_"))
+    import functions
+    from cliente_falso import ClienteOpenAIFalso, RESPOSTA_RESUMO_FALSA
+    from streamlit.testing.v1 import AppTest, local_script_runner
+
+    # O servidor compila o script uma vez só; o AppTest recompilaria a cada run e esconderia o custo do app
+    script_cache = local_script_runner.ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+    functions.get_openai_client = lambda api_key: ClienteOpenAIFalso(latencia=0.0)
+    app = AppTest.from_file(os.path.join(RAIZ, "app2.py"), default_timeout=60)
+    app.secrets["openai"] = {"api_key": "sk-falsa"}
+    app.secrets["credentials"] = {"user": "u", "password": "p"}
+    app.run()
+    app.session_state.logged_in = True
+
+    resumo = dict(zip(
+        ("pontos_principais", "resumo_pratico", "perguntas_respostas", "exemplos_copy"),
+        (parte.split(":\n", 1)[-1] * 40 for parte in RESPOSTA_RESUMO_FALSA.split("\n\n"))
+    ))
+    frase = "O professor explica como escrever uma boa chamada para o lançamento. "
+    app.session_state.audio_info = {
+        "titulo": "aula", "resumo": resumo, "transcricao": frase * (caracteres_transcricao // len(frase)),
+        "data_criacao": "2025-01-01 00:00:00", "modelo_escolhido": "gpt-4o-mini",
+    }
+    app.session_state.last_output = resumo
+    app.session_state.chat_history = [{"role": "assistant", "content": resumo}] * 6
+    app.run()
+    tempos = []
+    for _ in range(reruns):
+        inicio = time.perf_counter()
+        app.run()
+        tempos.append(time.perf_counter() - inicio)
+    if app.exception:
+        raise SystemExit(f"O app falhou: {app.exception}")
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de importação (processo novo) e de rerun do app2.py.")
+    parser.add_argument("--repeticoes", type=int, default=5, help="processos novos por medição de importação")
+    parser.add_argument("--reruns", type=int, default=30)
+    parser.add_argument("--caracteres", type=int, default=300_000, help="tamanho da transcrição aberta na tela")
+    args = parser.parse_args()
+
+    print("Importação em processo novo (mediana):")
+    for rotulo, modulos in (
+        ("streamlit", "streamlit"),
+        ("módulos do app", "functions, cache, metricas, tokens, indice_transcricao, busca, entrada_audio, acervo, jobs"),
+    ):
+        tempo, pesados = medir_importacao(modulos, args.repeticoes)
+        print(f"  {rotulo:<16} {tempo * 1000:7.0f} ms  pesados carregados: {pesados}")
+
+    primeira, pesados = medir_inicio_frio(args.repeticoes)
+    print(f"Primeira execução do app2.py (tela de login): {primeira * 1000:.0f} ms  pesados carregados: {pesados}")
+    tempos = medir_reruns(args.reruns, args.caracteres)
+    print(f"Rerun da tela principal com aula aberta ({args.reruns}x, transcrição de {args.caracteres} caracteres): "
+          f"mediana={statistics.median(tempos) * 1000:.0f} ms p95={percentil(tempos, 0.95) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
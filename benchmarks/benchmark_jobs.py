@@ -0,0 +1,45 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import GerenciadorJobs, job_gerar_resumo
+from cliente_falso import ClienteOpenAIFalso
+
+
+def medir(workers, quantidade, latencia, pasta):
+    client = ClienteOpenAIFalso(latencia=latencia, latencia_token=0.0005)
+    # Um só dono submetendo tudo: sem as cotas por usuário, que limitariam a vazão medida
+    gerenciador = GerenciadorJobs(os.path.join(pasta, f"jobs_{workers}.sqlite3"), max_workers=workers,
+                                  max_por_usuario=0, max_fila_por_usuario=0)
+    audio_info = {"titulo": "aula", "transcricao": "Frase da aula. " * 200, "resumo": None,
+                  "data_criacao": "", "modelo_escolhido": None}
+    inicio = time.perf_counter()
+    ids = [gerenciador.submeter("resumo", job_gerar_resumo, audio_info, client, "gpt-4o-mini") for _ in range(quantidade)]
+    # A interface faz o mesmo: consulta o estado na tabela em vez de bloquear no futuro
+    estados = [gerenciador.aguardar(job_id, intervalo=0.02)["estado"] for job_id in ids]
+    decorrido = time.perf_counter() - inicio
+    gerenciador.encerrar()
+    if set(estados) != {"concluido"}:
+        raise SystemExit(f"Jobs terminaram com estados inesperados: {set(estados)}")
+    return decorrido
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão do GerenciadorJobs com um cliente OpenAI falso.")
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--latencia", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        for workers in args.workers:
+            decorrido = medir(workers, args.jobs, args.latencia, pasta)
+            print(f"workers={workers:<3} {args.jobs} jobs em {decorrido:6.2f}s -> {args.jobs / decorrido:6.2f} jobs/s")
+
+
+if __name__ == "__main__":
+    main()
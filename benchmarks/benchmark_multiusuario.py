@@ -0,0 +1,116 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import CotaExcedida, ESTADOS_ATIVOS, GerenciadorJobs, job_gerar_resumo
+from cliente_falso import ClienteOpenAIFalso
+
+AUDIO_INFO = {"titulo": "aula", "transcricao": "Frase da aula. " * 200, "resumo": None,
+              "data_criacao": "", "modelo_escolhido": None}
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))]
+
+
+def sessao_leve(gerenciador, client, dono, jobs, pausa, latencias):
+    # Uma pessoa usando o app: pede um resumo, espera o resultado, lê e pede outro
+    for _ in range(jobs):
+        inicio = time.perf_counter()
+        job_id = gerenciador.submeter("resumo", job_gerar_resumo, AUDIO_INFO, client, "gpt-4o-mini", dono=dono)
+        gerenciador.aguardar(job_id, intervalo=0.01)
+        latencias.append(time.perf_counter() - inicio)
+        time.sleep(pausa)
+
+
+def sessao_pesada(gerenciador, client, dono, lote, parar, contagem):
+    # Processamento em massa: tenta manter `lote` jobs seus pendentes até o fim da medição
+    pendentes = []
+    while not parar.is_set():
+        pendentes = [job_id for job_id in pendentes if gerenciador.obter(job_id)["estado"] in ESTADOS_ATIVOS]
+        if len(pendentes) >= lote:
+            time.sleep(0.02)
+            continue
+        try:
+            pendentes.append(
+                gerenciador.submeter("resumo", job_gerar_resumo, AUDIO_INFO, client, "gpt-4o-mini", dono=dono)
+            )
+            contagem["submetidos"] += 1
+        except CotaExcedida:
+            contagem["recusados"] += 1
+            time.sleep(0.05)
+    # O que ainda está na fila não entra na medição
+    for job_id in pendentes:
+        gerenciador.cancelar(job_id)
+
+
+def medir(modo, sessoes, args, pasta):
+    client = ClienteOpenAIFalso(latencia=args.latencia, latencia_token=0.0002)
+    # "fila única" reproduz o ThreadPoolExecutor de antes: um FIFO só, sem cota
+    justo = modo == "justo"
+    gerenciador = GerenciadorJobs(
+        os.path.join(pasta, f"jobs_{modo}_{sessoes}.sqlite3"), max_workers=args.workers,
+        max_por_usuario=args.por_usuario if justo else 0, max_fila_por_usuario=args.fila_por_usuario if justo else 0,
+    )
+    donos = (lambda nome: nome) if justo else (lambda nome: None)
+    parar = threading.Event()
+    contagem = {"submetidos": 0, "recusados": 0}
+    pesada = threading.Thread(target=sessao_pesada, args=(gerenciador, client, donos("lote"), args.lote, parar, contagem))
+    if args.pesado:
+        pesada.start()
+        time.sleep(0.2)
+    latencias = []
+    threads = [
+        threading.Thread(target=sessao_leve,
+                         args=(gerenciador, client, donos(f"usuario{i}"), args.jobs, args.pausa, latencias))
+        for i in range(sessoes)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    parar.set()
+    if args.pesado:
+        pesada.join()
+    gerenciador.encerrar()
+    return latencias, contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latência dos jobs de cada sessão à medida que o número de sessões cresce, com um usuário "
+                    "enchendo a fila ao mesmo tempo: fila única (antes) x fila justa por usuário com cotas."
+    )
+    parser.add_argument("--sessoes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--jobs", type=int, default=4, help="jobs pedidos por sessão")
+    parser.add_argument("--pausa", type=float, default=0.3, help="tempo entre o resultado e o próximo pedido")
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--por-usuario", type=int, default=2)
+    parser.add_argument("--fila-por-usuario", type=int, default=5)
+    parser.add_argument("--lote", type=int, default=30, help="jobs que o usuário pesado tenta manter na fila")
+    parser.add_argument("--sem-pesado", dest="pesado", action="store_false", help="sem o usuário que enche a fila")
+    args = parser.parse_args()
+
+    print(f"{args.workers} workers, latência {args.latencia:.2f}s por chamada, "
+          f"{'com' if args.pesado else 'sem'} um usuário enchendo a fila")
+    with tempfile.TemporaryDirectory() as pasta:
+        for sessoes in args.sessoes:
+            for modo in ("fila única", "justo"):
+                latencias, contagem = medir(modo, sessoes, args, pasta)
+                print(
+                    f"sessões={sessoes:<3} {modo:<10} p50={statistics.median(latencias):6.2f}s "
+                    f"p95={percentil(latencias, 0.95):6.2f}s máx={max(latencias):6.2f}s "
+                    f"lote: {contagem['submetidos']} aceitos, {contagem['recusados']} recusados"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import psutil
+
+from cache import PASTA_CACHE_PADRAO
+from segmentacao import caminho_ffmpeg
+from transport import LIMITES_ENDPOINTS
+
+# nome: (minutos de áudio, turnos de ajuste no chat)
+CENARIOS = {
+    "1min": (1, 1),
+    "30min": (30, 5),
+    "3h": (180, 20),
+}
+BASELINE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_pipeline.json")
+PASTA_FIXTURES = os.path.join(PASTA_CACHE_PADRAO, "fixtures_benchmark")
+# MP3 mono de 32 kbps, como os chunks recodificados; o cliente falso estima a duração pelo tamanho
+BITRATE_FIXTURE = 32000
+INSTRUCOES_AJUSTE = (
+    "Deixe os pontos principais mais curtos",
+    "Acrescente mais uma pergunta sobre objeções",
+    "Reescreva as copies com um tom mais direto",
+    "Inclua no resumo prático o exemplo da página de vendas",
+    "Ajuste tudo para um público iniciante",
+)
+# Métricas comparadas com a baseline: (campo, maior é pior, folga absoluta)
+METRICAS_COMPARADAS = (
+    ("tempo_transcricao", True, 0.05),
+    ("tempo_resumo", True, 0.05),
+    ("ajuste_p50", True, 0.02),
+    ("ajuste_p95", True, 0.02),
+    ("chunk_p95", True, 0.02),
+    ("vazao_tempo_real", False, 0.0),
+    ("rss_pico_mb", True, 10.0),
+    ("disco_pico_mb", True, 1.0),
+)
+# Resultados que não dependem da máquina: qualquer diferença é mudança de comportamento
+CAMPOS_DETERMINISTICOS = ("chunks", "chamadas_api", "caracteres_transcricao", "impressao_transcricao", "impressao_resumo")
+
+
+def gerar_fixture(pasta, minutos):
+    # "Fala" de ruído rosa com pausas irregulares (soma de duas senoides) para a análise de silêncio ter onde cortar.
+    # Gerada uma vez por duração e reaproveitada entre execuções
+    caminho = os.path.join(pasta, f"fala_{minutos}min.mp3")
+    if os.path.exists(caminho):
+        return caminho
+    os.makedirs(pasta, exist_ok=True)
+    temporario = caminho + ".tmp.mp3"
+    subprocess.run([
+        caminho_ffmpeg(), "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-f", "lavfi", "-i", f"anoisesrc=d={minutos * 60}:c=pink:r=16000:a=0.3:seed=7",
+        "-af", "volume='if(gt(sin(2*PI*t/9)+0.6*sin(2*PI*t/4.1),-0.9),1,0.01)':eval=frame",
+        "-ac", "1", "-c:a", "libmp3lame", "-b:a", f"{BITRATE_FIXTURE // 1000}k", temporario,
+    ], check=True)
+    os.replace(temporario, caminho)
+    return caminho
+
+
+def tamanho_pasta(pasta):
+    total = 0
+    for raiz, _, arquivos in os.walk(pasta):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except OSError:
+                pass
+    return total
+
+
+class AmostradorRecursos(threading.Thread):
+    # Pico de RSS (Python + ffmpeg) e de espaço ocupado na pasta temporária do processo
+    def __init__(self, pasta_temporaria, intervalo=0.02):
+        super().__init__(daemon=True)
+        self.pasta_temporaria = pasta_temporaria
+        self.intervalo = intervalo
+        self.pico_rss = 0
+        self.pico_disco = 0
+        self._parar = threading.Event()
+
+    def run(self):
+        processo = psutil.Process()
+        while not self._parar.is_set():
+            try:
+                rss = processo.memory_info().rss + sum(f.memory_info().rss for f in processo.children(recursive=True))
+                self.pico_rss = max(self.pico_rss, rss)
+            except psutil.Error:
+                pass
+            self.pico_disco = max(self.pico_disco, tamanho_pasta(self.pasta_temporaria))
+            time.sleep(self.intervalo)
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p * len(valores)))] if valores else 0.0
+
+
+def impressao(dados):
+    return hashlib.sha256(json.dumps(dados, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def executar_cenario(arquivo, ajustes, modelo, latencia, latencia_token, respostas):
+    # Roda no processo filho, com GERADOR_CACHE_DIR e TMPDIR vazios: transcrição, resumo e ajustes como nos jobs do app
+    from cache import CacheResumos, CacheTranscricoes
+    from entrada_audio import AudioEntrada
+    from jobs import job_ajustar_resumo, job_gerar_resumo, job_transcrever
+    from metricas import registro
+    from segmentacao import duracao_audio
+    from transport import ClienteResiliente
+    from cliente_falso import ClienteOpenAIFalso
+
+    opcoes = {"latencia": latencia, "latencia_token": latencia_token, "bytes_por_segundo": BITRATE_FIXTURE / 8}
+    falso = ClienteOpenAIFalso.de_gravacao(respostas, **opcoes) if respostas else ClienteOpenAIFalso(**opcoes)
+    client = ClienteResiliente(falso, espera_base=0.01)
+    atualizar = lambda **kwargs: None
+
+    amostrador = AmostradorRecursos(tempfile.gettempdir())
+    amostrador.start()
+    inicio = time.perf_counter()
+    audio_info = job_transcrever(AudioEntrada.de_caminho(arquivo), "aula", client, atualizar,
+                                 cache=CacheTranscricoes())
+    tempo_transcricao = time.perf_counter() - inicio
+
+    inicio_resumo = time.perf_counter()
+    audio_info = job_gerar_resumo(audio_info, client, modelo, atualizar, cache=CacheResumos())["audio_info"]
+    tempo_resumo = time.perf_counter() - inicio_resumo
+
+    historico = [{"role": "assistant", "content": audio_info["resumo"]}]
+    tempos_ajuste = []
+    for turno in range(ajustes):
+        historico = historico + [{"role": "user", "content": INSTRUCOES_AJUSTE[turno % len(INSTRUCOES_AJUSTE)]}]
+        inicio_ajuste = time.perf_counter()
+        resultado = job_ajustar_resumo(historico, audio_info, client, atualizar)
+        tempos_ajuste.append(time.perf_counter() - inicio_ajuste)
+        historico, audio_info = resultado["chat_history"], resultado["audio_info"]
+    tempo_total = time.perf_counter() - inicio
+    amostrador.parar()
+
+    duracao = duracao_audio(arquivo)
+    chunks = [span["duracao"] for span in registro.spans if span["etapa"] == "transcricao_chunk"]
+    return {
+        "duracao_audio": duracao,
+        "tempo_transcricao": tempo_transcricao,
+        "tempo_resumo": tempo_resumo,
+        "tempo_total": tempo_total,
+        "vazao_tempo_real": duracao / tempo_total,
+        "ajuste_p50": statistics.median(tempos_ajuste) if tempos_ajuste else 0.0,
+        "ajuste_p95": percentil(tempos_ajuste, 0.95),
+        "chunk_p50": statistics.median(chunks) if chunks else 0.0,
+        "chunk_p95": percentil(chunks, 0.95),
+        "rss_pico_mb": amostrador.pico_rss / 2**20,
+        "disco_pico_mb": amostrador.pico_disco / 2**20,
+        "chunks": len(chunks),
+        "chamadas_api": falso.chamadas,
+        "caracteres_transcricao": len(audio_info["transcricao"]),
+        "impressao_transcricao": impressao(audio_info["transcricao"]),
+        "impressao_resumo": impressao(audio_info["resumo"]),
+    }
+
+
+def rodar_em_processo(nome, arquivo, args):
+    # Processo novo por cenário: o pico de RSS de um não contamina o outro, e nenhum cache é reaproveitado
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as pasta:
+        temporaria = os.path.join(pasta, "tmp")
+        os.makedirs(temporaria)
+        env = {**os.environ, "GERADOR_CACHE_DIR": os.path.join(pasta, "cache"), "TMPDIR": temporaria}
+        env.pop("GERADOR_METRICAS_JSONL", None)
+        env.pop("GERADOR_METRICAS_PROM", None)
+        if args.sem_limite_taxa:
+            env.update({f"GERADOR_{chave.upper()}_{endpoint.upper()}": "0"
+                        for endpoint, limites in LIMITES_ENDPOINTS.items() for chave in limites})
+        comando = [sys.executable, __file__, "--executar", nome, "--arquivo", arquivo, "--modelo", args.modelo,
+                   "--latencia", str(args.latencia), "--latencia-token", str(args.latencia_token)]
+        if args.respostas:
+            comando += ["--respostas", os.path.abspath(args.respostas)]
+        processo = subprocess.run(comando, capture_output=True, text=True, env=env)
+    if processo.returncode != 0:
+        raise SystemExit(f"O cenário {nome} falhou:\n{processo.stderr}")
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    resultado["configuracao"] = configuracao(args)
+    return resultado
+
+
+def configuracao(args):
+    # Resultados com outra configuração não são comparáveis
+    return {"latencia": args.latencia, "latencia_token": args.latencia_token, "modelo": args.modelo,
+            "respostas": os.path.basename(args.respostas) if args.respostas else None,
+            "limite_taxa": not args.sem_limite_taxa}
+
+
+def comparar(nome, resultado, baseline, tolerancia):
+    if baseline.get("configuracao") != resultado["configuracao"]:
+        print(f"{nome}: configuração diferente da baseline ({baseline.get('configuracao')}); comparação ignorada")
+        return []
+    problemas = []
+    for campo in CAMPOS_DETERMINISTICOS:
+        if campo in baseline and resultado[campo] != baseline[campo]:
+            problemas.append(f"{nome}: {campo} mudou ({baseline[campo]} -> {resultado[campo]})")
+    for campo, maior_e_pior, folga in METRICAS_COMPARADAS:
+        if campo not in baseline:
+            continue
+        anterior, atual = baseline[campo], resultado[campo]
+        if maior_e_pior and atual > anterior * (1 + tolerancia) + folga:
+            problemas.append(f"{nome}: {campo} piorou ({anterior:.3f} -> {atual:.3f})")
+        if not maior_e_pior and atual < anterior * (1 - tolerancia) - folga:
+            problemas.append(f"{nome}: {campo} piorou ({anterior:.3f} -> {atual:.3f})")
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pipeline completo (transcrição, resumo e ajustes) com cliente OpenAI falso e áudio sintético, "
+                    "comparado com uma baseline gravada."
+    )
+    parser.add_argument("--cenarios", nargs="+", choices=list(CENARIOS), default=list(CENARIOS))
+    parser.add_argument("--latencia", type=float, default=0.2, help="latência de cada chamada falsa, em segundos")
+    parser.add_argument("--latencia-token", type=float, default=0.0005)
+    parser.add_argument("--modelo", default="gpt-4o-mini")
+    parser.add_argument("--sem-limite-taxa", action="store_true",
+                        help="desliga os limites de RPM/TPM do transporte (por padrão os do tier 1, como no app)")
+    parser.add_argument("--respostas", help='JSON com respostas gravadas: {"chat": [...], "notas": [...]}')
+    parser.add_argument("--fixtures", default=PASTA_FIXTURES, help="pasta dos áudios sintéticos (gerados uma vez)")
+    parser.add_argument("--baseline", default=BASELINE_PADRAO)
+    parser.add_argument("--salvar-baseline", action="store_true", help="grava os resultados como a nova baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="piora relativa aceita nas métricas de tempo e memória")
+    parser.add_argument("--executar", choices=list(CENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--arquivo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        resultado = executar_cenario(args.arquivo, CENARIOS[args.executar][1], args.modelo, args.latencia,
+                                     args.latencia_token, args.respostas)
+        print(json.dumps(resultado))
+        return
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    resultados = {}
+    problemas = []
+    for nome in args.cenarios:
+        minutos, ajustes = CENARIOS[nome]
+        arquivo = gerar_fixture(args.fixtures, minutos)
+        r = resultados[nome] = rodar_em_processo(nome, arquivo, args)
+        print(
+            f"{nome:<6} {ajustes:>2} ajuste(s) total={r['tempo_total']:6.2f}s ({r['vazao_tempo_real']:6.0f}x tempo real) "
+            f"transcrição={r['tempo_transcricao']:6.2f}s chunks={r['chunks']} "
+            f"chunk p50/p95={r['chunk_p50'] * 1000:.0f}/{r['chunk_p95'] * 1000:.0f}ms "
+            f"resumo={r['tempo_resumo']:5.2f}s ajuste p50/p95={r['ajuste_p50'] * 1000:.0f}/{r['ajuste_p95'] * 1000:.0f}ms "
+            f"rss={r['rss_pico_mb']:.0f}MB disco={r['disco_pico_mb']:.1f}MB chamadas={r['chamadas_api']}"
+        )
+        if nome in baseline and not args.salvar_baseline:
+            problemas += comparar(nome, r, baseline[nome], args.tolerancia)
+
+    if args.salvar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **resultados}, f, indent=2, ensure_ascii=False)
+        print(f"Baseline gravada em {args.baseline}")
+    elif not baseline:
+        print(f"Sem baseline em {args.baseline}; rode com --salvar-baseline para criar uma")
+    if problemas:
+        print("\n".join(problemas))
+        raise SystemExit(f"{len(problemas)} regressão(ões) em relação à baseline")
+
+
+if __name__ == "__main__":
+    main()
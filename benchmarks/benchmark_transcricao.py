@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import transcrever_chunks
+from transport import ClienteResiliente
+from cliente_falso import ClienteOpenAIFalso
+
+
+def criar_chunks_falsos(pasta, quantidade):
+    caminhos = []
+    for i in range(quantidade):
+        caminho = os.path.join(pasta, f"chunk_{i:03d}.mp3")
+        with open(caminho, "wb") as f:
+            f.write(b"\0" * 1024)
+        caminhos.append(caminho)
+    return caminhos
+
+
+def medir(chunks, workers, latencia, falhar_a_cada):
+    client = ClienteOpenAIFalso(latencia=latencia, falhar_a_cada=falhar_a_cada)
+    inicio = time.perf_counter()
+    # Retentativas rápidas para o benchmark não ser dominado pelo backoff
+    texto = transcrever_chunks(chunks, ClienteResiliente(client, espera_base=0.01), max_workers=workers)
+    decorrido = time.perf_counter() - inicio
+
+    # O cliente falso devolve dois segmentos por chunk
+    esperado = " ".join(
+        f"início da transcrição de {os.path.basename(c)} fim da transcrição de {os.path.basename(c)}" for c in chunks
+    )
+    if texto != esperado:
+        raise SystemExit(f"Ordem dos chunks incorreta com {workers} workers")
+    return decorrido, client
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a transcrição sequencial com a paralela usando um cliente falso.")
+    parser.add_argument("--chunks", type=int, default=40)
+    parser.add_argument("--latencia", type=float, default=0.25)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--falhar-a-cada", type=int, default=7, help="injeta um 429 a cada N chamadas (0 desliga)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        chunks = criar_chunks_falsos(pasta, args.chunks)
+        base = None
+        print(f"{args.chunks} chunks, latência {args.latencia:.2f}s por chamada, 429 a cada {args.falhar_a_cada or '-'} chamadas")
+        for workers in args.workers:
+            decorrido, client = medir(chunks, workers, args.latencia, args.falhar_a_cada)
+            base = base or decorrido
+            print(
+                f"workers={workers:<3} tempo={decorrido:6.2f}s speedup={base / decorrido:5.2f}x "
+                f"chamadas={client.chamadas} pico_simultaneas={client.pico_simultaneas}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import OpenAI
+
+from metricas import registro
+from transport import ClienteResiliente, CircuitoAberto, criar_cliente_http
+from servidor_openai_falso import ServidorOpenAIFalso
+
+MENSAGENS = [{"role": "user", "content": "Resuma a aula. " * 50}]
+
+
+def cliente_sdk(servidor, pool=True):
+    # Como o app era antes: SDK sem retentativas próprias e, sem pool, um cliente HTTP novo por chamada
+    return OpenAI(api_key="sk-falsa", base_url=servidor.url, max_retries=0,
+                  http_client=criar_cliente_http() if pool else None)
+
+
+def disparar(client, pedidos, threads, stream=False):
+    def chamar(_):
+        inicio = time.perf_counter()
+        try:
+            resposta = client.chat.completions.create(
+                model="gpt-4o-mini", messages=MENSAGENS, max_tokens=500, stream=stream,
+                **({"stream_options": {"include_usage": True}} if stream else {})
+            )
+            if stream:
+                texto = "".join(p.choices[0].delta.content or "" for p in resposta if p.choices)
+            else:
+                texto = resposta.choices[0].message.content
+            return "ok" if texto.startswith("1)") else "incompleto", time.perf_counter() - inicio
+        except CircuitoAberto:
+            return "circuito_aberto", time.perf_counter() - inicio
+        except Exception as e:
+            return f"erro {getattr(e, 'status_code', type(e).__name__)}", time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        resultados = list(pool.map(chamar, range(pedidos)))
+    return resultados, time.perf_counter() - inicio
+
+
+def relatar(nome, servidor, resultados, decorrido):
+    contagem = {}
+    for estado, _ in resultados:
+        contagem[estado] = contagem.get(estado, 0) + 1
+    duracoes = sorted(d for _, d in resultados)
+    p95 = duracoes[min(len(duracoes) - 1, int(0.95 * len(duracoes)))]
+    print(f"  {nome:<22} {decorrido:6.2f}s p95={p95:5.2f}s resultados={contagem} "
+          f"servidor: pedidos={servidor.pedidos} respostas={servidor.respostas} conexões={servidor.conexoes}")
+
+
+def cenario(titulo, pedidos, threads, configuracao, limites=None, stream=False):
+    print(titulo)
+    for nome in ("SDK puro", "transporte"):
+        servidor = ServidorOpenAIFalso(**configuracao).iniciar()
+        registro.limpar()
+        if nome == "SDK puro":
+            client = cliente_sdk(servidor)
+        else:
+            client = ClienteResiliente(cliente_sdk(servidor), limites=limites, espera_base=0.05)
+        resultados, decorrido = disparar(client, pedidos, threads, stream=stream)
+        relatar(nome, servidor, resultados, decorrido)
+        retentativas = [s for s in registro.spans if s["etapa"] == "retentativa_api"]
+        esperas = sum(s["duracao"] for s in registro.spans if s["etapa"] == "espera_limite_api")
+        if nome == "transporte":
+            print(f"  {'':<22} retentativas={len(retentativas)} espera no limite de taxa (soma das threads)={esperas:.1f}s")
+        servidor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SDK puro x transport.py contra um servidor falso com 429 e quedas.")
+    parser.add_argument("--pedidos", type=int, default=60)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latencia", type=float, default=0.05)
+    args = parser.parse_args()
+    sem_limite = {"chat": {"rpm": 0, "tpm": 0}}
+
+    cenario(f"1) 429 a cada 5 pedidos, Retry-After 1s ({args.pedidos} pedidos, {args.threads} threads)",
+            args.pedidos, args.threads, {"latencia": args.latencia, "falhar_a_cada": 5}, sem_limite)
+    cenario("1b) o mesmo com stream", args.pedidos, args.threads,
+            {"latencia": args.latencia, "falhar_a_cada": 5}, sem_limite, stream=True)
+    rpm = args.pedidos * 4
+    cenario(f"2) servidor limitado a {rpm} RPM, {rpm + rpm // 6} pedidos; transporte configurado com o mesmo limite",
+            rpm + rpm // 6, args.threads, {"latencia": args.latencia, "limite_rpm": rpm},
+            {"chat": {"rpm": rpm, "tpm": 0}})
+    cenario("3) 503 em 30% dos pedidos", args.pedidos, args.threads,
+            {"latencia": args.latencia, "taxa_erro_500": 0.3}, sem_limite)
+
+    print("4) API fora do ar: o circuito abre e os pedidos seguintes falham na hora")
+    servidor = ServidorOpenAIFalso(latencia=args.latencia).iniciar()
+    servidor.fora_do_ar = True
+    client = ClienteResiliente(cliente_sdk(servidor), limites=sem_limite, espera_base=0.05)
+    resultados, decorrido = disparar(client, args.pedidos, args.threads)
+    relatar("transporte", servidor, resultados, decorrido)
+    print(f"  {'':<22} estado dos circuitos: {client.estado()}")
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+
+class ErroAPIFalso(Exception):
+    def __init__(self, status_code, mensagem=""):
+        super().__init__(mensagem or f"Erro {status_code}")
+        self.status_code = status_code
+
+
+class _TranscricoesFalsas:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def create(self, model, file, language=None, response_format="json", **kwargs):
+        # Como no SDK, `file` pode ser o arquivo aberto ou a tupla (nome, arquivo)
+        nome = file[0] if isinstance(file, tuple) else getattr(file, "name", "audio")
+
+        def responder():
+            if self._cliente.bytes_por_segundo:
+                return self._cliente.transcricao_sintetica(nome, _tamanho_arquivo(file), response_format)
+            texto = f"transcrição de {os.path.basename(nome)}"
+            if response_format != "verbose_json":
+                return SimpleNamespace(text=texto)
+            # Dois segmentos fixos por chunk, para exercitar o deslocamento dos tempos
+            segmentos = [SimpleNamespace(start=0.0, end=4.0, text="início da " + texto),
+                         SimpleNamespace(start=4.0, end=8.0, text="fim da " + texto)]
+            return SimpleNamespace(text=" ".join(s.text for s in segmentos), segments=segmentos, duration=8.0)
+        return self._cliente._registrar_chamada("transcricao", responder)
+
+
+def _tamanho_arquivo(file):
+    arquivo = file[1] if isinstance(file, tuple) else file
+    posicao = arquivo.tell()
+    tamanho = arquivo.seek(0, os.SEEK_END)
+    arquivo.seek(posicao)
+    return tamanho
+
+
+PALAVRAS_SINTETICAS = (
+    "copy", "venda", "cliente", "oferta", "gatilho", "headline", "lançamento", "lista", "email", "página",
+    "promessa", "prova", "escassez", "história", "público", "dor", "desejo", "objeção", "garantia", "chamada",
+    "então", "aqui", "vocês", "sempre", "quando", "porque", "exemplo", "primeiro", "depois", "resultado",
+)
+
+
+class ClienteOpenAIFalso:
+    # Imita a superfície do cliente OpenAI usada em functions.py, com latência artificial
+    # e falhas 429 injetadas a cada `falhar_a_cada` chamadas.
+    # Com `bytes_por_segundo`, a transcrição tem o tamanho do áudio enviado (duração estimada pelo tamanho do
+    # arquivo, `palavras_por_segundo` de fala), sempre igual para o mesmo chunk. `respostas` repete, em ordem,
+    # respostas gravadas: {"chat": [...], "notas": [...]} (ver de_gravacao).
+    def __init__(self, latencia=0.5, falhar_a_cada=0, latencia_token=0.0, bytes_por_segundo=None,
+                 palavras_por_segundo=2.5, respostas=None):
+        self.latencia = latencia
+        self.latencia_token = latencia_token
+        self.falhar_a_cada = falhar_a_cada
+        self.bytes_por_segundo = bytes_por_segundo
+        self.palavras_por_segundo = palavras_por_segundo
+        self.respostas = respostas or {}
+        self._proxima_resposta = {}
+        self.chamadas = 0
+        self.simultaneas = 0
+        self.pico_simultaneas = 0
+        self._lock = threading.Lock()
+        self.audio = SimpleNamespace(transcriptions=_TranscricoesFalsas(self))
+        self.chat = SimpleNamespace(completions=_CompletionsFalsas(self))
+        self.prompts = []
+
+    @classmethod
+    def de_gravacao(cls, caminho, **kwargs):
+        with open(caminho, encoding="utf-8") as f:
+            return cls(respostas=json.load(f), **kwargs)
+
+    def _resposta_gravada(self, tipo, padrao):
+        respostas = self.respostas.get(tipo)
+        if not respostas:
+            return padrao
+        with self._lock:
+            indice = self._proxima_resposta.get(tipo, 0)
+            self._proxima_resposta[tipo] = indice + 1
+        return respostas[indice % len(respostas)]
+
+    def responder_chat(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+        if prompt.lstrip().startswith("Você está lendo o trecho"):
+            return self._resposta_gravada("notas", "- anotação falsa do trecho")
+        return self._resposta_gravada("chat", RESPOSTA_RESUMO_FALSA)
+
+    def transcricao_sintetica(self, nome, tamanho, response_format):
+        # Segmentos de ~8 s de palavras sorteadas com semente fixa (nome e tamanho do chunk)
+        duracao = tamanho / self.bytes_por_segundo
+        sorteio = random.Random(f"{os.path.basename(nome)}:{tamanho}")
+        segmentos = []
+        inicio = 0.0
+        while inicio < duracao:
+            fim = min(duracao, inicio + 8.0)
+            palavras = max(1, round((fim - inicio) * self.palavras_por_segundo))
+            texto = " ".join(sorteio.choice(PALAVRAS_SINTETICAS) for _ in range(palavras)) + "."
+            segmentos.append(SimpleNamespace(start=inicio, end=fim, text=texto))
+            inicio = fim
+        texto = " ".join(s.text for s in segmentos)
+        if response_format != "verbose_json":
+            return SimpleNamespace(text=texto)
+        return SimpleNamespace(text=texto, segments=segmentos, duration=duracao)
+
+    def _registrar_chamada(self, tipo, resposta):
+        with self._lock:
+            self.chamadas += 1
+            numero = self.chamadas
+            self.simultaneas += 1
+            self.pico_simultaneas = max(self.pico_simultaneas, self.simultaneas)
+        try:
+            time.sleep(self.latencia)
+            if self.falhar_a_cada and numero % self.falhar_a_cada == 0:
+                raise ErroAPIFalso(429, "Rate limit (falso)")
+            return resposta()
+        finally:
+            with self._lock:
+                self.simultaneas -= 1
+
+
+RESPOSTA_RESUMO_FALSA = """1) Pontos principais em formato de tópicos detalhados:
+- Ponto falso gerado offline.
+
+2) Resumo prático e completo da transcrição:
+Resumo falso gerado offline.
+
+3) Perguntas e respostas baseadas no texto:
+P: Isso é falso? R: Sim.
+
+4) Exemplos de copy:
+Copy falsa gerada offline."""
+
+
+class _CompletionsFalsas:
+    def __init__(self, cliente):
+        self._cliente = cliente
+
+    def create(self, model, messages, stream=False, **kwargs):
+        prompt = messages[-1]["content"]
+        conteudo = self._cliente.responder_chat(prompt)
+        if stream:
+            return self._cliente._registrar_chamada("chat", lambda: self._transmitir(conteudo))
+        return self._cliente._registrar_chamada("chat", lambda: SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=conteudo))],
+            usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(conteudo) // 4),
+        ))
+
+    def _transmitir(self, conteudo, tamanho_pedaco=8):
+        # A latência da chamada vira o tempo até o primeiro token; os pedaços seguintes têm latencia_token
+        for i in range(0, len(conteudo), tamanho_pedaco):
+            time.sleep(self._cliente.latencia_token)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=conteudo[i:i + tamanho_pedaco]))])
+        # Como a API com stream_options={"include_usage": True}: um último pedaço só com o uso
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=0, completion_tokens=len(conteudo) // 4))
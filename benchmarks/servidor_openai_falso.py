@@ -0,0 +1,179 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cliente_falso import RESPOSTA_RESUMO_FALSA
+
+
+class ServidorOpenAIFalso(ThreadingHTTPServer):
+    # Servidor HTTP local com as rotas da OpenAI usadas pelo app (chat com e sem stream, transcrição,
+    # embeddings), para exercitar o SDK de verdade e o transporte. Injeta latência, 429 com Retry-After
+    # (a cada `falhar_a_cada` pedidos ou acima de `limite_rpm`) e 503 com probabilidade `taxa_erro_500`.
+    daemon_threads = True
+
+    def __init__(self, porta=0, latencia=0.05, falhar_a_cada=0, retry_after=1.0, taxa_erro_500=0.0,
+                 limite_rpm=0, latencia_token=0.0, semente=0):
+        super().__init__(("127.0.0.1", porta), _Tratador)
+        self.latencia = latencia
+        self.falhar_a_cada = falhar_a_cada
+        self.retry_after = retry_after
+        self.taxa_erro_500 = taxa_erro_500
+        self.limite_rpm = limite_rpm
+        self.latencia_token = latencia_token
+        self.fora_do_ar = False
+        self._aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        # Como na OpenAI, o limite por minuto é reabastecido continuamente
+        self._saldo_rpm = float(limite_rpm)
+        self._atualizado = time.monotonic()
+        self.pedidos = 0
+        self.respostas = {}
+        self.simultaneos = 0
+        self.pico_simultaneos = 0
+        self.conexoes = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.conexoes += 1
+        super().process_request(request, client_address)
+
+    def decidir(self):
+        # Devolve (status, retry_after) para o próximo pedido
+        with self._lock:
+            self.pedidos += 1
+            agora = time.monotonic()
+            if self.limite_rpm:
+                self._saldo_rpm = min(self.limite_rpm, self._saldo_rpm + (agora - self._atualizado) * self.limite_rpm / 60)
+                self._atualizado = agora
+            if self.fora_do_ar:
+                return 503, None
+            if self.falhar_a_cada and self.pedidos % self.falhar_a_cada == 0:
+                return 429, self.retry_after
+            if self.limite_rpm:
+                if self._saldo_rpm < 1:
+                    return 429, (1 - self._saldo_rpm) * 60 / self.limite_rpm
+                self._saldo_rpm -= 1
+            if self._aleatorio.random() < self.taxa_erro_500:
+                return 503, None
+            return 200, None
+
+    def contar(self, status, delta_simultaneos=0):
+        with self._lock:
+            if status is not None:
+                self.respostas[status] = self.respostas.get(status, 0) + 1
+            self.simultaneos += delta_simultaneos
+            self.pico_simultaneos = max(self.pico_simultaneos, self.simultaneos)
+
+
+class _Tratador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_POST(self):
+        servidor = self.server
+        corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        servidor.contar(None, +1)
+        try:
+            time.sleep(servidor.latencia)
+            status, espera = servidor.decidir()
+            servidor.contar(status)
+            if status == 429:
+                return self._json(429, {"error": {"message": "Rate limit (falso)", "type": "requests", "code": "rate_limit_exceeded"}},
+                                  {"retry-after": f"{max(1, round(espera))}", "retry-after-ms": f"{espera * 1000:.0f}"})
+            if status != 200:
+                return self._json(status, {"error": {"message": "Indisponível (falso)", "type": "server_error"}})
+            if self.path.endswith("/chat/completions"):
+                return self._chat(json.loads(corpo))
+            if self.path.endswith("/audio/transcriptions"):
+                return self._transcricao()
+            if self.path.endswith("/embeddings"):
+                return self._embeddings(json.loads(corpo))
+            return self._json(404, {"error": {"message": f"Rota desconhecida: {self.path}"}})
+        finally:
+            servidor.contar(None, -1)
+
+    def _chat(self, pedido):
+        conteudo = RESPOSTA_RESUMO_FALSA
+        uso = {"prompt_tokens": sum(len(m.get("content") or "") for m in pedido["messages"]) // 4,
+               "completion_tokens": len(conteudo) // 4}
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        base = {"id": "chatcmpl-falso", "created": int(time.time()), "model": pedido["model"]}
+        if not pedido.get("stream"):
+            return self._json(200, {**base, "object": "chat.completion", "usage": uso, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": conteudo}}
+            ]})
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def enviar(dados):
+            evento = f"data: {dados}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(evento):x}\r\n".encode("ascii") + evento + b"\r\n")
+
+        for i in range(0, len(conteudo), 16):
+            time.sleep(self.server.latencia_token)
+            enviar(json.dumps({**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "finish_reason": None, "delta": {"content": conteudo[i:i + 16]}}
+            ]}))
+        if (pedido.get("stream_options") or {}).get("include_usage"):
+            enviar(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": uso}))
+        enviar("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _transcricao(self):
+        segmentos = [
+            {"id": 0, "start": 0.0, "end": 4.0, "text": "início da transcrição falsa"},
+            {"id": 1, "start": 4.0, "end": 8.0, "text": "fim da transcrição falsa"},
+        ]
+        return self._json(200, {"text": " ".join(s["text"] for s in segmentos), "language": "portuguese",
+                                "duration": 8.0, "segments": segmentos})
+
+    def _embeddings(self, pedido):
+        entradas = [pedido["input"]] if isinstance(pedido["input"], str) else pedido["input"]
+        dimensao = pedido.get("dimensions") or 8
+        dados = [{"object": "embedding", "index": i, "embedding": [((hash(texto) >> j) & 1) - 0.5 for j in range(dimensao)]}
+                 for i, texto in enumerate(entradas)]
+        return self._json(200, {"object": "list", "data": dados, "model": pedido["model"],
+                                "usage": {"prompt_tokens": 0, "total_tokens": 0}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita a API da OpenAI, com 429 e atrasos.")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.2)
+    parser.add_argument("--falhar-a-cada", type=int, default=0)
+    parser.add_argument("--limite-rpm", type=int, default=0)
+    parser.add_argument("--taxa-erro-500", type=float, default=0.0)
+    args = parser.parse_args()
+    servidor = ServidorOpenAIFalso(args.porta, latencia=args.latencia, falhar_a_cada=args.falhar_a_cada,
+                                   limite_rpm=args.limite_rpm, taxa_erro_500=args.taxa_erro_500)
+    print(f"OPENAI_BASE_URL={servidor.url}")
+    servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
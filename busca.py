@@ -0,0 +1,539 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+from cache import PASTA_CACHE_PADRAO
+
+PASTA_INDICE_BUSCA = os.path.join(PASTA_CACHE_PADRAO, "busca")
+PALAVRAS_POR_PASSAGEM = 120
+SOBREPOSICAO_PASSAGEM = 30
+TAMANHO_LOTE_EMBEDDINGS = 256
+# Cada salvar() grava um fragmento novo; acima disso (ou com muitas passagens removidas) eles são fundidos
+MAX_FRAGMENTOS = 16
+# Índices BM25 da transcrição (um por aula) mantidos em memória para o chat de ajustes
+MAX_INDICES_AULA = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+FRACAO_REMOVIDOS_COMPACTAR = 0.3
+# O app e o processar_lote.py --indexar podem gravar no mesmo índice; quem chega espera o outro terminar
+ESPERA_ESCRITA_INDICE = 60
+# AUTOINCREMENT: um id nunca é reaproveitado, porque os fragmentos antigos ainda guardam os vetores removidos
+ESQUEMA_PASSAGENS = (
+    """CREATE TABLE IF NOT EXISTS passagens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, aula TEXT NOT NULL, tipo TEXT NOT NULL, secao TEXT,
+        inicio REAL, fim REAL, texto TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS passagens_aula ON passagens (aula)",
+)
+
+# Palavras tão comuns que só somam ruído ao vetor (já sem acento, como saem de _termos)
+PALAVRAS_VAZIAS = set("""
+a o as os um uma uns umas de da do das dos em na no nas nos por pela pelo pelas pelos para pra com sem
+e ou mas que se ja nao sim eu voce voces ele ela eles elas isso isto esse essa este esta aquele aquela
+ao aos mais muito muita tambem como quando onde entao ne tipo assim aqui ai la so ser ter foi era vai vou
+""".split())
+
+def _termos(texto):
+    sem_acentos = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+    return [termo for termo in re.findall(r"\w+", sem_acentos) if termo not in PALAVRAS_VAZIAS]
+
+@lru_cache(maxsize=1 << 17)
+def _hash_termo(termo, dimensao):
+    valor = int.from_bytes(hashlib.blake2b(termo.encode("utf-8"), digest_size=8).digest(), "little")
+    return valor % dimensao, 1.0 if valor >> 63 else -1.0
+
+class EmbedderLocal:
+    # Determinístico e offline: hashing com sinal de palavras e bigramas. Pega sobreposição de vocabulário,
+    # não sinônimos; serve para testes e para bibliotecas sem acesso à API de embeddings.
+    def __init__(self, dimensao=512):
+        self.dimensao = dimensao
+        self.nome = f"local-hash-{dimensao}"
+
+    def embutir(self, textos):
+        matriz = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        for i, texto in enumerate(textos):
+            palavras = _termos(texto)
+            termos = palavras + [f"{a} {b}" for a, b in zip(palavras, palavras[1:])]
+            if not termos:
+                continue
+            posicoes, sinais = zip(*(_hash_termo(termo, self.dimensao) for termo in termos))
+            np.add.at(matriz[i], np.array(posicoes), np.array(sinais, dtype=np.float32))
+        # Frequência sublinear: um termo repetido 20 vezes não domina a passagem
+        matriz = np.sign(matriz) * np.log1p(np.abs(matriz))
+        # faiss (~40 ms para importar) só entra quando há texto a vetorizar, não ao abrir o app
+        import faiss
+        faiss.normalize_L2(matriz)
+        return matriz
+
+class EmbedderOpenAI:
+    def __init__(self, client, modelo="text-embedding-3-small", dimensao=512):
+        self.client = client
+        self.modelo = modelo
+        self.dimensao = dimensao
+        self.nome = f"openai-{modelo}-{dimensao}"
+
+    def embutir(self, textos):
+        # Retentativas e limite de taxa ficam com o cliente (transport.ClienteResiliente)
+        resposta = self.client.embeddings.create(model=self.modelo, input=list(textos), dimensions=self.dimensao)
+        matriz = np.array([item.embedding for item in resposta.data], dtype=np.float32)
+        import faiss
+        faiss.normalize_L2(matriz)
+        return matriz
+
+def criar_embedder(nome=None, client=None):
+    # GERADOR_EMBEDDER=openai usa a API (precisa do client); o padrão é o local
+    nome = nome or os.environ.get("GERADOR_EMBEDDER", "local")
+    if nome == "openai":
+        return EmbedderOpenAI(client)
+    if nome == "local":
+        return EmbedderLocal()
+    raise ValueError(f"Embedder desconhecido: {nome}")
+
+def _janelas_de_palavras(texto, tamanho=PALAVRAS_POR_PASSAGEM, sobreposicao=SOBREPOSICAO_PASSAGEM):
+    palavras = texto.split()
+    passo = max(1, tamanho - sobreposicao)
+    return [" ".join(palavras[i:i + tamanho]) for i in range(0, max(1, len(palavras) - sobreposicao), passo)
+            if palavras[i:i + tamanho]]
+
+def dividir_em_passagens(transcricao=None, resumo=None, indice_transcricao=None):
+    # Devolve dicts (tipo, secao, inicio, fim, texto). Com o índice da transcrição, as passagens seguem
+    # os segmentos do Whisper e guardam o tempo; sem ele, janelas de palavras sobrepostas.
+    passagens = []
+    if indice_transcricao is not None and len(indice_transcricao):
+        atual, palavras, inicio = [], 0, None
+        for inicio_segmento, fim_segmento, texto in indice_transcricao.janela(0, len(indice_transcricao)):
+            inicio = inicio_segmento if inicio is None else inicio
+            atual.append(texto)
+            palavras += len(texto.split())
+            if palavras >= PALAVRAS_POR_PASSAGEM:
+                passagens.append({"tipo": "transcricao", "secao": None, "inicio": inicio, "fim": fim_segmento,
+                                  "texto": " ".join(atual)})
+                atual, palavras, inicio = [], 0, None
+        if atual:
+            passagens.append({"tipo": "transcricao", "secao": None, "inicio": inicio, "fim": fim_segmento,
+                              "texto": " ".join(atual)})
+    elif transcricao:
+        passagens += [{"tipo": "transcricao", "secao": None, "inicio": None, "fim": None, "texto": janela}
+                      for janela in _janelas_de_palavras(transcricao)]
+    for secao, texto in (resumo or {}).items():
+        passagens += [{"tipo": "resumo", "secao": secao, "inicio": None, "fim": None, "texto": janela}
+                      for janela in _janelas_de_palavras(texto or "")]
+    return passagens
+
+def id_aula(transcricao):
+    # A mesma aula transcrita de novo (mesmo texto) substitui a entrada anterior em vez de duplicar
+    return hashlib.sha256(transcricao.encode("utf-8")).hexdigest()[:16]
+
+class IndiceBM25:
+    # Índice léxico de uma só aula, em memória: lista invertida com a frequência de cada termo por passagem.
+    # Acha "o exemplo que o professor deu sobre X" pelas palavras da instrução, sem chamar a API.
+    def __init__(self, passagens):
+        self.passagens = passagens
+        vocabulario = {}
+        ids_termos = []
+        comprimentos = np.zeros(len(passagens), dtype=np.float32)
+        for i, passagem in enumerate(passagens):
+            termos = _termos(passagem["texto"])
+            comprimentos[i] = len(termos)
+            ids_termos.append(np.fromiter(
+                (vocabulario.setdefault(termo, len(vocabulario)) for termo in termos), dtype=np.int64, count=len(termos)
+            ))
+        # Pares (termo, passagem) contados de uma vez e agrupados por termo: a lista invertida sai do np.unique
+        documentos = np.repeat(np.arange(len(passagens), dtype=np.int64), comprimentos.astype(np.int64))
+        pares, frequencias = np.unique(
+            np.concatenate(ids_termos or [np.empty(0, dtype=np.int64)]) * max(1, len(passagens)) + documentos,
+            return_counts=True
+        )
+        termos_pares, documentos_pares = np.divmod(pares, max(1, len(passagens)))
+        limites = np.searchsorted(termos_pares, np.arange(len(vocabulario) + 1))
+        documentos_pares = documentos_pares.astype(np.int32)
+        frequencias = frequencias.astype(np.float32)
+        self._postagens = {
+            termo: (documentos_pares[limites[i]:limites[i + 1]], frequencias[limites[i]:limites[i + 1]])
+            for termo, i in vocabulario.items()
+        }
+        media = float(comprimentos.mean()) if len(passagens) else 0.0
+        self._normalizacao = BM25_K1 * (1 - BM25_B + BM25_B * comprimentos / (media or 1.0))
+
+    def __len__(self):
+        return len(self.passagens)
+
+    def buscar(self, consulta, k=4):
+        # Devolve as passagens com pontuação > 0, da mais para a menos relevante
+        pontuacoes = np.zeros(len(self.passagens), dtype=np.float32)
+        for termo in set(_termos(consulta)):
+            if termo not in self._postagens:
+                continue
+            documentos, frequencias = self._postagens[termo]
+            idf = np.log1p((len(self.passagens) - len(documentos) + 0.5) / (len(documentos) + 0.5))
+            pontuacoes[documentos] += idf * frequencias * (BM25_K1 + 1) / (frequencias + self._normalizacao[documentos])
+        candidatos = np.flatnonzero(pontuacoes > 0)
+        melhores = candidatos[np.argsort(-pontuacoes[candidatos], kind="stable")[:k]]
+        return [{**self.passagens[i], "pontuacao": float(pontuacoes[i])} for i in melhores]
+
+_indices_aula = OrderedDict()
+_lock_indices_aula = threading.Lock()
+
+def indice_trechos_aula(transcricao, indice_transcricao=None):
+    # Construído uma vez por aula (depois da transcrição) e reaproveitado em cada ajuste; LRU pequeno
+    chave = id_aula(transcricao)
+    with _lock_indices_aula:
+        if chave in _indices_aula:
+            _indices_aula.move_to_end(chave)
+            return _indices_aula[chave]
+    indice = IndiceBM25(dividir_em_passagens(transcricao, indice_transcricao=indice_transcricao))
+    with _lock_indices_aula:
+        _indices_aula[chave] = indice
+        while len(_indices_aula) > MAX_INDICES_AULA:
+            _indices_aula.popitem(last=False)
+    return indice
+
+class IndiceBusca:
+    # Biblioteca de passagens (transcrições e resumos) para busca semântica entre aulas.
+    # Os vetores ficam em fragmentos .npy imutáveis, abertos com mmap e varridos com faiss.knn (produto
+    # interno em vetores normalizados): abrir o índice não lê os vetores, e a memória usada é cache de
+    # página do sistema. Metadados e a lista de fragmentos ficam em SQLite; remover uma aula só apaga as
+    # linhas dela (os vetores viram lápides, descartados na compactação).
+    # Gravações de fragmento e compactação acontecem dentro de uma transação BEGIN IMMEDIATE: o lock de
+    # escrita do SQLite serializa as threads e os processos (app e processar_lote.py) que usam a mesma pasta.
+    def __init__(self, pasta=None, embedder=None):
+        self.pasta = pasta or PASTA_INDICE_BUSCA
+        os.makedirs(self.pasta, exist_ok=True)
+        self.embedder = embedder or EmbedderLocal()
+        self._lock = threading.RLock()
+        self._conexao = sqlite3.connect(
+            os.path.join(self.pasta, "metadados.sqlite3"), check_same_thread=False, isolation_level=None,
+            timeout=ESPERA_ESCRITA_INDICE,
+        )
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS config (chave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS aulas (
+                aula TEXT PRIMARY KEY, titulo TEXT, assinatura TEXT NOT NULL,
+                passagens INTEGER NOT NULL, indexado_em REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fragmentos (nome TEXT PRIMARY KEY, linhas INTEGER NOT NULL);
+        """)
+        for comando in ESQUEMA_PASSAGENS:
+            self._conexao.execute(comando)
+        self._migrar_ids()
+        embedder_indice = self._config("embedder")
+        if embedder_indice is None:
+            self._definir_config("embedder", self.embedder.nome)
+        elif embedder_indice != self.embedder.nome:
+            raise ValueError(
+                f"O índice em {self.pasta} foi criado com o embedder {embedder_indice}, não {self.embedder.nome}. "
+                "Use o mesmo embedder ou recrie o índice."
+            )
+        self._pendentes = {}
+        self._fragmentos = []
+        self._versao_carregada = None
+
+    def _executar(self, sql, parametros=()):
+        with self._lock:
+            return self._conexao.execute(sql, parametros).fetchall()
+
+    @contextmanager
+    def _transacao(self):
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._conexao.execute("COMMIT")
+            except BaseException:
+                self._conexao.execute("ROLLBACK")
+                raise
+
+    def _migrar_ids(self):
+        # Índices criados antes do AUTOINCREMENT: a sequência continua do maior id já usado
+        with self._transacao():
+            esquema = self._executar("SELECT sql FROM sqlite_master WHERE name = 'passagens'")[0][0]
+            if "AUTOINCREMENT" in esquema.upper():
+                return
+            ultimo_id = max(self._executar("SELECT COALESCE(MAX(id), 0) FROM passagens")[0][0],
+                            int(self._config("proximo_id", 1)) - 1)
+            self._conexao.execute("ALTER TABLE passagens RENAME TO passagens_antigas")
+            self._conexao.execute("DROP INDEX passagens_aula")
+            for comando in ESQUEMA_PASSAGENS:
+                self._conexao.execute(comando)
+            self._conexao.execute("INSERT INTO passagens SELECT * FROM passagens_antigas")
+            self._conexao.execute("DROP TABLE passagens_antigas")
+            self._conexao.execute("DELETE FROM sqlite_sequence WHERE name = 'passagens'")
+            self._conexao.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('passagens', ?)", (ultimo_id,))
+            self._conexao.execute("DELETE FROM config WHERE chave = 'proximo_id'")
+
+    def _config(self, chave, padrao=None):
+        linhas = self._executar("SELECT valor FROM config WHERE chave = ?", (chave,))
+        return linhas[0][0] if linhas else padrao
+
+    def _definir_config(self, chave, valor):
+        self._executar("INSERT OR REPLACE INTO config (chave, valor) VALUES (?, ?)", (chave, str(valor)))
+
+    def indexar_aula(self, aula, titulo, transcricao=None, resumo=None, indice_transcricao=None):
+        # Só enfileira; os embeddings são calculados em lote e gravados em salvar(). False se nada mudou.
+        passagens = dividir_em_passagens(transcricao, resumo, indice_transcricao)
+        assinatura = hashlib.sha256(
+            json.dumps([self.embedder.nome, titulo, passagens], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        linhas = self._executar("SELECT assinatura FROM aulas WHERE aula = ?", (aula,))
+        if linhas and linhas[0][0] == assinatura:
+            return False
+        with self._lock:
+            self._pendentes[aula] = (titulo, assinatura, passagens)
+        return True
+
+    def remover_aula(self, aula):
+        with self._transacao():
+            self._pendentes.pop(aula, None)
+            return self._apagar_aula(aula)
+
+    def _apagar_aula(self, aula):
+        # Dentro de _transacao(): o contador de lápides é somado no SQLite, não lido e regravado
+        removidas = self._conexao.execute("DELETE FROM passagens WHERE aula = ?", (aula,)).rowcount
+        self._conexao.execute("DELETE FROM aulas WHERE aula = ?", (aula,))
+        self._conexao.execute(
+            "INSERT INTO config (chave, valor) VALUES ('removidas', ?) "
+            "ON CONFLICT(chave) DO UPDATE SET valor = CAST(valor AS INTEGER) + excluded.valor",
+            (removidas,),
+        )
+        self._definir_config("versao", uuid.uuid4().hex)
+        return removidas
+
+    def salvar(self):
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, {}
+        if not pendentes:
+            return 0
+        passagens = [(aula, p) for aula, (_, _, lista) in pendentes.items() for p in lista]
+        vetores = np.zeros((len(passagens), self.embedder.dimensao), dtype=np.float32)
+        for inicio in range(0, len(passagens), TAMANHO_LOTE_EMBEDDINGS):
+            lote = passagens[inicio:inicio + TAMANHO_LOTE_EMBEDDINGS]
+            vetores[inicio:inicio + len(lote)] = self.embedder.embutir([p["texto"] for _, p in lote])
+
+        with self._transacao():
+            for aula in pendentes:
+                self._apagar_aula(aula)
+            ids = np.array([
+                self._conexao.execute(
+                    "INSERT INTO passagens (aula, tipo, secao, inicio, fim, texto) VALUES (?, ?, ?, ?, ?, ?) "
+                    "RETURNING id", (aula, p["tipo"], p["secao"], p["inicio"], p["fim"], p["texto"])
+                ).fetchone()[0]
+                for aula, p in passagens
+            ], dtype=np.int64)
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO aulas (aula, titulo, assinatura, passagens, indexado_em) VALUES (?, ?, ?, ?, ?)",
+                [(aula, titulo, assinatura, len(lista), time.time())
+                 for aula, (titulo, assinatura, lista) in pendentes.items()]
+            )
+            # Um fragmento gravado sem o COMMIT (queda no meio) é ignorado e apagado na compactação
+            nome = self._gravar_fragmento(ids, vetores)
+            self._conexao.execute("INSERT INTO fragmentos (nome, linhas) VALUES (?, ?)", (nome, len(ids)))
+            self._definir_config("versao", uuid.uuid4().hex)
+        if self._precisa_compactar():
+            self.compactar()
+        return len(passagens)
+
+    def _gravar_fragmento(self, ids, vetores):
+        nome = f"fragmento_{time.time_ns()}"
+        for sufixo, dados in (("ids", ids), ("vetores", vetores)):
+            temporario = os.path.join(self.pasta, f".{nome}_{sufixo}.npy")
+            np.save(temporario, dados)
+            os.replace(temporario, os.path.join(self.pasta, f"{nome}_{sufixo}.npy"))
+        return nome
+
+    def _precisa_compactar(self):
+        total = self._executar("SELECT COALESCE(SUM(linhas), 0), COUNT(*) FROM fragmentos")[0]
+        removidas = int(self._config("removidas", 0))
+        return total[1] > MAX_FRAGMENTOS or (total[0] and removidas / total[0] > FRACAO_REMOVIDOS_COMPACTAR)
+
+    def compactar(self):
+        # Funde os fragmentos num só, sem as lápides, e apaga os arquivos antigos. Com a transação aberta nenhum
+        # outro processo está gravando fragmento, então os arquivos listados aqui são todos antigos ou órfãos
+        with self._transacao():
+            antigos = glob.glob(os.path.join(self.pasta, "fragmento_*.npy"))
+            self._carregar_fragmentos(forcar=True)
+            vivos = np.array([i for (i,) in self._executar("SELECT id FROM passagens")], dtype=np.int64)
+            ids, vetores = [], []
+            for ids_fragmento, vetores_fragmento in self._fragmentos:
+                mascara = np.isin(ids_fragmento, vivos)
+                ids.append(np.asarray(ids_fragmento[mascara]))
+                vetores.append(np.asarray(vetores_fragmento[mascara]))
+            ids = np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+            vetores = np.concatenate(vetores) if vetores else np.empty((0, self.embedder.dimensao), dtype=np.float32)
+            nome = self._gravar_fragmento(ids, vetores)
+            self._conexao.execute("DELETE FROM fragmentos")
+            self._conexao.execute("INSERT INTO fragmentos (nome, linhas) VALUES (?, ?)", (nome, len(ids)))
+            self._definir_config("removidas", 0)
+            self._definir_config("versao", uuid.uuid4().hex)
+            self._fragmentos = []
+            self._versao_carregada = None
+        # Leitores que já mapearam os arquivos antigos continuam funcionando até reabrir (Linux/macOS); no
+        # Windows o arquivo mapeado não pode ser apagado e fica para a próxima compactação
+        for caminho in antigos:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    def _carregar_fragmentos(self, forcar=False):
+        versao = self._config("versao")
+        if not forcar and versao == self._versao_carregada:
+            return
+        nomes = [nome for (nome,) in self._executar("SELECT nome FROM fragmentos ORDER BY nome")]
+        self._fragmentos = [
+            (np.load(os.path.join(self.pasta, f"{nome}_ids.npy"), mmap_mode="r"),
+             np.load(os.path.join(self.pasta, f"{nome}_vetores.npy"), mmap_mode="r"))
+            for nome in nomes
+        ]
+        self._versao_carregada = versao
+
+    def buscar(self, consulta, k=10, aula=None):
+        # Devolve as k passagens mais próximas (opcionalmente só de uma aula), da mais para a menos parecida
+        with self._lock:
+            self._carregar_fragmentos()
+            fragmentos = list(self._fragmentos)
+        total = sum(len(ids) for ids, _ in fragmentos)
+        if not consulta.strip() or not total:
+            return []
+        import faiss
+        vetor = self.embedder.embutir([consulta])
+        # Busca mais que k para sobrar resultado depois de tirar lápides e outras aulas
+        candidatos = min(total, k * 4)
+        while True:
+            pontuacoes, ids = [], []
+            for ids_fragmento, vetores_fragmento in fragmentos:
+                if not len(ids_fragmento):
+                    continue
+                distancias, posicoes = faiss.knn(
+                    vetor, vetores_fragmento, min(candidatos, len(ids_fragmento)), metric=faiss.METRIC_INNER_PRODUCT
+                )
+                validos = posicoes[0] >= 0
+                pontuacoes.append(distancias[0][validos])
+                ids.append(np.asarray(ids_fragmento)[posicoes[0][validos]])
+            pontuacoes = np.concatenate(pontuacoes)
+            ids = np.concatenate(ids)
+            ordem = np.argsort(-pontuacoes)
+            resultados = self._metadados([int(i) for i in ids[ordem]], pontuacoes[ordem], aula)
+            if len(resultados) >= k or candidatos >= total:
+                return resultados[:k]
+            candidatos = min(total, candidatos * 4)
+
+    def _metadados(self, ids, pontuacoes, aula=None):
+        if not ids:
+            return []
+        marcadores = ",".join("?" * len(ids))
+        linhas = self._executar(
+            f"SELECT p.id, p.aula, a.titulo, p.tipo, p.secao, p.inicio, p.fim, p.texto "
+            f"FROM passagens p JOIN aulas a ON a.aula = p.aula WHERE p.id IN ({marcadores})", ids
+        )
+        por_id = {linha[0]: linha for linha in linhas}
+        resultados = []
+        for i, pontuacao in zip(ids, pontuacoes):
+            linha = por_id.get(i)
+            if linha is None or (aula is not None and linha[1] != aula):
+                continue
+            resultados.append({
+                "aula": linha[1], "titulo": linha[2], "tipo": linha[3], "secao": linha[4],
+                "inicio": linha[5], "fim": linha[6], "texto": linha[7], "pontuacao": float(pontuacao),
+            })
+        return resultados
+
+    def aulas(self):
+        linhas = self._executar("SELECT aula, titulo, passagens, indexado_em FROM aulas ORDER BY indexado_em DESC")
+        return [{"aula": a, "titulo": t, "passagens": p, "indexado_em": i} for a, t, p, i in linhas]
+
+    def estatisticas(self):
+        linhas, fragmentos = self._executar("SELECT COALESCE(SUM(linhas), 0), COUNT(*) FROM fragmentos")[0]
+        return {
+            "aulas": self._executar("SELECT COUNT(*) FROM aulas")[0][0],
+            "passagens": self._executar("SELECT COUNT(*) FROM passagens")[0][0],
+            "vetores": linhas,
+            "fragmentos": fragmentos,
+            "pendentes": len(self._pendentes),
+            "embedder": self.embedder.nome,
+        }
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+def indexar_jsons(indice, entradas, log=print):
+    # Resumos já gravados por salvar_resumo_json (só o resumo: o JSON não guarda a transcrição)
+    arquivos = []
+    for entrada in entradas:
+        arquivos += glob.glob(os.path.join(entrada, "*.json")) if os.path.isdir(entrada) else glob.glob(entrada)
+    novos = 0
+    for arquivo in sorted(set(arquivos)):
+        with open(arquivo, encoding="utf-8") as f:
+            dados = json.load(f)
+        aula = "json:" + os.path.splitext(os.path.basename(arquivo))[0]
+        if indice.indexar_aula(aula, dados.get("titulo", aula), resumo=dados.get("resumo")):
+            novos += 1
+            log(f"[indexando] {arquivo}")
+    indice.salvar()
+    return novos
+
+def _formatar_resultado(resultado):
+    from indice_transcricao import formatar_tempo
+    local = resultado["secao"] or "transcrição"
+    if resultado["inicio"] is not None:
+        local += f" {formatar_tempo(resultado['inicio'])}"
+    trecho = resultado["texto"][:200] + ("..." if len(resultado["texto"]) > 200 else "")
+    return f"{resultado['pontuacao']:.3f}  {resultado['titulo']} [{local}]\n       {trecho}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Busca semântica na biblioteca de aulas.")
+    parser.add_argument("--pasta", default=PASTA_INDICE_BUSCA, help="pasta do índice")
+    parser.add_argument("--embedder", choices=["local", "openai"], default=None)
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    sub = parser.add_subparsers(dest="comando", required=True)
+    indexar = sub.add_parser("indexar", help="indexa JSONs de resumo (pastas ou globs)")
+    indexar.add_argument("entradas", nargs="+")
+    buscar = sub.add_parser("buscar", help="busca em todas as aulas")
+    buscar.add_argument("consulta")
+    buscar.add_argument("-k", type=int, default=10)
+    remover = sub.add_parser("remover", help="remove uma aula do índice")
+    remover.add_argument("aula")
+    sub.add_parser("compactar", help="funde os fragmentos e descarta passagens removidas")
+    sub.add_parser("estatisticas")
+    args = parser.parse_args(argv)
+
+    client = None
+    if (args.embedder or os.environ.get("GERADOR_EMBEDDER")) == "openai":
+        from functions import get_openai_client
+        client = get_openai_client(args.api_key)
+    indice = IndiceBusca(args.pasta, criar_embedder(args.embedder, client))
+
+    if args.comando == "indexar":
+        print(f"{indexar_jsons(indice, args.entradas)} aula(s) indexada(s). {indice.estatisticas()}")
+    elif args.comando == "buscar":
+        inicio = time.perf_counter()
+        resultados = indice.buscar(args.consulta, k=args.k)
+        for resultado in resultados:
+            print(_formatar_resultado(resultado))
+        print(f"{len(resultados)} resultado(s) em {time.perf_counter() - inicio:.3f}s", file=sys.stderr)
+    elif args.comando == "remover":
+        print(f"{indice.remover_aula(args.aula)} passagem(ns) removida(s)")
+    elif args.comando == "compactar":
+        indice.compactar()
+        print(indice.estatisticas())
+    else:
+        print(json.dumps(indice.estatisticas(), ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from indice_transcricao import TranscricaoIndexada
+
+PASTA_CACHE_PADRAO = os.environ.get(
+    "GERADOR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "gerador-resumos")
+)
+LIMITE_CACHE_TRANSCRICOES = 200 * 1024 * 1024
+
+def calcular_hash_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    # Lê em blocos para não carregar uploads de centenas de MB na memória
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+class _CacheSQLite:
+    # Base dos caches em disco: conexão compartilhada entre threads, contadores
+    # persistentes e despejo LRU pelo total de bytes das tabelas em TABELAS.
+    TABELAS = ()
+    ESQUEMA = ""
+
+    def __init__(self, caminho, limite_bytes):
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self.caminho = caminho
+        self.limite_bytes = limite_bytes
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.executescript(self.ESQUEMA + """
+            CREATE TABLE IF NOT EXISTS contadores (nome TEXT PRIMARY KEY, valor INTEGER NOT NULL);
+        """)
+
+    def _executar(self, sql, parametros=()):
+        with self._lock:
+            return self._conexao.execute(sql, parametros).fetchall()
+
+    def _contar(self, nome, quantidade=1):
+        self._executar(
+            "INSERT INTO contadores (nome, valor) VALUES (?, ?) "
+            "ON CONFLICT(nome) DO UPDATE SET valor = valor + excluded.valor",
+            (nome, quantidade),
+        )
+
+    def _tamanho_total(self):
+        return sum(self._executar(f"SELECT COALESCE(SUM(tamanho), 0) FROM {tabela}")[0][0] for tabela in self.TABELAS)
+
+    def _despejar(self):
+        excesso = self._tamanho_total() - self.limite_bytes
+        if excesso <= 0:
+            return
+        uniao = " UNION ALL ".join(f"SELECT '{t}', rowid, tamanho, ultimo_acesso FROM {t}" for t in self.TABELAS)
+        with self._lock:
+            candidatos = self._conexao.execute(f"{uniao} ORDER BY ultimo_acesso").fetchall()
+            removidos = 0
+            self._conexao.execute("BEGIN")
+            for tabela, rowid, tamanho, _ in candidatos:
+                if excesso <= 0:
+                    break
+                self._ao_despejar(tabela, rowid)
+                self._conexao.execute(f"DELETE FROM {tabela} WHERE rowid = ?", (rowid,))
+                excesso -= tamanho
+                removidos += 1
+            self._conexao.execute("COMMIT")
+        self._contar("despejos", removidos)
+
+    def _ao_despejar(self, tabela, rowid):
+        # Chamado com o lock já tomado, antes de apagar a linha (arquivos associados à entrada)
+        pass
+
+    def estatisticas(self):
+        contadores = dict(self._executar("SELECT nome, valor FROM contadores"))
+        entradas = sum(self._executar(f"SELECT COUNT(*) FROM {tabela}")[0][0] for tabela in self.TABELAS)
+        return {
+            "acertos": contadores.get("acertos", 0),
+            "falhas": contadores.get("falhas", 0),
+            "despejos": contadores.get("despejos", 0),
+            "entradas": entradas,
+            "bytes": self._tamanho_total(),
+            "limite_bytes": self.limite_bytes,
+        }
+
+    def limpar(self):
+        for tabela in self.TABELAS:
+            self._executar(f"DELETE FROM {tabela}")
+
+    def fechar(self):
+        with self._lock:
+            self._conexao.close()
+
+class CacheTranscricoes(_CacheSQLite):
+    # Transcrições completas por chave (hash do áudio + modelo + idioma) e, separadamente,
+    # o texto de cada chunk já transcrito, para uma execução que falhou no meio retomar dali.
+    TABELAS = ("transcricoes", "chunks")
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS transcricoes (
+            chave TEXT PRIMARY KEY, texto TEXT NOT NULL,
+            tamanho INTEGER NOT NULL, ultimo_acesso REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS chunks (
+            chave TEXT NOT NULL, indice INTEGER NOT NULL, texto TEXT NOT NULL,
+            tamanho INTEGER NOT NULL, ultimo_acesso REAL NOT NULL,
+            PRIMARY KEY (chave, indice)
+        );
+    """
+
+    def __init__(self, caminho=None, limite_bytes=LIMITE_CACHE_TRANSCRICOES):
+        super().__init__(caminho or os.path.join(PASTA_CACHE_PADRAO, "transcricoes.sqlite3"), limite_bytes)
+        # Índice com os segmentos e tempos de cada transcrição (ver indice_transcricao.py), ao lado do SQLite
+        self.pasta_indices = os.path.join(os.path.dirname(os.path.abspath(self.caminho)), "indices")
+
+    def chave(self, arquivo_audio, modelo, idioma):
+        # Caminho ou AudioEntrada (o hash do upload sai do buffer em memória, igual ao do arquivo)
+        hash_audio = arquivo_audio.hash() if hasattr(arquivo_audio, "hash") else calcular_hash_arquivo(arquivo_audio)
+        return hashlib.sha256(f"{hash_audio}:{modelo}:{idioma}".encode("utf-8")).hexdigest()
+
+    def obter(self, chave):
+        linhas = self._executar("SELECT texto FROM transcricoes WHERE chave = ?", (chave,))
+        if not linhas:
+            self._contar("falhas")
+            return None
+        self._executar("UPDATE transcricoes SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave))
+        self._contar("acertos")
+        return linhas[0][0]
+
+    def pasta_indice(self, chave):
+        return os.path.join(self.pasta_indices, chave)
+
+    def obter_indice(self, chave):
+        # Não conta acerto: é consultado junto com obter()
+        pasta = self.pasta_indice(chave)
+        return TranscricaoIndexada.abrir(pasta) if os.path.isdir(pasta) else None
+
+    def salvar(self, chave, texto, indice=None):
+        tamanho = len(texto.encode("utf-8"))
+        if indice is not None:
+            indice.salvar(self.pasta_indice(chave))
+            tamanho += indice.tamanho_bytes
+        self._executar(
+            "INSERT OR REPLACE INTO transcricoes (chave, texto, tamanho, ultimo_acesso) VALUES (?, ?, ?, ?)",
+            (chave, texto, tamanho, time.time()),
+        )
+        # Com a transcrição completa salva, os chunks parciais não servem mais
+        self._executar("DELETE FROM chunks WHERE chave LIKE ?", (f"{chave}:%",))
+        self._despejar()
+
+    def obter_chunks(self, chave_chunks):
+        linhas = self._executar("SELECT indice, texto FROM chunks WHERE chave = ?", (chave_chunks,))
+        if linhas:
+            self._executar("UPDATE chunks SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave_chunks))
+        return dict(linhas)
+
+    def salvar_chunk(self, chave_chunks, indice, texto):
+        self._executar(
+            "INSERT OR REPLACE INTO chunks (chave, indice, texto, tamanho, ultimo_acesso) VALUES (?, ?, ?, ?, ?)",
+            (chave_chunks, indice, texto, len(texto.encode("utf-8")), time.time()),
+        )
+        self._despejar()
+
+    def _ao_despejar(self, tabela, rowid):
+        if tabela == "transcricoes":
+            chave = self._conexao.execute("SELECT chave FROM transcricoes WHERE rowid = ?", (rowid,)).fetchone()[0]
+            shutil.rmtree(self.pasta_indice(chave), ignore_errors=True)
+
+    def limpar(self):
+        super().limpar()
+        shutil.rmtree(self.pasta_indices, ignore_errors=True)
+
+LIMITE_CACHE_RESUMOS = 100 * 1024 * 1024
+MAX_VARIANTES_RESUMO = 5
+
+class CacheResumos(_CacheSQLite):
+    # Resumos já gerados por (hash da transcrição, modelo, versão do prompt, parâmetros de amostragem).
+    # Cada chave guarda até MAX_VARIANTES_RESUMO gerações, para alternar entre versões sem nova chamada.
+    TABELAS = ("resumos",)
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS resumos (
+            chave TEXT NOT NULL, variante INTEGER NOT NULL, secoes TEXT NOT NULL,
+            criado_em REAL NOT NULL, tamanho INTEGER NOT NULL, ultimo_acesso REAL NOT NULL,
+            PRIMARY KEY (chave, variante)
+        );
+    """
+
+    def __init__(self, caminho=None, limite_bytes=LIMITE_CACHE_RESUMOS, max_variantes=MAX_VARIANTES_RESUMO):
+        super().__init__(caminho or os.path.join(PASTA_CACHE_PADRAO, "resumos.sqlite3"), limite_bytes)
+        self.max_variantes = max_variantes
+
+    def chave(self, transcricao, modelo, versao_prompt, parametros):
+        hash_transcricao = hashlib.sha256(transcricao.encode("utf-8")).hexdigest()
+        parametros_texto = json.dumps(parametros, sort_keys=True)
+        return hashlib.sha256(f"{hash_transcricao}:{modelo}:{versao_prompt}:{parametros_texto}".encode("utf-8")).hexdigest()
+
+    def variantes(self, chave):
+        # Da mais antiga para a mais recente
+        linhas = self._executar(
+            "SELECT variante, secoes, criado_em FROM resumos WHERE chave = ? ORDER BY variante", (chave,)
+        )
+        return [{"variante": variante, "secoes": json.loads(secoes), "criado_em": criado_em}
+                for variante, secoes, criado_em in linhas]
+
+    def obter(self, chave, variante=None):
+        if variante is None:
+            linhas = self._executar(
+                "SELECT variante, secoes FROM resumos WHERE chave = ? ORDER BY variante DESC LIMIT 1", (chave,)
+            )
+        else:
+            linhas = self._executar(
+                "SELECT variante, secoes FROM resumos WHERE chave = ? AND variante = ?", (chave, variante)
+            )
+        if not linhas:
+            self._contar("falhas")
+            return None
+        self._executar(
+            "UPDATE resumos SET ultimo_acesso = ? WHERE chave = ? AND variante = ?", (time.time(), chave, linhas[0][0])
+        )
+        self._contar("acertos")
+        return json.loads(linhas[0][1])
+
+    def salvar(self, chave, secoes):
+        secoes_texto = json.dumps(secoes, ensure_ascii=False)
+        agora = time.time()
+        # Número da variante e inserção num só comando, dentro de uma transação: saves simultâneos da mesma chave
+        # (outra thread ou o processar_lote.py em outro processo) não disputam o mesmo número
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                proxima = self._conexao.execute(
+                    "INSERT INTO resumos (chave, variante, secoes, criado_em, tamanho, ultimo_acesso) "
+                    "SELECT ?, COALESCE(MAX(variante), -1) + 1, ?, ?, ?, ? FROM resumos WHERE chave = ? "
+                    "RETURNING variante",
+                    (chave, secoes_texto, agora, len(secoes_texto.encode("utf-8")), agora, chave),
+                ).fetchone()[0]
+                self._conexao.execute(
+                    "DELETE FROM resumos WHERE chave = ? AND variante <= ?", (chave, proxima - self.max_variantes)
+                )
+                self._conexao.execute("COMMIT")
+            except BaseException:
+                self._conexao.execute("ROLLBACK")
+                raise
+        self._despejar()
+        return proxima
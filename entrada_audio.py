@@ -0,0 +1,144 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from metricas import medir, registro
+
+# Até esse tamanho o áudio vai inteiro numa chamada ao Whisper, direto da memória (ou do arquivo do chamador),
+# sem ffmpeg nem arquivo temporário: 4 MB são ~4 min de MP3 a 128 kbps, que não seriam divididos de qualquer forma
+LIMITE_ENVIO_DIRETO = int(os.environ.get("GERADOR_LIMITE_ENVIO_DIRETO", 4 * 1024 * 1024))
+PASTA_TEMPORARIA = os.path.join(tempfile.gettempdir(), "gerador-resumos")
+# Arquivos deixados por um processo que morreu no meio da transcrição
+IDADE_MAXIMA_TEMPORARIO = 24 * 3600
+TAMANHO_BLOCO = 1024 * 1024
+
+_limpeza_feita = False
+_lock_limpeza = threading.Lock()
+
+def _limpar_temporarios_antigos():
+    global _limpeza_feita
+    with _lock_limpeza:
+        if _limpeza_feita:
+            return
+        _limpeza_feita = True
+    limite = time.time() - IDADE_MAXIMA_TEMPORARIO
+    # Inclui as subpastas de cada usuário
+    for raiz, _, arquivos in os.walk(PASTA_TEMPORARIA):
+        for nome in arquivos:
+            caminho = os.path.join(raiz, nome)
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except OSError:
+                pass
+
+class AudioEntrada:
+    # Áudio a transcrever, venha de um upload do Streamlit (já inteiro na memória), de bytes ou de um arquivo
+    # do chamador. O buffer do upload é lido no lugar (getbuffer/seek), sem cópia; só quando o ffmpeg precisa
+    # de um arquivo com seek o conteúdo é gravado, uma vez, num nome único em `pasta` (PASTA_TEMPORARIA ou a
+    # subpasta do usuário). fechar() (ou o with) apaga o que foi criado aqui; o arquivo do chamador nunca é removido.
+    def __init__(self, nome, buffer=None, caminho=None, pasta=None):
+        self.nome = nome
+        self.pasta = pasta or PASTA_TEMPORARIA
+        self._buffer = buffer
+        self._caminho = caminho
+        self._temporario = False
+        self._hash = None
+        self.bytes_copiados = 0
+        if buffer is not None:
+            with buffer.getbuffer() as visao:
+                self.tamanho = visao.nbytes
+        else:
+            self.tamanho = os.path.getsize(caminho)
+
+    @classmethod
+    def de_upload(cls, arquivo, nome=None, limite_memoria=LIMITE_ENVIO_DIRETO, pasta=None):
+        # `arquivo`: UploadedFile do Streamlit ou qualquer BytesIO. Acima do limite já grava em disco aqui,
+        # na thread do script, e solta o buffer para o job não segurar o upload inteiro na memória
+        entrada = cls(nome or getattr(arquivo, "name", None) or "audio.mp3", buffer=arquivo, pasta=pasta)
+        if entrada.tamanho > limite_memoria:
+            entrada.caminho()
+            entrada._buffer = None
+        return entrada
+
+    @classmethod
+    def de_bytes(cls, dados, nome, limite_memoria=LIMITE_ENVIO_DIRETO, pasta=None):
+        # BytesIO compartilha o bytes recebido até alguém escrever nele
+        return cls.de_upload(io.BytesIO(dados), nome, limite_memoria, pasta)
+
+    @classmethod
+    def de_caminho(cls, caminho):
+        return cls(os.path.basename(caminho), caminho=caminho)
+
+    @property
+    def extensao(self):
+        return os.path.splitext(self.nome)[1].lower()
+
+    @property
+    def origem(self):
+        if self._buffer is not None and not self._temporario:
+            return "memoria"
+        return "temporario" if self._temporario else "arquivo"
+
+    @property
+    def envio_direto(self):
+        return self.tamanho <= LIMITE_ENVIO_DIRETO
+
+    def caminho(self):
+        # Caminho para o ffmpeg; na primeira chamada grava o upload em disco
+        if self._caminho is None:
+            _limpar_temporarios_antigos()
+            os.makedirs(self.pasta, exist_ok=True)
+            descritor, caminho = tempfile.mkstemp(prefix="upload_", suffix=self.extensao or ".mp3", dir=self.pasta)
+            self._caminho, self._temporario = caminho, True
+            with medir("gravacao_upload", bytes=self.tamanho, bytes_copiados=self.tamanho):
+                with os.fdopen(descritor, "wb") as f, self._buffer.getbuffer() as visao:
+                    f.write(visao)
+            self.bytes_copiados += self.tamanho
+        return self._caminho
+
+    @contextmanager
+    def abrir(self):
+        # Objeto binário para o upload: o próprio buffer, voltado ao início, ou o arquivo em disco
+        if self._buffer is not None:
+            self._buffer.seek(0)
+            yield self._buffer
+        else:
+            with open(self._caminho, "rb") as f:
+                yield f
+
+    def hash(self):
+        # sha256 do conteúdo (o mesmo de cache.calcular_hash_arquivo), sem copiar o buffer
+        if self._hash is None:
+            sha = hashlib.sha256()
+            if self._buffer is not None:
+                with self._buffer.getbuffer() as visao:
+                    sha.update(visao)
+            else:
+                with open(self._caminho, "rb") as f:
+                    for bloco in iter(lambda: f.read(TAMANHO_BLOCO), b""):
+                        sha.update(bloco)
+            self._hash = sha.hexdigest()
+        return self._hash
+
+    def fechar(self):
+        if self._temporario and self._caminho:
+            try:
+                os.remove(self._caminho)
+            except FileNotFoundError:
+                pass
+            self._caminho = None
+            self._temporario = False
+        if self._buffer is not None or self.bytes_copiados:
+            registro.registrar("entrada_audio", 0.0, bytes=self.tamanho, bytes_copiados=self.bytes_copiados)
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
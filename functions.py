@@ -1,63 +1,303 @@
-from openai import OpenAI
-from moviepy.editor import AudioFileClip
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from difflib import SequenceMatcher
+import hashlib
 import json
+import logging
 import os
-import math
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+import unicodedata
 from datetime import datetime
 import io
 
+from metricas import como_atual, medir, registro, registrar_uso
+from transport import obter_cliente, status_erro
+from entrada_audio import AudioEntrada
+from tokens import contar_tokens, contar_tokens_lote, escolher_max_tokens, TOKENS_POR_MENSAGEM
+from segmentacao import caminho_ffmpeg, duracao_audio, planejar_cortes
+from indice_transcricao import TranscricaoIndexada, formatar_tempo
+
+log = logging.getLogger(__name__)
+
+MAX_TRANSCRICOES_SIMULTANEAS = 4
+
+# Containers que o ffmpeg consegue fatiar sem recodificar (extensão -> formato do chunk)
+FORMATOS_COPIA = {".mp3": "mp3", ".m4a": "ipod"}
+# Recodificação mono 16 kHz a 32 kbps: ~14 MB/hora, bem abaixo do limite de 25 MB do Whisper por chunk
+PARAMETROS_RECODIFICACAO = ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "32k"]
+BYTES_POR_SEGUNDO_RECODIFICADO = 32000 // 8
+# Limite de upload do Whisper, com folga para cabeçalhos e trechos de bitrate variável mais densos
+LIMITE_UPLOAD_WHISPER = 25 * 1024 * 1024
+FRACAO_UTIL_UPLOAD = 0.9
+# Chunks tão grandes quanto o upload permite, mas divididos entre os workers para a transcrição seguir em paralelo
+DURACAO_MINIMA_CHUNK = 300
+# O corte é procurado nos últimos JANELA_BUSCA_CORTE segundos antes do alvo
+JANELA_BUSCA_CORTE = 20
+# Quando não há pausa perto do alvo, os chunks vizinhos repetem esse trecho de cada lado do corte
+SOBREPOSICAO_CORTE_FORCADO = 1.0
+
 def get_openai_client(api_key):
-    return OpenAI(api_key=api_key)
+    # Cliente compartilhado no processo, com pool de conexões, limite de taxa e retentativas (transport.py)
+    return obter_cliente(api_key)
 
-def dividir_audio_em_chunks(arquivo_audio, duracao_maxima=180):
-    audio = AudioFileClip(arquivo_audio)
-    duracao_total = audio.duration
-    
-    if duracao_total <= duracao_maxima:
-        audio.close()
-        return [arquivo_audio]
-    
-    num_chunks = math.ceil(duracao_total / duracao_maxima)
-    chunks_paths = []
-    
-    for i in range(num_chunks):
-        inicio = i * duracao_maxima
-        fim = min((i + 1) * duracao_maxima, duracao_total)
-        temp_path = f"temp_chunk_{i}.mp3"
-        chunk = audio.subclip(inicio, fim)
-        chunk.write_audiofile(temp_path)
-        chunks_paths.append(temp_path)
-    
-    audio.close()
-    return chunks_paths
+def _duracao_alvo_chunk(arquivo_audio, copiar, duracao_total, duracao_maxima=None):
+    if copiar and duracao_total:
+        bytes_por_segundo = os.path.getsize(arquivo_audio) / duracao_total
+    else:
+        bytes_por_segundo = BYTES_POR_SEGUNDO_RECODIFICADO
+    alvo = LIMITE_UPLOAD_WHISPER * FRACAO_UTIL_UPLOAD / bytes_por_segundo
+    if duracao_total:
+        alvo = min(alvo, max(DURACAO_MINIMA_CHUNK, duracao_total / MAX_TRANSCRICOES_SIMULTANEAS + JANELA_BUSCA_CORTE))
+    if duracao_maxima:
+        alvo = min(alvo, duracao_maxima)
+    return alvo
 
-def transcrever_audio_whisper(arquivo_audio, client, status_callback=None):
-    chunks = dividir_audio_em_chunks(arquivo_audio)
-    transcricao_completa = ""
-    
-    for i, chunk_path in enumerate(chunks):
-        if status_callback:
-            status_callback(f"Transcrevendo parte {i+1} de {len(chunks)}...")
-        
-        with open(chunk_path, "rb") as audio_file:
-            transcricao_chunk = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="pt"
-            )
-        
-        transcricao_completa += transcricao_chunk.text + " "
-        
-        if chunk_path != arquivo_audio and chunk_path.startswith("temp_chunk_"):
+def _extrair_trecho(arquivo_audio, inicio, fim, caminho, copiar):
+    if copiar:
+        codec = ["-vn", "-c:a", "copy", "-f", FORMATOS_COPIA[os.path.splitext(arquivo_audio)[1].lower()]]
+    else:
+        codec = [*PARAMETROS_RECODIFICACAO, "-f", "mp3"]
+    comando = [
+        caminho_ffmpeg(), "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+        "-ss", f"{inicio:.3f}", "-t", f"{fim - inicio:.3f}", "-i", arquivo_audio, *codec, caminho,
+    ]
+    resultado = subprocess.run(comando, capture_output=True, text=True, errors="replace")
+    if resultado.returncode != 0:
+        raise RuntimeError(f"Falha ao dividir o áudio com ffmpeg: {resultado.stderr.strip()}")
+
+def dividir_audio_em_chunks(arquivo_audio, duracao_maxima=None, pasta_destino=None, pular=()):
+    # Gera (caminho, inicio, fim) à medida que a análise de energia encontra cada corte, para a
+    # transcrição do primeiro chunk começar enquanto o resto ainda está sendo analisado.
+    # Os cortes caem em pausas; onde não há pausa, os chunks vizinhos se sobrepõem um pouco.
+    # Sem pasta_destino, os chunks ficam numa pasta temporária que o chamador deve remover.
+    # Índices em `pular` (já transcritos, no cache) saem com caminho None, sem passar pelo ffmpeg.
+    if pasta_destino is None:
+        pasta_destino = tempfile.mkdtemp(prefix="chunks_")
+
+    extensao = os.path.splitext(arquivo_audio)[1].lower()
+    duracao_total = duracao_audio(arquivo_audio)
+    # Sem a duração não dá para saber o bitrate do original, nem quantos segundos cabem num upload copiado
+    copiar = extensao in FORMATOS_COPIA and bool(duracao_total)
+    alvo = _duracao_alvo_chunk(arquivo_audio, copiar, duracao_total, duracao_maxima)
+    janela = min(JANELA_BUSCA_CORTE, alvo * 0.2)
+    with medir("divisao_audio", bytes=os.path.getsize(arquivo_audio), copia=copiar, chunks=0,
+               cortes_forcados=0, duracao_alvo=alvo, bytes_copiados=0, chunks_pulados=0, atual=False) as span:
+        forcado_antes = False
+        for indice, (inicio, fim, forcado) in enumerate(planejar_cortes(arquivo_audio, alvo, janela)):
+            inicio_trecho = max(0.0, inicio - SOBREPOSICAO_CORTE_FORCADO) if forcado_antes else inicio
+            fim_trecho = fim + SOBREPOSICAO_CORTE_FORCADO if forcado else fim
+            forcado_antes = forcado
+            span["cortes_forcados"] += forcado
+            if indice in pular:
+                span["chunks_pulados"] += 1
+                yield None, inicio_trecho, fim_trecho
+                continue
             try:
-                os.remove(chunk_path)
-            except Exception:
-                pass
-    
-    return transcricao_completa.strip()
+                caminho = os.path.join(pasta_destino, f"chunk_{indice:04d}{extensao if copiar else '.mp3'}")
+                _extrair_trecho(arquivo_audio, inicio_trecho, fim_trecho, caminho, copiar)
+            except RuntimeError:
+                # Extensão que não corresponde ao conteúdo real: recodifica desde o início
+                if not copiar or span["chunks"]:
+                    raise
+                copiar = span["copia"] = False
+                caminho = os.path.join(pasta_destino, f"chunk_{indice:04d}.mp3")
+                _extrair_trecho(arquivo_audio, inicio_trecho, fim_trecho, caminho, copiar)
+            span["chunks"] += 1
+            span["bytes_copiados"] += os.path.getsize(caminho)
+            yield caminho, inicio_trecho, fim_trecho
 
-def gerar_resumo(transcricao, client, model):
-    prompt = f"""
+def _transcrever_chunk(chunk, client):
+    # Devolve [(inicio, fim, texto)] com os tempos relativos ao início do chunk.
+    # `chunk` é um caminho ou uma AudioEntrada (enviada direto do buffer, sem passar pelo disco)
+    entrada = chunk if isinstance(chunk, AudioEntrada) else AudioEntrada.de_caminho(chunk)
+    with medir("transcricao_chunk", bytes=entrada.tamanho, origem=entrada.origem), entrada.abrir() as audio_file:
+        resposta = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(entrada.nome, audio_file),
+            language="pt",
+            response_format="verbose_json",
+            timestamp_granularities=["segment"]
+        )
+    segmentos = getattr(resposta, "segments", None)
+    if not segmentos:
+        return [(0.0, float(getattr(resposta, "duration", 0.0) or 0.0), resposta.text)]
+    return [(float(s.start), float(s.end), s.text) for s in segmentos]
+
+# Palavras comparadas de cada lado de uma sobreposição; 1 s de fala tem bem menos que isso
+PALAVRAS_COSTURA = 25
+# Tolerância para palavras cortadas no meio (transcritas de forma diferente) nas bordas da sobreposição
+FOLGA_COSTURA = 3
+# 2 s de sobreposição têm umas 5 palavras; menos que isso repetido pode ser coincidência
+MIN_PALAVRAS_COSTURA = 3
+
+def _normalizar_palavra(palavra):
+    return re.sub(r"[^\w]", "", palavra.lower())
+
+def _costurar(anterior, atual):
+    # Remove do início de `atual` as palavras que repetem o fim de `anterior` (trecho sobreposto)
+    palavras_anterior = anterior.split()
+    palavras_atual = atual.split()
+    fim_anterior = [_normalizar_palavra(p) for p in palavras_anterior[-PALAVRAS_COSTURA:]]
+    inicio_atual = [_normalizar_palavra(p) for p in palavras_atual[:PALAVRAS_COSTURA]]
+    bloco = SequenceMatcher(None, fim_anterior, inicio_atual, autojunk=False).find_longest_match(
+        0, len(fim_anterior), 0, len(inicio_atual)
+    )
+    encosta_no_fim = len(fim_anterior) - (bloco.a + bloco.size) <= FOLGA_COSTURA
+    encosta_no_inicio = bloco.b <= FOLGA_COSTURA
+    sobra_anterior = len(fim_anterior) - (bloco.a + bloco.size)
+    repeticao_clara = bloco.size >= MIN_PALAVRAS_COSTURA and bloco.size > sobra_anterior + bloco.b
+    if not (repeticao_clara and encosta_no_fim and encosta_no_inicio):
+        return anterior, atual
+    # O que vem depois da repetição no fim de `anterior` é a palavra cortada pela borda do chunk
+    anterior = " ".join(palavras_anterior[:len(palavras_anterior) - sobra_anterior])
+    return anterior, " ".join(palavras_atual[bloco.b + bloco.size:])
+
+def costurar_segmentos(segmentos_por_chunk, intervalos):
+    # Desloca os tempos de cada chunk pelo início dele no áudio; onde o chunk começa antes do fim do
+    # anterior (corte sem pausa), tira a repetição entre o último segmento de um e o primeiro do outro.
+    # Sem o intervalo (só o caminho do chunk), o deslocamento é o fim do último segmento anterior.
+    costurados = []
+    for i, segmentos in enumerate(segmentos_por_chunk):
+        inicio_chunk = intervalos[i][0]
+        deslocamento = inicio_chunk if inicio_chunk is not None else (costurados[-1][1] if costurados else 0.0)
+        absolutos = [[deslocamento + inicio, deslocamento + fim, texto.strip()]
+                     for inicio, fim, texto in segmentos if texto.strip()]
+        sobreposto = i > 0 and inicio_chunk is not None and inicio_chunk < intervalos[i - 1][1]
+        if sobreposto and costurados and absolutos:
+            costurados[-1][2], absolutos[0][2] = _costurar(costurados[-1][2], absolutos[0][2])
+            absolutos = [segmento for segmento in absolutos if segmento[2]]
+        costurados.extend(absolutos)
+    return [tuple(segmento) for segmento in costurados]
+
+def transcrever_chunks_segmentos(chunks, client, status_callback=None, max_workers=MAX_TRANSCRICOES_SIMULTANEAS,
+                                 prontos=None, ao_transcrever_chunk=None):
+    # `chunks` pode ser um gerador de caminhos ou de (caminho, inicio, fim): cada um é enviado assim que chega.
+    # Devolve os segmentos (inicio, fim, texto) do áudio inteiro, já costurados.
+    # Índices presentes em `prontos` (segmentos vindos do cache) não são reenviados.
+    indices = {}
+    textos = dict(prontos or {})
+    intervalos = []
+    total = 0
+
+    def coletar(concluidos, divisao_concluida):
+        for futuro in concluidos:
+            indice = indices.pop(futuro)
+            textos[indice] = futuro.result()
+            if ao_transcrever_chunk:
+                ao_transcrever_chunk(indice, textos[indice])
+            if status_callback:
+                sufixo = "" if divisao_concluida else " (dividindo o áudio...)"
+                status_callback(f"Transcrição: {len(textos)}/{max(total, len(textos))} partes concluídas{sufixo}")
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        for i, chunk in enumerate(chunks):
+            chunk_path, inicio, fim = chunk if isinstance(chunk, tuple) else (chunk, None, None)
+            intervalos.append((inicio, fim))
+            total = i + 1
+            if i not in textos:
+                indices[executor.submit(_transcrever_chunk, chunk_path, client)] = i
+            coletar([f for f in indices if f.done()], False)
+        coletar(as_completed(list(indices)), True)
+    finally:
+        # Se uma parte falhou de vez, as que ainda estão na fila não são enviadas
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return costurar_segmentos([textos[i] for i in range(total)], intervalos)
+
+def transcrever_chunks(chunks, client, status_callback=None, max_workers=MAX_TRANSCRICOES_SIMULTANEAS):
+    segmentos = transcrever_chunks_segmentos(chunks, client, status_callback=status_callback, max_workers=max_workers)
+    return " ".join(texto for _, _, texto in segmentos)
+
+def transcrever_audio_indexado(arquivo_audio, client, status_callback=None, max_workers=MAX_TRANSCRICOES_SIMULTANEAS,
+                               cache=None, usar_cache=True, duracao_maxima=None):
+    # Devolve a TranscricaoIndexada (segmentos com tempo no áudio original). Com cache, o índice fica
+    # gravado em disco (indice.caminho) e pode ser reaberto sem carregar a transcrição inteira.
+    # Com usar_cache=False o cache não é consultado, mas o resultado novo substitui o antigo.
+    # `arquivo_audio` é um caminho ou uma AudioEntrada; áudios pequenos vão inteiros numa chamada, sem ffmpeg
+    entrada = arquivo_audio if isinstance(arquivo_audio, AudioEntrada) else AudioEntrada.de_caminho(arquivo_audio)
+    chave = chave_chunks = None
+    prontos = {}
+    if cache is not None:
+        chave = cache.chave(entrada, "whisper-1", "pt")
+        # Os índices só valem para a mesma divisão do áudio
+        chave_chunks = f"{chave}:segmentos:{duracao_maxima}"
+        if usar_cache:
+            transcricao = cache.obter(chave)
+            if transcricao is not None:
+                if status_callback:
+                    status_callback("Transcrição recuperada do cache.")
+                # Entradas gravadas antes dos segmentos só têm o texto
+                return cache.obter_indice(chave) or TranscricaoIndexada.de_segmentos([(0.0, 0.0, transcricao)])
+            prontos = {i: json.loads(segmentos) for i, segmentos in cache.obter_chunks(chave_chunks).items()}
+
+    segmentos = None
+    if entrada.envio_direto and duracao_maxima is None and not prontos:
+        try:
+            segmentos = _transcrever_chunk(entrada, client)
+            if status_callback:
+                status_callback("Transcrição: 1/1 partes concluídas")
+        except Exception as e:
+            # Formato que o Whisper não reconhece: segue pela divisão, que recodifica se precisar
+            if status_erro(e) != 400:
+                raise
+    if segmentos is None:
+        segmentos = _transcrever_dividindo(entrada, client, status_callback, max_workers, cache, chave_chunks,
+                                           prontos, duracao_maxima)
+
+    indice = TranscricaoIndexada.de_segmentos(segmentos)
+    if cache is not None:
+        cache.salvar(chave, indice.texto(), indice=indice)
+    return indice
+
+def _transcrever_dividindo(entrada, client, status_callback, max_workers, cache, chave_chunks, prontos, duracao_maxima):
+    pasta_chunks = tempfile.mkdtemp(prefix="chunks_")
+    chunks = dividir_audio_em_chunks(entrada.caminho(), duracao_maxima=duracao_maxima, pasta_destino=pasta_chunks,
+                                     pular=prontos)
+    try:
+        segmentos = transcrever_chunks_segmentos(
+            chunks, client,
+            status_callback=status_callback, max_workers=max_workers,
+            prontos=prontos,
+            ao_transcrever_chunk=(
+                (lambda i, segmentos: cache.salvar_chunk(chave_chunks, i, json.dumps(segmentos, ensure_ascii=False)))
+                if cache is not None else None
+            )
+        )
+    finally:
+        chunks.close()
+        shutil.rmtree(pasta_chunks, ignore_errors=True)
+    return segmentos
+
+def transcrever_audio_whisper(arquivo_audio, client, status_callback=None, max_workers=MAX_TRANSCRICOES_SIMULTANEAS,
+                              cache=None, usar_cache=True, duracao_maxima=None):
+    return transcrever_audio_indexado(
+        arquivo_audio, client, status_callback=status_callback, max_workers=max_workers,
+        cache=cache, usar_cache=usar_cache, duracao_maxima=duracao_maxima
+    ).texto()
+
+MAX_TOKENS_RESUMO = 16000
+MAX_TOKENS_NOTAS = 4000
+MAX_RESUMOS_SIMULTANEOS = 4
+TOKENS_POR_JANELA = 12000
+# Menor resposta aceitável; se o prompt não deixar esse espaço, a transcrição vai para o resumo em partes
+MIN_TOKENS_RESPOSTA_RESUMO = 8000
+MIN_TOKENS_RESPOSTA_AJUSTE = 4000
+# Parâmetros de amostragem das chamadas de resumo e ajuste (também fazem parte da chave do cache de resumos).
+# max_tokens é o teto: cada chamada usa o que couber no contexto do modelo.
+PARAMETROS_RESUMO = {"max_tokens": MAX_TOKENS_RESUMO, "temperature": 0.9, "top_p": 0.9}
+
+def _montar_prompt_resumo(transcricao, notas_parciais=False):
+    aviso_notas = ""
+    if notas_parciais:
+        aviso_notas = (
+            "(O texto abaixo são anotações detalhadas de trechos consecutivos da aula, na ordem em que foram ditos. "
+            "Trate o conjunto como a transcrição completa.)\n    "
+        )
+    return f"""
     Resuma o seguinte texto em um formato estruturado, transformando-o em algo prático e descontraído para um assistente de IA que fala a língua do dia a dia. Foque nos exemplos práticos da transcrição, trazendo tudo de forma completa e detalhada, sem deixar nada de fora:
 
     ### Estrutura Obrigatória ###
@@ -96,140 +336,421 @@ def gerar_resumo(transcricao, client, model):
     - Cada resposta das perguntas tem que ter no mínimo 250 palavras, num papo leve e direto.
 
     ### Texto para Resumir ###
-    {transcricao}
+    {aviso_notas}{transcricao}
 
     ### Formato de Resposta ###
     Responda só com as seções numeradas, sem enrolação fora delas. Cada seção tem que vir recheada de conteúdo, nada de títulos pelados. NÃO inclua nenhuma seção chamada 'Resumo técnico', apenas 'Resumo prático e completo da transcrição'.
     """
-    resposta = client.chat.completions.create(
-        model=model,  # Usa o modelo escolhido pelo usuário
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=16000,
-        temperature=0.9,
-        top_p=0.9
-    )
-    texto_resumo = resposta.choices[0].message.content
 
-    secoes = {
-        "pontos_principais": "",
-        "resumo_pratico": "",
-        "perguntas_respostas": "",
-        "exemplos_copy": ""
-    }
-    
-    linhas = texto_resumo.split("\n")
-    secao_atual = None
-    
-    for i, linha in enumerate(linhas):
+SECOES_RESUMO = [
+    ("pontos_principais", "1) Pontos principais em formato de tópicos detalhados"),
+    ("resumo_pratico", "2) Resumo prático e completo da transcrição"),
+    ("perguntas_respostas", "3) Perguntas e respostas baseadas no texto"),
+    ("exemplos_copy", "4) Exemplos de copy"),
+]
+
+class ParserSecoes:
+    # Máquina de estados que separa as quatro seções numeradas à medida que o texto chega.
+    # O cabeçalho é reconhecido em qualquer posição da linha ("### 1) ...", "**1) ...**").
+    def __init__(self):
+        self.secoes = {chave: "" for chave, _ in SECOES_RESUMO}
+        self.secao_atual = None
+        self._resto = ""
+
+    def _processar_linha(self, linha):
         linha_strip = linha.strip()
-        
-        if "1) Pontos principais em formato de tópicos detalhados" in linha_strip:
-            secao_atual = "pontos_principais"
-            continue
-        elif "2) Resumo prático e completo da transcrição" in linha_strip:
-            secao_atual = "resumo_pratico"
-            continue
-        elif "3) Perguntas e respostas baseadas no texto" in linha_strip:
-            secao_atual = "perguntas_respostas"
-            continue
-        elif "4) Exemplos de copy" in linha_strip:
-            secao_atual = "exemplos_copy"
-            continue
-        
-        if secao_atual and linha_strip:
-            secoes[secao_atual] += linha + "\n"
-    
-    for chave in secoes:
-        secoes[chave] = secoes[chave].strip()
-        if not secoes[chave]:
-            secoes[chave] = f"Conteúdo não gerado para a seção '{chave}'."
+        for chave, cabecalho in SECOES_RESUMO:
+            if cabecalho in linha_strip:
+                self.secao_atual = chave
+                return chave
+        if self.secao_atual and linha_strip:
+            self.secoes[self.secao_atual] += linha + "\n"
+            return self.secao_atual
+        return None
 
-    return secoes
+    def alimentar(self, delta):
+        # Devolve as seções que mudaram com este pedaço de texto
+        self._resto += delta
+        *linhas, self._resto = self._resto.split("\n")
+        alteradas = set()
+        for linha in linhas:
+            chave = self._processar_linha(linha)
+            if chave:
+                alteradas.add(chave)
+        return alteradas
 
-def ajustar_resumo(historico, instrucao_usuario, client, model):
-    historico_texto = "\n\n".join([f"{msg['role'].upper()}: {msg['content'] if isinstance(msg['content'], str) else json.dumps(msg['content'])}" for msg in historico])
+    def finalizar(self, padroes=None):
+        if self._resto:
+            self._processar_linha(self._resto)
+            self._resto = ""
+        secoes = {}
+        for chave, texto in self.secoes.items():
+            secoes[chave] = texto.strip()
+            if not secoes[chave]:
+                secoes[chave] = padroes[chave] if padroes else f"Conteúdo não gerado para a seção '{chave}'."
+        return secoes
 
-    resumo_anterior = None
-    for mensagem in reversed(historico):
-        if mensagem["role"] == "assistant" and isinstance(mensagem["content"], dict):
-            resumo_anterior = mensagem["content"]
-            break
-    
-    if not resumo_anterior:
-        resumo_anterior = {
-            "pontos_principais": "Resumo original não encontrado.",
-            "resumo_pratico": "Resumo original não encontrado.",
-            "perguntas_respostas": "Resumo original não encontrado.",
-            "exemplos_copy": "Resumo original não encontrado."
-        }
+def _extrair_secoes(texto_resumo, padroes=None):
+    with medir("parse_secoes", caracteres=len(texto_resumo)):
+        parser = ParserSecoes()
+        parser.alimentar(texto_resumo)
+        return parser.finalizar(padroes)
 
+def _parametros_chamada(max_tokens):
+    return {**PARAMETROS_RESUMO, "max_tokens": max_tokens}
+
+def _transmitir_secoes(client, model, prompt, max_tokens, padroes=None, etapa="chat_stream", estatisticas=None):
+    # Gera (secoes_alteradas, secoes) a cada linha completa recebida; o último item traz o resultado final.
+    # `estatisticas`, se dado, recebe os atributos do span (tokens, custo, tempo até o primeiro token)
+    with medir(etapa, modelo=model, caracteres_prompt=len(prompt), atual=False) as span:
+        inicio = time.perf_counter()
+        with como_atual(span):
+            resposta = client.chat.completions.create(
+                model=model,
+                messages=[{"role": "user", "content": prompt}],
+                stream=True,
+                stream_options={"include_usage": True},
+                **_parametros_chamada(max_tokens)
+            )
+        parser = ParserSecoes()
+        tempo_parse = 0.0
+        caracteres = 0
+        for pedaco in resposta:
+            # Com include_usage, o último pedaço vem sem choices e com o uso de tokens
+            registrar_uso(span, pedaco)
+            if not pedaco.choices:
+                continue
+            delta = pedaco.choices[0].delta.content
+            if delta:
+                span.setdefault("tempo_primeiro_token", time.perf_counter() - inicio)
+                caracteres += len(delta)
+                inicio_parse = time.perf_counter()
+                alteradas = parser.alimentar(delta)
+                tempo_parse += time.perf_counter() - inicio_parse
+                if alteradas:
+                    yield alteradas, {chave: texto.strip() for chave, texto in parser.secoes.items()}
+        inicio_parse = time.perf_counter()
+        secoes = parser.finalizar(padroes)
+        registro.registrar("parse_secoes", tempo_parse + time.perf_counter() - inicio_parse, caracteres=caracteres)
+        if estatisticas is not None:
+            estatisticas.update(span)
+    yield {chave for chave, _ in SECOES_RESUMO}, secoes
+
+def _dividir_em_janelas(texto, tokens_por_janela, model=None):
+    # Junta frases inteiras até o limite; frases maiores que a janela (transcrição sem pontuação) são quebradas por palavras
+    frases = [f for f in re.split(r"(?<=[.!?…])\s+", texto) if f.strip()]
+    janelas = []
+    atual, tokens_atual = [], 0
+    for frase, tokens_frase in zip(frases, contar_tokens_lote(frases, model)):
+        if tokens_frase > tokens_por_janela:
+            palavras = frase.split()
+            passo = max(1, len(palavras) * tokens_por_janela // tokens_frase)
+            pedacos = [" ".join(palavras[i:i + passo]) for i in range(0, len(palavras), passo)]
+            contagens = contar_tokens_lote(pedacos, model)
+        else:
+            pedacos, contagens = [frase], [tokens_frase]
+        for pedaco, tokens_pedaco in zip(pedacos, contagens):
+            if atual and tokens_atual + tokens_pedaco > tokens_por_janela:
+                janelas.append(" ".join(atual))
+                atual, tokens_atual = [], 0
+            atual.append(pedaco)
+            tokens_atual += tokens_pedaco
+    if atual:
+        janelas.append(" ".join(atual))
+    return janelas
+
+def _max_tokens_resumo(texto, model, notas_parciais=False):
+    # Instruções contadas à parte: a contagem da transcrição (a parte cara) fica em cache entre chamadas
+    tokens_prompt = (contar_tokens(_montar_prompt_resumo("", notas_parciais=notas_parciais), model)
+                     + contar_tokens(texto, model) + TOKENS_POR_MENSAGEM)
+    return escolher_max_tokens(model, tokens_prompt, MAX_TOKENS_RESUMO, MIN_TOKENS_RESPOSTA_RESUMO)
+
+def _cabe_em_uma_chamada(texto, model, notas_parciais=True):
+    return _max_tokens_resumo(texto, model, notas_parciais=notas_parciais) is not None
+
+def _resumir_janela(janela, indice, total, client, model):
     prompt = f"""
-    Aqui está o histórico completo de interações:
+    Você está lendo o trecho {indice} de {total} da transcrição de uma aula. Faça anotações detalhadas desse trecho para que depois elas sejam juntadas num resumo da aula inteira.
 
-    {historico_texto}
+    ### Instruções ###
+    - Registre TODOS os conceitos, técnicas, exemplos práticos (com os detalhes e números citados), frases marcantes do professor, gatilhos mentais, estruturas de copy, dúvidas respondidas e exercícios.
+    - Mantenha a ordem em que as coisas aparecem e não invente nada que não esteja no trecho.
+    - Escreva em tópicos objetivos, sem introdução nem conclusão.
 
-    Aqui está o resumo mais recente a ser ajustado:
-    1) Pontos principais em formato de tópicos detalhados:
-    {resumo_anterior['pontos_principais']}
+    ### Trecho {indice} de {total} ###
+    {janela}
+    """
+    with medir("chat_notas", modelo=model, caracteres_prompt=len(prompt)) as span:
+        resposta = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=MAX_TOKENS_NOTAS,
+            temperature=0.3,
+            top_p=0.9
+        )
+        registrar_uso(span, resposta)
+    return resposta.choices[0].message.content.strip()
 
-    2) Resumo prático e completo da transcrição:
-    {resumo_anterior['resumo_pratico']}
+def _condensar_transcricao(transcricao, client, model, status_callback=None, max_workers=MAX_RESUMOS_SIMULTANEOS,
+                           tokens_por_janela=TOKENS_POR_JANELA):
+    # Etapa "map": resume janelas em paralelo até as anotações caberem na chamada final
+    texto = transcricao
+    nivel = 1
+    while not _cabe_em_uma_chamada(texto, model):
+        janelas = _dividir_em_janelas(texto, tokens_por_janela, model)
+        notas = [None] * len(janelas)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futuros = {
+                executor.submit(_resumir_janela, janela, i + 1, len(janelas), client, model): i
+                for i, janela in enumerate(janelas)
+            }
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                notas[futuros[futuro]] = futuro.result()
+                if status_callback:
+                    status_callback(f"Resumindo trechos (nível {nivel}): {concluidos}/{len(janelas)} concluídos")
+        texto = "\n\n".join(f"[Trecho {i + 1}]\n{nota}" for i, nota in enumerate(notas))
+        nivel += 1
+    return texto
 
-    3) Perguntas e respostas baseadas no texto:
-    {resumo_anterior['perguntas_respostas']}
+def _preparar_prompt_resumo(transcricao, client, model, status_callback=None):
+    # Transcrições que não deixam espaço para a resposta no contexto do modelo passam antes por um map-reduce.
+    # Devolve o prompt e o max_tokens que cabe junto com ele.
+    max_tokens = _max_tokens_resumo(transcricao, model)
+    notas_parciais = max_tokens is None
+    if notas_parciais:
+        transcricao = _condensar_transcricao(transcricao, client, model, status_callback=status_callback)
+        max_tokens = _max_tokens_resumo(transcricao, model, notas_parciais=True)
+        if status_callback:
+            status_callback("Juntando os trechos no resumo final...")
+    return _montar_prompt_resumo(transcricao, notas_parciais=notas_parciais), max_tokens
 
-    4) Exemplos de copy:
-    {resumo_anterior['exemplos_copy']}
+def versao_prompt_resumo():
+    # Muda sempre que o texto do prompt de resumo muda, invalidando resumos guardados com o prompt antigo
+    return hashlib.sha256(_montar_prompt_resumo("{transcricao}").encode("utf-8")).hexdigest()[:16]
+
+def _chave_cache_resumo(cache, transcricao, model):
+    return cache.chave(transcricao, model, versao_prompt_resumo(), PARAMETROS_RESUMO)
+
+def gerar_resumo(transcricao, client, model, status_callback=None, cache=None, forcar_novo=False):
+    # Com cache, devolve a geração mais recente já guardada; forcar_novo=True gera e guarda mais uma variante
+    if cache is not None:
+        chave = _chave_cache_resumo(cache, transcricao, model)
+        if not forcar_novo:
+            resumo = cache.obter(chave)
+            if resumo is not None:
+                return resumo
+
+    prompt, max_tokens = _preparar_prompt_resumo(transcricao, client, model, status_callback=status_callback)
+    with medir("chat_resumo", modelo=model, caracteres_prompt=len(prompt), max_tokens=max_tokens) as span:
+        resposta = client.chat.completions.create(
+            model=model,  # Usa o modelo escolhido pelo usuário
+            messages=[{"role": "user", "content": prompt}],
+            **_parametros_chamada(max_tokens)
+        )
+        registrar_uso(span, resposta)
+    resumo = _extrair_secoes(resposta.choices[0].message.content)
+    if cache is not None:
+        cache.salvar(chave, resumo)
+    return resumo
+
+def gerar_resumo_stream(transcricao, client, model, status_callback=None, cache=None, forcar_novo=False,
+                        estatisticas=None):
+    if cache is not None:
+        chave = _chave_cache_resumo(cache, transcricao, model)
+        if not forcar_novo:
+            resumo = cache.obter(chave)
+            if resumo is not None:
+                if estatisticas is not None:
+                    estatisticas["cache"] = True
+                yield {chave_secao for chave_secao, _ in SECOES_RESUMO}, resumo
+                return
+
+    prompt, max_tokens = _preparar_prompt_resumo(transcricao, client, model, status_callback=status_callback)
+    for alteradas, resumo in _transmitir_secoes(client, model, prompt, max_tokens, etapa="chat_resumo",
+                                                estatisticas=estatisticas):
+        yield alteradas, resumo
+    if cache is not None:
+        cache.salvar(chave, resumo)
+
+def variantes_resumo(transcricao, model, cache):
+    return cache.variantes(_chave_cache_resumo(cache, transcricao, model))
+
+# Palavras que indicam a(s) seção(ões) que a instrução quer mudar. Sem acentos: são comparadas com a instrução
+# normalizada, como palavras inteiras (singular ou plural), para "tudo" não casar com "estudo"
+PALAVRAS_SECOES = {
+    "pontos_principais": ["ponto", "topico", "introducao", "conceito", "tecnica", "gatilho", "frase-chave",
+                          "frases-chave"],
+    "resumo_pratico": ["resumo pratico", "historia da aula"],
+    "perguntas_respostas": ["pergunta", "resposta", "faq", "duvida"],
+    "exemplos_copy": ["copy", "copies", "anuncio", "headline"],
+}
+PALAVRAS_RESUMO_INTEIRO = ["tudo", "todas as secoes", "resumo inteiro", "resumo todo", "todo o resumo", "geral"]
+# Seções citadas pelo número: "seção 2", "seções 2 e 4", "partes 1, 3 e 4", "item 3"
+PADRAO_NUMEROS_SECOES = re.compile(r"\b(?:secao|secoes|parte|partes|item|itens)\s+(\d+(?:\s*(?:,|e)\s*\d+)*)\b")
+MAX_INSTRUCOES_HISTORICO = 8
+# Trechos da transcrição recuperados para a instrução: o suficiente para ancorar o ajuste, bem menos que a aula
+MAX_TRECHOS_AJUSTE = 4
+
+# Uma instrução pode aprovar uma seção e pedir mudança em outra ("os pontos estão bons; mude as copies"): a
+# instrução é quebrada em orações e só contam as seções citadas numa oração que pede edição sem negá-la
+PADRAO_ORACOES = re.compile(r"[.;:!?\n]|,(?!\s*\d)|\b(?:mas|porem|so que)\b")
+PADRAO_EDICAO = re.compile(
+    r"\b(?:(?:mud|alter|refa[cz]|reescrev|ajust|melhor|corrig|corrij|acrescent|adicion|inclu|remov|tir[ae]|encurt"
+    r"|aument|expand|troc|troqu|reduz|simplific|simplifiqu|detalh|revis|atualiz|traduz|reformul|substitu|coloqu"
+    r"|coloc|reorganiz|enxug|mex|escrev|deix|crie|gere|faca|utiliz)\w*|us[ae]r?|mais|menos|outr[oa]s?|nov[oa]s?)\b"
+)
+PADRAO_APROVACAO = re.compile(
+    r"\b(?:bom|bons|boa|boas|otim[oa]s?|perfeit[oa]s?|excelentes?|gostei|mantenha|manter|mantem|pode ficar"
+    r"|como est(?:a|ao))\b"
+)
+
+def _cita_alguma(instrucao, palavras):
+    return re.search(r"\b(?:" + "|".join(re.escape(palavra) for palavra in palavras) + r")(?:s|es)?\b", instrucao)
+
+def _negado(oracao, inicio):
+    # "não mude", "nem mexa", "não precisa mudar": negação até duas palavras antes
+    return re.search(r"\b(?:nao|nem|sem)\s+(?:\w+\s+)?$", oracao[:inicio]) is not None
+
+def _classificar_oracao(oracao):
+    # None: oração neutra (sem pedido nem aprovação); True: pede edição; False: aprova ou nega a mudança
+    if any(not _negado(oracao, m.start()) for m in PADRAO_APROVACAO.finditer(oracao)):
+        return False
+    pedidos = list(PADRAO_EDICAO.finditer(oracao))
+    if not pedidos:
+        return None
+    return any(not _negado(oracao, m.start()) for m in pedidos)
+
+def identificar_secoes_alvo(instrucao_usuario):
+    # Heurística local (sem chamada extra à API); na dúvida ajusta as quatro seções
+    instrucao = unicodedata.normalize("NFKD", instrucao_usuario.lower()).encode("ascii", "ignore").decode("ascii")
+    todas = [chave for chave, _ in SECOES_RESUMO]
+    numeros = set()
+    alvo = set()
+    for oracao in PADRAO_ORACOES.split(instrucao):
+        pede_edicao = _classificar_oracao(oracao)
+        if pede_edicao is False:
+            continue
+        # Seção citada pelo número vale também em oração sem verbo de edição ("seção 3 em linguagem simples")
+        numeros.update(int(numero) for citacao in PADRAO_NUMEROS_SECOES.findall(oracao)
+                       for numero in re.findall(r"\d+", citacao))
+        if not pede_edicao:
+            continue
+        if _cita_alguma(oracao, PALAVRAS_RESUMO_INTEIRO):
+            return todas
+        alvo.update(chave for chave in todas if _cita_alguma(oracao, PALAVRAS_SECOES[chave]))
+    return [chave for posicao, chave in enumerate(todas, 1) if posicao in numeros or chave in alvo] or todas
+
+def _resumo_anterior(historico):
+    for mensagem in reversed(historico):
+        if mensagem["role"] == "assistant" and isinstance(mensagem["content"], dict):
+            return mensagem["content"]
+    return {chave: "Resumo original não encontrado." for chave, _ in SECOES_RESUMO}
+
+def _compactar_historico(historico, max_instrucoes=MAX_INSTRUCOES_HISTORICO):
+    # Só as instruções anteriores do usuário: os resumos antigos já estão refletidos no mais recente.
+    # A última mensagem é a instrução atual, enviada à parte.
+    instrucoes = [msg["content"] for msg in historico[:-1] if msg["role"] == "user" and isinstance(msg["content"], str)]
+    return "\n".join(f"- {instrucao}" for instrucao in instrucoes[-max_instrucoes:])
+
+def _formatar_trechos(trechos):
+    return "\n\n    ".join(
+        (f"[{formatar_tempo(trecho['inicio'])}] " if trecho.get("inicio") is not None else "") + trecho["texto"]
+        for trecho in trechos
+    )
+
+def _montar_prompt_ajuste(historico, instrucao_usuario, resumo_anterior, secoes_alvo,
+                         max_instrucoes=MAX_INSTRUCOES_HISTORICO, trechos=None):
+    cabecalhos = dict(SECOES_RESUMO)
+    secoes_texto = "\n\n    ".join(f"{cabecalhos[chave]}:\n    {resumo_anterior[chave]}" for chave in secoes_alvo)
+    formato = "\n    ".join(f"{cabecalhos[chave]}:" for chave in secoes_alvo)
+    historico_texto = _compactar_historico(historico, max_instrucoes) if max_instrucoes else ""
+    historico_texto = historico_texto or "- (nenhum ajuste anterior)"
+    contexto = ""
+    if trechos:
+        contexto = f"""
+    Trechos da transcrição da aula relacionados à instrução (use-os como fonte para exemplos e detalhes; não invente o que não estiver neles nem no resumo):
+    {_formatar_trechos(trechos)}
+"""
+
+    return f"""
+    Ajustes já pedidos anteriormente pelo usuário (já aplicados no texto abaixo):
+    {historico_texto}
+{contexto}
+    Aqui está a parte do resumo a ser ajustada:
+    {secoes_texto}
 
     ### Instrução do Usuário ###
     '{instrucao_usuario}'
 
     ### Objetivo ###
-    Ajuste o resumo acima APENAS conforme a instrução do usuário. Não gere um novo resumo do zero nem modifique partes que não foram explicitamente solicitadas na instrução. Preserve o formato estruturado com as quatro seções numeradas (1, 2, 3, 4) e mantenha o conteúdo original das seções não afetadas pela instrução. Forneça apenas o resumo ajustado nas seções numeradas, sem comentários adicionais fora delas.
+    Ajuste o texto acima APENAS conforme a instrução do usuário. Não gere um novo resumo do zero nem modifique partes que não foram explicitamente solicitadas na instrução. Devolva somente as seções abaixo, cada uma começando exatamente com o seu cabeçalho numerado, sem comentários adicionais fora delas:
+    {formato}
     """
-    resposta = client.chat.completions.create(
-        model=model,  # Usa o modelo escolhido pelo usuário
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=16000,
-        temperature=0.9,
-        top_p=0.9
-    )
-    texto_resumo = resposta.choices[0].message.content
 
-    secoes = {
-        "pontos_principais": "",
-        "resumo_pratico": "",
-        "perguntas_respostas": "",
-        "exemplos_copy": ""
-    }
-    linhas = texto_resumo.split("\n")
-    secao_atual = None
-    
-    for linha in linhas:
-        linha_strip = linha.strip()
-        if linha_strip.startswith("1) Pontos principais em formato de tópicos detalhados:"):
-            secao_atual = "pontos_principais"
-            continue
-        elif linha_strip.startswith("2) Resumo prático e completo da transcrição:"):
-            secao_atual = "resumo_pratico"
-            continue
-        elif linha_strip.startswith("3) Perguntas e respostas baseadas no texto:"):
-            secao_atual = "perguntas_respostas"
-            continue
-        elif linha_strip.startswith("4) Exemplos de copy:"):
-            secao_atual = "exemplos_copy"
-            continue
-        elif secao_atual and linha_strip:
-            secoes[secao_atual] += linha + "\n"
-    
-    for chave in secoes:
-        secoes[chave] = secoes[chave].strip()
-        if not secoes[chave]:
-            secoes[chave] = resumo_anterior[chave]  # Preserva o conteúdo original se não ajustado
+def _preparar_prompt_ajuste(historico, instrucao_usuario, resumo_anterior, secoes_alvo, model, trechos=None):
+    # Descarta as instruções antigas mais velhas até sobrar espaço para a resposta; depois, os trechos
+    # menos relevantes da transcrição
+    trechos = list(trechos or [])[:MAX_TRECHOS_AJUSTE]
+    tentativas = [(max_instrucoes, trechos) for max_instrucoes in range(MAX_INSTRUCOES_HISTORICO, -1, -1)]
+    tentativas += [(0, trechos[:quantidade]) for quantidade in range(len(trechos) - 1, -1, -1)]
+    for max_instrucoes, trechos_usados in tentativas:
+        prompt = _montar_prompt_ajuste(
+            historico, instrucao_usuario, resumo_anterior, secoes_alvo, max_instrucoes, trechos_usados
+        )
+        max_tokens = escolher_max_tokens(
+            model, contar_tokens(prompt, model) + TOKENS_POR_MENSAGEM, MAX_TOKENS_RESUMO, MIN_TOKENS_RESPOSTA_AJUSTE
+        )
+        if max_tokens is not None:
+            return prompt, max_tokens
+    raise ValueError(f"A instrução e o resumo atual não cabem no contexto do modelo {model}. Use uma instrução mais curta.")
+
+def _mesclar_ajuste(secoes, resumo_anterior, secoes_alvo):
+    # Seções fora do alvo ficam como estavam, mesmo que o modelo as tenha reescrito
+    return {chave: secoes[chave] if chave in secoes_alvo else resumo_anterior[chave] for chave, _ in SECOES_RESUMO}
+
+def _avisar_reescritas_fora_do_alvo(secoes, resumo_anterior, secoes_alvo):
+    # O descarte é intencional, mas fica registrado: costuma indicar que a heurística errou o alvo da instrução
+    descartadas = [chave for chave, _ in SECOES_RESUMO if chave not in secoes_alvo
+                   and secoes.get(chave, resumo_anterior[chave]).strip() != resumo_anterior[chave].strip()]
+    if descartadas:
+        log.warning("O ajuste reescreveu seções fora do alvo (%s); a versão anterior delas foi mantida",
+                    ", ".join(descartadas))
 
-    return secoes
+def ajustar_resumo(historico, instrucao_usuario, client, model, secoes_alvo=None, trechos=None):
+    # Só as seções visadas pela instrução são reenviadas e regeneradas; as demais são reaproveitadas.
+    # `trechos`: passagens da transcrição recuperadas para a instrução (dicts com "texto" e "inicio")
+    resumo_anterior = _resumo_anterior(historico)
+    secoes_alvo = secoes_alvo or identificar_secoes_alvo(instrucao_usuario)
+    prompt, max_tokens = _preparar_prompt_ajuste(
+        historico, instrucao_usuario, resumo_anterior, secoes_alvo, model, trechos
+    )
+    with medir("chat_ajuste", modelo=model, caracteres_prompt=len(prompt), secoes=len(secoes_alvo),
+               max_tokens=max_tokens, trechos=len(trechos or [])) as span:
+        resposta = client.chat.completions.create(
+            model=model,  # Usa o modelo escolhido pelo usuário
+            messages=[{"role": "user", "content": prompt}],
+            **_parametros_chamada(max_tokens)
+        )
+        registrar_uso(span, resposta)
+    secoes = _extrair_secoes(resposta.choices[0].message.content, padroes=resumo_anterior)
+    _avisar_reescritas_fora_do_alvo(secoes, resumo_anterior, secoes_alvo)
+    return _mesclar_ajuste(secoes, resumo_anterior, secoes_alvo)
+
+def ajustar_resumo_stream(historico, instrucao_usuario, client, model, secoes_alvo=None, trechos=None):
+    resumo_anterior = _resumo_anterior(historico)
+    secoes_alvo = secoes_alvo or identificar_secoes_alvo(instrucao_usuario)
+    # As seções reaproveitadas aparecem de imediato; as visadas chegam pelo stream
+    yield {chave for chave, _ in SECOES_RESUMO if chave not in secoes_alvo}, dict(resumo_anterior)
+    prompt, max_tokens = _preparar_prompt_ajuste(
+        historico, instrucao_usuario, resumo_anterior, secoes_alvo, model, trechos
+    )
+    secoes = resumo_anterior
+    for alteradas, secoes in _transmitir_secoes(client, model, prompt, max_tokens, padroes=resumo_anterior,
+                                                etapa="chat_ajuste"):
+        yield alteradas, _mesclar_ajuste(secoes, resumo_anterior, secoes_alvo)
+    _avisar_reescritas_fora_do_alvo(secoes, resumo_anterior, secoes_alvo)
 
-def salvar_resumo_json(dados, nome_arquivo, return_bytes=False):
+def salvar_resumo_json(dados, nome_arquivo, return_bytes=False, pasta_destino=None):
     nome_arquivo = "".join(c if c.isalnum() or c in " _-" else "_" for c in nome_arquivo)
     
     dados_json = {
@@ -248,6 +769,8 @@ def salvar_resumo_json(dados, nome_arquivo, return_bytes=False):
         return io.BytesIO(json_str.encode('utf-8'))
     else:
         caminho = f"{nome_arquivo}.json"
+        if pasta_destino:
+            caminho = os.path.join(pasta_destino, caminho)
         with open(caminho, "w", encoding="utf-8") as f:
             json.dump(dados_json, f, ensure_ascii=False, indent=4)
         return caminho
@@ -0,0 +1,108 @@
+import mmap
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+ARQUIVOS_INDICE = ("inicio.npy", "fim.npy", "deslocamentos.npy", "texto.bin")
+
+def formatar_tempo(segundos):
+    segundos = int(segundos)
+    horas, resto = divmod(segundos, 3600)
+    minutos, segundos = divmod(resto, 60)
+    return f"{horas}:{minutos:02d}:{segundos:02d}" if horas else f"{minutos:02d}:{segundos:02d}"
+
+class TranscricaoIndexada:
+    # Segmentos com tempo guardados em colunas: inicio/fim (segundos) e o deslocamento de cada texto num
+    # único buffer UTF-8, com os textos separados por espaço. Um intervalo de segmentos vira uma fatia do
+    # buffer, sem juntar strings. Aberta do disco, colunas e texto são mapeados em memória e só as páginas
+    # consultadas são lidas.
+    def __init__(self, inicio, fim, deslocamentos, texto, caminho=None):
+        self.inicio = inicio
+        self.fim = fim
+        self.deslocamentos = deslocamentos
+        self._texto = texto
+        self.caminho = caminho
+
+    @classmethod
+    def de_segmentos(cls, segmentos):
+        # `segmentos`: (inicio, fim, texto). Os fins são tornados não decrescentes para a busca binária
+        segmentos = sorted(
+            ((float(i), float(f), t.strip()) for i, f, t in segmentos if t and t.strip()), key=lambda s: s[0]
+        )
+        codificados = [texto.encode("utf-8") for _, _, texto in segmentos]
+        deslocamentos = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum([len(c) + 1 for c in codificados], out=deslocamentos[1:])
+        inicio = np.array([s[0] for s in segmentos], dtype=np.float64)
+        fim = np.maximum.accumulate(np.array([s[1] for s in segmentos], dtype=np.float64)) if segmentos else inicio
+        return cls(inicio, fim, deslocamentos, b"".join(c + b" " for c in codificados))
+
+    @classmethod
+    def abrir(cls, pasta):
+        colunas = [np.load(os.path.join(pasta, nome), mmap_mode="r") for nome in ARQUIVOS_INDICE[:3]]
+        with open(os.path.join(pasta, ARQUIVOS_INDICE[3]), "rb") as f:
+            # mmap não aceita arquivo vazio (transcrição sem fala)
+            texto = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+        return cls(*colunas, texto, caminho=pasta)
+
+    def salvar(self, pasta):
+        # Grava numa pasta temporária ao lado e troca de uma vez, para um leitor nunca ver o índice pela metade
+        pai = os.path.dirname(os.path.abspath(pasta))
+        os.makedirs(pai, exist_ok=True)
+        temporaria = tempfile.mkdtemp(prefix=".indice_", dir=pai)
+        for nome, coluna in zip(ARQUIVOS_INDICE, (self.inicio, self.fim, self.deslocamentos)):
+            np.save(os.path.join(temporaria, nome), np.asarray(coluna))
+        with open(os.path.join(temporaria, ARQUIVOS_INDICE[3]), "wb") as f:
+            f.write(self._texto)
+        shutil.rmtree(pasta, ignore_errors=True)
+        os.replace(temporaria, pasta)
+        self.caminho = pasta
+        return pasta
+
+    def __len__(self):
+        return len(self.inicio)
+
+    @property
+    def duracao(self):
+        return float(self.fim[-1]) if len(self) else 0.0
+
+    @property
+    def tamanho_bytes(self):
+        return int(self.inicio.nbytes + self.fim.nbytes + self.deslocamentos.nbytes + len(self._texto))
+
+    def _fatia(self, primeiro, ultimo):
+        if ultimo <= primeiro:
+            return ""
+        # -1: o separador depois do último segmento da fatia
+        return self._texto[int(self.deslocamentos[primeiro]):int(self.deslocamentos[ultimo]) - 1].decode("utf-8")
+
+    def indices_entre(self, inicio, fim):
+        # Segmentos que se sobrepõem a [inicio, fim), como intervalo [primeiro, ultimo)
+        primeiro = int(np.searchsorted(self.fim, inicio, side="right"))
+        ultimo = int(np.searchsorted(self.inicio, fim, side="left"))
+        return primeiro, max(primeiro, ultimo)
+
+    def texto(self, inicio=None, fim=None):
+        primeiro, ultimo = self.indices_entre(
+            -np.inf if inicio is None else inicio, np.inf if fim is None else fim
+        )
+        return self._fatia(primeiro, ultimo)
+
+    def janela(self, primeiro, quantidade):
+        # Carregamento preguiçoso para exibir transcrições enormes em páginas
+        ultimo = min(len(self), primeiro + quantidade)
+        return [
+            (float(self.inicio[i]), float(self.fim[i]), self._fatia(i, i + 1))
+            for i in range(max(0, primeiro), ultimo)
+        ]
+
+    def segmentos(self, inicio=None, fim=None):
+        primeiro, ultimo = self.indices_entre(
+            -np.inf if inicio is None else inicio, np.inf if fim is None else fim
+        )
+        return self.janela(primeiro, ultimo - primeiro)
+
+    def fechar(self):
+        if isinstance(self._texto, mmap.mmap):
+            self._texto.close()
@@ -0,0 +1,420 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from busca import id_aula, indice_trechos_aula
+from cache import PASTA_CACHE_PADRAO
+from functions import transcrever_audio_indexado, transcrever_audio_whisper, gerar_resumo_stream, \
+    ajustar_resumo_stream, SECOES_RESUMO, MAX_TRECHOS_AJUSTE
+from indice_transcricao import TranscricaoIndexada
+
+log = logging.getLogger(__name__)
+
+MAX_JOBS_SIMULTANEOS = int(os.environ.get("GERADOR_JOBS_WORKERS", "4"))
+# Cotas por usuário (dono do job): quantos rodam ao mesmo tempo e quantos podem esperar na fila; 0 desliga
+MAX_JOBS_POR_USUARIO = int(os.environ.get("GERADOR_JOBS_POR_USUARIO", "2"))
+MAX_FILA_POR_USUARIO = int(os.environ.get("GERADOR_FILA_POR_USUARIO", "5"))
+# Intervalo mínimo entre gravações de resultado parcial (o stream gera uma atualização por linha)
+INTERVALO_PARCIAL = 0.5
+
+ESTADOS_ATIVOS = ("pendente", "executando")
+
+# Indexação para a busca roda fora do job de resumo, numa fila própria: o resumo fica pronto sem esperar
+# pelos embeddings, e uma thread só evita fragmentos concorrentes no índice
+_executor_indexacao = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexacao")
+
+class CotaExcedida(RuntimeError):
+    pass
+
+class ExecutorJusto:
+    # Pool de threads com uma fila por dono, atendidas em rodízio: quem enfileira muitos jobs não atrasa os
+    # outros usuários, e ninguém ocupa mais de `max_por_dono` workers. Devolve Futures como o ThreadPoolExecutor
+    def __init__(self, max_workers, max_por_dono=0, max_fila_por_dono=0, thread_name_prefix="job"):
+        self.max_por_dono = max_por_dono
+        self.max_fila_por_dono = max_fila_por_dono
+        self._filas = OrderedDict()
+        self._rodando = Counter()
+        self._condicao = threading.Condition()
+        self._encerrado = False
+        self._threads = [
+            threading.Thread(target=self._trabalhar, name=f"{thread_name_prefix}_{i}", daemon=True)
+            for i in range(max(1, max_workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, dono, funcao, *args, **kwargs):
+        futuro = Future()
+        with self._condicao:
+            if self._encerrado:
+                raise RuntimeError("Executor encerrado")
+            fila = self._filas.setdefault(dono, deque())
+            if self.max_fila_por_dono and len(fila) >= self.max_fila_por_dono:
+                raise CotaExcedida(
+                    f"Você já tem {len(fila)} trabalho(s) na fila. Espere algum terminar para pedir outro."
+                )
+            fila.append((futuro, funcao, args, kwargs))
+            self._condicao.notify()
+        return futuro
+
+    def na_fila(self, dono):
+        with self._condicao:
+            return len(self._filas.get(dono, ()))
+
+    def cancelar(self, futuro):
+        # Tira o job da fila do dono, para ele deixar de contar na cota; o que um worker já pegou segue o cancel()
+        # do Future (só não roda se ainda não começou)
+        with self._condicao:
+            for dono, fila in self._filas.items():
+                for item in fila:
+                    if item[0] is futuro:
+                        fila.remove(item)
+                        if not fila:
+                            del self._filas[dono]
+                        return futuro.cancel()
+        return futuro.cancel()
+
+    def _proximo(self):
+        # O primeiro dono (na ordem do rodízio) com job esperando e abaixo da cota vai para o fim da fila
+        for dono, fila in self._filas.items():
+            if not self.max_por_dono or self._rodando[dono] < self.max_por_dono:
+                item = fila.popleft()
+                if fila:
+                    self._filas.move_to_end(dono)
+                else:
+                    del self._filas[dono]
+                return dono, item
+        return None
+
+    def _trabalhar(self):
+        while True:
+            with self._condicao:
+                proximo = self._proximo()
+                while proximo is None:
+                    if self._encerrado and not self._filas:
+                        return
+                    self._condicao.wait()
+                    proximo = self._proximo()
+                dono, (futuro, funcao, args, kwargs) = proximo
+                self._rodando[dono] += 1
+            try:
+                if futuro.set_running_or_notify_cancel():
+                    try:
+                        futuro.set_result(funcao(*args, **kwargs))
+                    except BaseException as e:
+                        futuro.set_exception(e)
+            finally:
+                with self._condicao:
+                    self._rodando[dono] -= 1
+                    # Um worker pode estar esperando só porque este dono estava na cota
+                    self._condicao.notify_all()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._condicao:
+            self._encerrado = True
+            if cancel_futures:
+                for fila in self._filas.values():
+                    for futuro, *_ in fila:
+                        futuro.cancel()
+                self._filas.clear()
+            self._condicao.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+class GerenciadorJobs:
+    # Executa os trabalhos pesados fora da thread do script do Streamlit e guarda estado,
+    # progresso e resultado de cada job em SQLite, para a interface consultar a cada rerun
+    # (ou depois de recarregar a página) sem bloquear. As etapas são quase só espera de rede
+    # e do ffmpeg, então um pool de threads basta, dividido entre os usuários pelo ExecutorJusto.
+    def __init__(self, caminho=None, max_workers=MAX_JOBS_SIMULTANEOS, max_por_usuario=MAX_JOBS_POR_USUARIO,
+                 max_fila_por_usuario=MAX_FILA_POR_USUARIO):
+        caminho = caminho or os.path.join(PASTA_CACHE_PADRAO, "jobs.sqlite3")
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, tipo TEXT NOT NULL, dono TEXT,
+                estado TEXT NOT NULL, progresso REAL NOT NULL DEFAULT 0, mensagem TEXT,
+                parcial TEXT, resultado TEXT, erro TEXT,
+                criado_em REAL NOT NULL, atualizado_em REAL NOT NULL
+            )
+        """)
+        # Jobs que estavam rodando quando o processo anterior morreu não vão terminar
+        self._conexao.execute(
+            "UPDATE jobs SET estado = 'interrompido', erro = 'Processo reiniciado durante a execução' "
+            "WHERE estado IN ('pendente', 'executando')"
+        )
+        self._executor = ExecutorJusto(max_workers, max_por_usuario, max_fila_por_usuario)
+        self._futuros = {}
+
+    def _executar_sql(self, sql, parametros=()):
+        with self._lock:
+            return self._conexao.execute(sql, parametros).fetchall()
+
+    def _atualizar(self, job_id, **campos):
+        campos["atualizado_em"] = time.time()
+        atribuicoes = ", ".join(f"{nome} = ?" for nome in campos)
+        self._executar_sql(f"UPDATE jobs SET {atribuicoes} WHERE id = ?", (*campos.values(), job_id))
+
+    def submeter(self, tipo, funcao, *args, dono=None, **kwargs):
+        # `funcao` recebe `atualizar(mensagem=None, progresso=None, parcial=None, imediato=False)` como keyword;
+        # o parcial é gravado no máximo a cada INTERVALO_PARCIAL, a não ser com imediato=True.
+        # Levanta CotaExcedida se o dono já tem a fila cheia
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        self._executar_sql(
+            "INSERT INTO jobs (id, tipo, dono, estado, criado_em, atualizado_em) VALUES (?, ?, ?, 'pendente', ?, ?)",
+            (job_id, tipo, dono, agora, agora),
+        )
+        try:
+            futuro = self._executor.submit(dono, self._rodar, job_id, funcao, args, kwargs)
+        except CotaExcedida:
+            self._executar_sql("DELETE FROM jobs WHERE id = ?", (job_id,))
+            raise
+        self._futuros[job_id] = futuro
+        futuro.add_done_callback(lambda _: self._futuros.pop(job_id, None))
+        return job_id
+
+    def _rodar(self, job_id, funcao, args, kwargs):
+        self._atualizar(job_id, estado="executando")
+        ultimo_parcial = [0.0]
+
+        def atualizar(mensagem=None, progresso=None, parcial=None, imediato=False):
+            campos = {}
+            if mensagem is not None:
+                campos["mensagem"] = mensagem
+            if progresso is not None:
+                campos["progresso"] = progresso
+            if parcial is not None and (imediato or time.monotonic() - ultimo_parcial[0] >= INTERVALO_PARCIAL):
+                ultimo_parcial[0] = time.monotonic()
+                campos["parcial"] = json.dumps(parcial, ensure_ascii=False)
+            if campos:
+                self._atualizar(job_id, **campos)
+
+        try:
+            resultado = funcao(*args, atualizar=atualizar, **kwargs)
+            self._atualizar(
+                job_id, estado="concluido", progresso=1.0, parcial=None,
+                resultado=json.dumps(resultado, ensure_ascii=False),
+            )
+        except Exception as e:
+            log.exception("Job %s falhou", job_id)
+            self._atualizar(job_id, estado="erro", erro=str(e))
+
+    def _linha_para_job(self, linha):
+        colunas = ("id", "tipo", "dono", "estado", "progresso", "mensagem", "parcial", "resultado", "erro",
+                   "criado_em", "atualizado_em")
+        job = dict(zip(colunas, linha))
+        for campo in ("parcial", "resultado"):
+            job[campo] = json.loads(job[campo]) if job[campo] else None
+        return job
+
+    def obter(self, job_id):
+        linhas = self._executar_sql("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._linha_para_job(linhas[0]) if linhas else None
+
+    def listar(self, dono=None, apenas_ativos=False, limite=50):
+        condicoes, parametros = [], []
+        if dono is not None:
+            condicoes.append("dono = ?")
+            parametros.append(dono)
+        if apenas_ativos:
+            condicoes.append("estado IN ('pendente', 'executando')")
+        where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        linhas = self._executar_sql(f"SELECT * FROM jobs {where} ORDER BY criado_em DESC LIMIT ?", (*parametros, limite))
+        return [self._linha_para_job(linha) for linha in linhas]
+
+    def cancelar(self, job_id):
+        # Só cancela o que ainda está na fila; chamadas em andamento vão até o fim
+        futuro = self._futuros.get(job_id)
+        if futuro is not None and self._executor.cancelar(futuro):
+            self._atualizar(job_id, estado="cancelado")
+            return True
+        return False
+
+    def aguardar(self, job_id, intervalo=0.1, timeout=None):
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.obter(job_id)
+            if job is None or job["estado"] not in ESTADOS_ATIVOS:
+                return job
+            if limite is not None and time.monotonic() > limite:
+                return job
+            time.sleep(intervalo)
+
+    def encerrar(self, esperar=True):
+        self._executor.shutdown(wait=esperar, cancel_futures=not esperar)
+        with self._lock:
+            self._conexao.close()
+
+def job_transcrever(entrada, titulo, client, atualizar, cache=None, usar_cache=True):
+    # O resultado leva tudo o que a interface precisa para se reconectar depois de um refresh.
+    # A entrada (AudioEntrada) é fechada ao fim, apagando o temporário que tiver criado
+    with entrada:
+        indice = transcrever_audio_indexado(
+            entrada, client, status_callback=lambda mensagem: atualizar(mensagem=mensagem),
+            cache=cache, usar_cache=usar_cache
+        )
+    transcricao = indice.texto()
+    # Já deixa pronto o índice de trechos que o chat de ajustes consulta
+    atualizar(mensagem="Indexando a transcrição...")
+    indice_trechos_aula(transcricao, indice)
+    return {
+        "titulo": titulo,
+        "transcricao": transcricao,
+        # Pasta do índice com os tempos (só existe com cache); a interface abre sob demanda
+        "indice_transcricao": indice.caminho,
+        "data_criacao": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def job_transcrever_mensagem(entrada, client, atualizar):
+    # Instrução gravada no microfone do chat: curta e sem cache, mas passa pela fila para contar na cota do usuário
+    with entrada:
+        mensagem = transcrever_audio_whisper(
+            entrada, client, status_callback=lambda mensagem: atualizar(mensagem=mensagem)
+        )
+    return {"mensagem": mensagem}
+
+def _acompanhar_stream(stream, atualizar):
+    ordem = [chave for chave, _ in SECOES_RESUMO]
+    secoes = None
+    for alteradas, secoes in stream:
+        # O ajuste do resumo inteiro começa sem nenhuma seção reaproveitada
+        if not alteradas:
+            continue
+        iniciadas = max(ordem.index(chave) for chave in alteradas) + 1
+        atualizar(progresso=min(0.99, 0.2 * iniciadas), parcial=secoes,
+                  mensagem=f"Gerando seção {iniciadas} de {len(ordem)}...")
+    return secoes
+
+def agendar_indexacao(indice_busca, audio_info, resumo):
+    if indice_busca is not None:
+        _executor_indexacao.submit(indexar_para_busca, indice_busca, audio_info, resumo)
+
+def indexar_para_busca(indice_busca, audio_info, resumo):
+    # Falha na indexação não derruba o resumo, que já está pronto
+    try:
+        caminho = audio_info.get("indice_transcricao")
+        indice_transcricao = TranscricaoIndexada.abrir(caminho) if caminho and os.path.isdir(caminho) else None
+        indice_busca.indexar_aula(
+            id_aula(audio_info["transcricao"]), audio_info["titulo"], transcricao=audio_info["transcricao"],
+            resumo=resumo, indice_transcricao=indice_transcricao
+        )
+        if indice_transcricao is not None:
+            indice_transcricao.fechar()
+        indice_busca.salvar()
+    except Exception:
+        log.exception("Falha ao indexar a aula %r para a busca", audio_info.get("titulo"))
+
+def arquivar(acervo, audio_info, chat=None, nova_versao=False):
+    # Grava no acervo e guarda o id da entrada em audio_info["id_acervo"], para os ajustes seguintes a
+    # atualizarem. nova_versao: resumo gerado de novo, que vira outra entrada em vez de sobrescrever a atual.
+    # Falha ao gravar no acervo não derruba o resumo, que já está pronto
+    if nova_versao:
+        audio_info.pop("id_acervo", None)
+    if acervo is None:
+        return
+    try:
+        audio_info["id_acervo"] = acervo.salvar(audio_info, chat)
+    except Exception:
+        log.exception("Falha ao gravar a aula %r no acervo", audio_info.get("titulo"))
+
+def job_gerar_resumo(audio_info, client, modelo, atualizar, cache=None, forcar_novo=False, indice_busca=None,
+                     acervo=None):
+    stream = gerar_resumo_stream(
+        audio_info["transcricao"], client, modelo, status_callback=lambda mensagem: atualizar(mensagem=mensagem),
+        cache=cache, forcar_novo=forcar_novo
+    )
+    resumo = _acompanhar_stream(stream, atualizar)
+    agendar_indexacao(indice_busca, audio_info, resumo)
+    audio_info = {**audio_info, "resumo": resumo, "modelo_escolhido": modelo}
+    arquivar(acervo, audio_info, nova_versao=True)
+    return {"audio_info": audio_info}
+
+def job_comparar_modelos(audio_info, client, modelos, atualizar, cache=None, forcar_novo=False):
+    # Gera o resumo com todos os modelos ao mesmo tempo. O parcial traz, por modelo, o estado, as seções
+    # que já chegaram e, ao terminar, latência e tokens; a interface mostra cada um na sua aba.
+    lock = threading.Lock()
+    resultados = {modelo: {"estado": "pendente", "secoes": None} for modelo in modelos}
+
+    def publicar(mensagem=None, imediato=False):
+        with lock:
+            concluidos = sum(r["estado"] in ("concluido", "erro") for r in resultados.values())
+            atualizar(mensagem=mensagem, progresso=min(0.99, concluidos / len(modelos)),
+                      parcial={modelo: dict(r) for modelo, r in resultados.items()}, imediato=imediato)
+
+    def gerar(modelo):
+        inicio = time.perf_counter()
+        estatisticas = {}
+        stream = gerar_resumo_stream(
+            audio_info["transcricao"], client, modelo, cache=cache, forcar_novo=forcar_novo,
+            estatisticas=estatisticas
+        )
+        for _, secoes in stream:
+            with lock:
+                resultados[modelo].update(estado="gerando", secoes=secoes)
+            publicar()
+        return {
+            "duracao": time.perf_counter() - inicio, "cache": estatisticas.get("cache", False),
+            "primeiro_token": estatisticas.get("tempo_primeiro_token"),
+            "tokens_prompt": estatisticas.get("tokens_prompt"), "tokens_resposta": estatisticas.get("tokens_resposta"),
+            "custo_usd": estatisticas.get("custo_usd"),
+        }
+
+    # Cada modelo aparece como concluído ou com erro assim que termina, sem esperar pelos mais lentos
+    with ThreadPoolExecutor(max_workers=len(modelos), thread_name_prefix="comparacao") as pool:
+        futuros = {pool.submit(gerar, modelo): modelo for modelo in modelos}
+        for futuro in as_completed(futuros):
+            modelo = futuros[futuro]
+            try:
+                dados = futuro.result()
+            except Exception as e:
+                log.exception("Falha ao gerar o resumo com %s na comparação", modelo)
+                with lock:
+                    resultados[modelo].update(estado="erro", erro=str(e))
+                publicar(mensagem=f"{modelo} falhou: {e}", imediato=True)
+            else:
+                with lock:
+                    resultados[modelo].update(estado="concluido", **dados)
+                publicar(mensagem=f"{modelo} concluído", imediato=True)
+    if all(r["estado"] == "erro" for r in resultados.values()):
+        raise RuntimeError("; ".join(f"{modelo}: {r['erro']}" for modelo, r in resultados.items()))
+    return {"comparacao": resultados}
+
+def trechos_para_instrucao(audio_info, instrucao):
+    # Passagens da transcrição mais ligadas à instrução; o índice da aula é montado só na primeira vez
+    transcricao = audio_info.get("transcricao")
+    if not transcricao:
+        return []
+    caminho = audio_info.get("indice_transcricao")
+    indice_transcricao = TranscricaoIndexada.abrir(caminho) if caminho and os.path.isdir(caminho) else None
+    try:
+        return indice_trechos_aula(transcricao, indice_transcricao).buscar(instrucao, k=MAX_TRECHOS_AJUSTE)
+    finally:
+        if indice_transcricao is not None:
+            indice_transcricao.fechar()
+
+def job_ajustar_resumo(historico, audio_info, client, atualizar, acervo=None):
+    instrucao = historico[-1]["content"]
+    stream = ajustar_resumo_stream(
+        historico, instrucao, client, audio_info["modelo_escolhido"],
+        trechos=trechos_para_instrucao(audio_info, instrucao)
+    )
+    resumo = _acompanhar_stream(stream, atualizar)
+    resultado = {
+        "audio_info": {**audio_info, "resumo": resumo},
+        "chat_history": historico + [{"role": "assistant", "content": resumo}],
+    }
+    arquivar(acervo, resultado["audio_info"], resultado["chat_history"])
+    return resultado
@@ -0,0 +1,214 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+MAX_SPANS_EM_MEMORIA = 5000
+# Intervalo mínimo entre regravações do arquivo do Prometheus; o node_exporter lê bem menos que isso
+INTERVALO_PROMETHEUS = float(os.environ.get("GERADOR_METRICAS_PROM_INTERVALO", "5"))
+# Atributos numéricos somados por etapa no resumo e no formato Prometheus
+CONTADORES_SPAN = ("bytes", "tokens_prompt", "tokens_resposta", "retentativas", "espera_limite", "custo_usd", "bytes_copiados")
+# Preço em US$ por milhão de tokens (prompt, resposta); ajuste quando a tabela da OpenAI mudar
+PRECOS_MODELOS = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "o1-mini": (1.10, 4.40),
+    "o3-mini": (1.10, 4.40),
+}
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+
+log = logging.getLogger(__name__)
+
+class RegistroMetricas:
+    # Guarda spans (etapa, duração, atributos) do pipeline. Cada span pode ir para um
+    # JSONL e os agregados por etapa para um arquivo no formato texto do Prometheus.
+    def __init__(self, caminho_jsonl=None, caminho_prometheus=None, intervalo_prometheus=INTERVALO_PROMETHEUS):
+        self.caminho_jsonl = caminho_jsonl
+        self.caminho_prometheus = caminho_prometheus
+        self.intervalo_prometheus = intervalo_prometheus
+        self._ultima_exportacao = None
+        self.spans = deque(maxlen=MAX_SPANS_EM_MEMORIA)
+        self._agregados = {}
+        self._lock = threading.Lock()
+        # Serializa as exportações para um snapshot mais antigo não sobrescrever um mais novo
+        self._lock_exportacao = threading.Lock()
+
+    @contextmanager
+    def medir(self, etapa, atual=True, **atributos):
+        # O dicionário devolvido pode receber atributos durante a execução (tokens, retentativas...).
+        # Dentro de um gerador use atual=False: o span ficaria como atual no código de quem consome os itens
+        # entre um yield e outro, e o reset falha se o gerador for fechado em outro contexto. As chamadas
+        # que o transporte deve anotar vão dentro de `como_atual(span)`
+        span = dict(atributos)
+        inicio = time.perf_counter()
+        token = _span_atual.set(span) if atual else None
+        try:
+            yield span
+        except Exception as e:
+            span["erro"] = type(e).__name__
+            raise
+        finally:
+            if token is not None:
+                _span_atual.reset(token)
+            self.registrar(etapa, time.perf_counter() - inicio, **span)
+
+    def registrar(self, etapa, duracao, **atributos):
+        span = {"etapa": etapa, "inicio": time.time() - duracao, "duracao": duracao, **atributos}
+        with self._lock:
+            self.spans.append(span)
+            agregado = self._agregados.setdefault(
+                etapa, {"quantidade": 0, "erros": 0, "duracao_total": 0.0, "duracao_max": 0.0,
+                        **{contador: 0 for contador in CONTADORES_SPAN}}
+            )
+            agregado["quantidade"] += 1
+            agregado["erros"] += 1 if span.get("erro") else 0
+            agregado["duracao_total"] += duracao
+            agregado["duracao_max"] = max(agregado["duracao_max"], duracao)
+            for contador in CONTADORES_SPAN:
+                agregado[contador] += span.get(contador) or 0
+            if self.caminho_jsonl:
+                # Disco cheio ou pasta sem permissão não podem derrubar a etapa que estava sendo medida
+                try:
+                    with open(self.caminho_jsonl, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    log.warning("Não foi possível gravar a métrica em %s: %s", self.caminho_jsonl, e)
+        if self.caminho_prometheus:
+            with self._lock:
+                agora = time.monotonic()
+                exportar = (self._ultima_exportacao is None
+                            or agora - self._ultima_exportacao >= self.intervalo_prometheus)
+                if exportar:
+                    self._ultima_exportacao = agora
+            if exportar:
+                self._exportar_prometheus_configurado()
+
+    def descarregar(self):
+        # Regrava o arquivo do Prometheus com os spans que o intervalo mínimo ainda segurava (fim do lote, saída)
+        if self.caminho_prometheus and self._ultima_exportacao is not None:
+            with self._lock:
+                self._ultima_exportacao = time.monotonic()
+            self._exportar_prometheus_configurado()
+
+    def _exportar_prometheus_configurado(self):
+        try:
+            self.exportar_prometheus(self.caminho_prometheus)
+        except OSError as e:
+            log.warning("Não foi possível exportar as métricas para %s: %s", self.caminho_prometheus, e)
+
+    def resumo_por_etapa(self):
+        with self._lock:
+            return [
+                {"etapa": etapa, **agregado, "duracao_media": agregado["duracao_total"] / agregado["quantidade"]}
+                for etapa, agregado in sorted(self._agregados.items())
+            ]
+
+    def resumo_por_modelo(self, etapas=("chat_resumo", "chat_ajuste")):
+        # Latência e tokens das chamadas de chat por modelo, a partir dos spans ainda em memória
+        por_modelo = {}
+        with self._lock:
+            spans = [span for span in self.spans if span["etapa"] in etapas and span.get("modelo")]
+        for span in spans:
+            item = por_modelo.setdefault(span["modelo"], {
+                "modelo": span["modelo"], "quantidade": 0, "erros": 0, "duracoes": [], "primeiro_token": [],
+                "tokens_prompt": 0, "tokens_resposta": 0, "custo_usd": 0.0,
+            })
+            item["quantidade"] += 1
+            item["erros"] += 1 if span.get("erro") else 0
+            item["duracoes"].append(span["duracao"])
+            if span.get("tempo_primeiro_token") is not None:
+                item["primeiro_token"].append(span["tempo_primeiro_token"])
+            for contador in ("tokens_prompt", "tokens_resposta", "custo_usd"):
+                item[contador] += span.get(contador) or 0
+        resumo = []
+        for item in sorted(por_modelo.values(), key=lambda i: i["modelo"]):
+            duracoes = sorted(item.pop("duracoes"))
+            primeiro_token = item.pop("primeiro_token")
+            item["duracao_media"] = sum(duracoes) / len(duracoes)
+            item["duracao_p95"] = duracoes[min(len(duracoes) - 1, int(0.95 * len(duracoes)))]
+            item["primeiro_token_medio"] = sum(primeiro_token) / len(primeiro_token) if primeiro_token else None
+            resumo.append(item)
+        return resumo
+
+    def texto_prometheus(self):
+        metricas = [
+            ("gerador_etapa_duracao_segundos_total", "counter", "Tempo total gasto na etapa", "duracao_total"),
+            ("gerador_etapa_duracao_segundos_max", "gauge", "Maior duração observada na etapa", "duracao_max"),
+            ("gerador_etapa_execucoes_total", "counter", "Execuções da etapa", "quantidade"),
+            ("gerador_etapa_erros_total", "counter", "Execuções da etapa que terminaram em erro", "erros"),
+            ("gerador_etapa_bytes_total", "counter", "Bytes de áudio processados na etapa", "bytes"),
+            ("gerador_etapa_tokens_prompt_total", "counter", "Tokens de prompt informados pela API", "tokens_prompt"),
+            ("gerador_etapa_tokens_resposta_total", "counter", "Tokens de resposta informados pela API", "tokens_resposta"),
+            ("gerador_etapa_retentativas_total", "counter", "Novas tentativas após erro transitório", "retentativas"),
+            ("gerador_etapa_espera_limite_segundos_total", "counter", "Espera imposta pelo limite de taxa da API",
+             "espera_limite"),
+            ("gerador_etapa_bytes_copiados_total", "counter", "Bytes de áudio copiados para disco na etapa",
+             "bytes_copiados"),
+            ("gerador_etapa_custo_usd_total", "counter", "Custo estimado das chamadas da etapa em US$", "custo_usd"),
+        ]
+        resumo = self.resumo_por_etapa()
+        linhas = []
+        for nome, tipo, ajuda, campo in metricas:
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            linhas.extend(f'{nome}{{etapa="{item["etapa"]}"}} {item[campo]}' for item in resumo)
+        return "\n".join(linhas) + "\n"
+
+    def exportar_prometheus(self, caminho):
+        # Escrita atômica para o node_exporter (textfile collector) nunca ler um arquivo pela metade. O temporário
+        # tem nome único na mesma pasta: outro processo exportando para o mesmo arquivo não pisa nele
+        pasta, nome = os.path.split(os.path.abspath(caminho))
+        with self._lock_exportacao:
+            descritor, temporario = tempfile.mkstemp(prefix=f".{nome}.", suffix=".tmp", dir=pasta)
+            try:
+                with os.fdopen(descritor, "w", encoding="utf-8") as f:
+                    f.write(self.texto_prometheus())
+                os.replace(temporario, caminho)
+            except BaseException:
+                if os.path.exists(temporario):
+                    os.remove(temporario)
+                raise
+
+    def limpar(self):
+        with self._lock:
+            self.spans.clear()
+            self._agregados.clear()
+
+registro = RegistroMetricas(
+    caminho_jsonl=os.environ.get("GERADOR_METRICAS_JSONL"),
+    caminho_prometheus=os.environ.get("GERADOR_METRICAS_PROM"),
+)
+atexit.register(registro.descarregar)
+
+def medir(etapa, atual=True, **atributos):
+    return registro.medir(etapa, atual=atual, **atributos)
+
+def span_atual():
+    # Span aberto por medir() nesta thread, para camadas de baixo (transporte) anotarem retentativas e esperas
+    return _span_atual.get()
+
+@contextmanager
+def como_atual(span):
+    # Torna `span` o atual só durante o bloco (uma chamada feita de dentro de um gerador medido com atual=False)
+    token = _span_atual.set(span)
+    try:
+        yield span
+    finally:
+        _span_atual.reset(token)
+
+def registrar_uso(span, resposta):
+    # Copia o campo `usage` das respostas da OpenAI (ausente em clientes falsos ou streams sem include_usage)
+    uso = getattr(resposta, "usage", None)
+    if uso is None:
+        return
+    span["tokens_prompt"] = getattr(uso, "prompt_tokens", None) or 0
+    span["tokens_resposta"] = getattr(uso, "completion_tokens", None) or 0
+    precos = PRECOS_MODELOS.get(span.get("modelo"))
+    if precos:
+        span["custo_usd"] = (span["tokens_prompt"] * precos[0] + span["tokens_resposta"] * precos[1]) / 1_000_000
@@ -0,0 +1,214 @@
+import argparse
+import glob
+import hashlib
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from types import SimpleNamespace
+
+from acervo import AcervoAulas
+from cache import CacheTranscricoes, CacheResumos
+from busca import IndiceBusca, criar_embedder, id_aula
+from functions import get_openai_client, transcrever_audio_indexado, gerar_resumo, salvar_resumo_json
+from metricas import registro as registro_metricas
+
+EXTENSOES_AUDIO = (".mp3", ".wav", ".m4a")
+# Aulas enfileiradas no índice de busca antes de calcular os embeddings e gravar um fragmento
+LOTE_INDEXACAO = 20
+
+class ClienteLimitado:
+    # Envolve o cliente OpenAI com um limite global de chamadas simultâneas por endpoint,
+    # compartilhado por todos os arquivos do lote
+    def __init__(self, client, max_transcricoes=4, max_chat=2):
+        self._client = client
+        self._limite_transcricoes = threading.BoundedSemaphore(max_transcricoes)
+        self._limite_chat = threading.BoundedSemaphore(max_chat)
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(
+            create=self._limitar(self._limite_transcricoes, lambda: client.audio.transcriptions.create)
+        ))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._limitar(self._limite_chat, lambda: client.chat.completions.create)
+        ))
+
+    @staticmethod
+    def _limitar(semaforo, obter_metodo):
+        def chamar(*args, **kwargs):
+            with semaforo:
+                return obter_metodo()(*args, **kwargs)
+        return chamar
+
+def listar_arquivos(entradas):
+    arquivos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            candidatos = [os.path.join(entrada, nome) for nome in os.listdir(entrada)]
+        else:
+            candidatos = glob.glob(entrada)
+        arquivos.extend(c for c in candidatos if os.path.isfile(c) and c.lower().endswith(EXTENSOES_AUDIO))
+    return sorted(set(arquivos))
+
+def _caminho_saida(arquivo, pasta_saida):
+    # Hash curto do caminho de origem no nome: "turma1/aula01.mp3" e "turma2/aula01.mp3" não gravam (nem pulam)
+    # o mesmo JSON, e o nome continua o mesmo entre execuções para a retomada
+    titulo = os.path.splitext(os.path.basename(arquivo))[0]
+    nome = "".join(c if c.isalnum() or c in " _-" else "_" for c in titulo)
+    origem = hashlib.sha256(os.path.realpath(arquivo).encode("utf-8")).hexdigest()[:8]
+    return titulo, os.path.join(pasta_saida, f"{nome}-{origem}.json")
+
+def processar_lote(arquivos, client, modelo="gpt-4o-mini", pasta_saida=".", max_arquivos=2,
+                   max_transcricoes=4, max_chat=2, cache=None, cache_resumos=None, forcar=False, indice_busca=None,
+                   acervo=None, log=print):
+    # Pipeline em dois estágios: cada arquivo transcrito segue para o resumo enquanto o próximo
+    # já está sendo transcrito. Arquivos cujo JSON já existe são pulados (retomada).
+    os.makedirs(pasta_saida, exist_ok=True)
+    client = ClienteLimitado(client, max_transcricoes=max_transcricoes, max_chat=max_chat)
+    resultados = []
+    inicio_lote = time.perf_counter()
+
+    def transcrever(arquivo):
+        inicio = time.perf_counter()
+        indice = transcrever_audio_indexado(arquivo, client, cache=cache, max_workers=max_transcricoes)
+        return indice, time.perf_counter() - inicio
+
+    def resumir(arquivo, titulo, caminho, indice):
+        inicio = time.perf_counter()
+        transcricao = indice.texto()
+        resumo = gerar_resumo(transcricao, client, modelo, cache=cache_resumos)
+        if indice_busca is not None:
+            indice_busca.indexar_aula(
+                id_aula(transcricao), titulo, transcricao=transcricao, resumo=resumo, indice_transcricao=indice
+            )
+        dados = {"titulo": titulo, "data_criacao": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "resumo": resumo}
+        salvar_resumo_json(dados, os.path.splitext(os.path.basename(caminho))[0], pasta_destino=pasta_saida)
+        if acervo is not None:
+            acervo.salvar({**dados, "transcricao": transcricao, "modelo_escolhido": modelo,
+                           "indice_transcricao": indice.caminho})
+        return time.perf_counter() - inicio
+
+    pendentes = []
+    for arquivo in arquivos:
+        titulo, caminho = _caminho_saida(arquivo, pasta_saida)
+        if os.path.exists(caminho) and not forcar:
+            log(f"[pulado] {arquivo}: {caminho} já existe")
+            resultados.append({"arquivo": arquivo, "estado": "pulado"})
+        else:
+            pendentes.append((arquivo, titulo, caminho))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_arquivos)) as pool_transcricao, \
+            ThreadPoolExecutor(max_workers=max(1, max_arquivos)) as pool_resumo:
+        transcricoes = {pool_transcricao.submit(transcrever, arquivo): (arquivo, titulo, caminho)
+                        for arquivo, titulo, caminho in pendentes}
+        resumos = {}
+        for futuro in as_completed(transcricoes):
+            arquivo, titulo, caminho = transcricoes[futuro]
+            registro = {"arquivo": arquivo, "saida": caminho, "bytes": os.path.getsize(arquivo)}
+            try:
+                indice, registro["tempo_transcricao"] = futuro.result()
+            except Exception as e:
+                log(f"[erro] {arquivo}: transcrição falhou: {e}")
+                resultados.append({**registro, "estado": "erro", "erro": str(e)})
+                continue
+            log(f"[transcrito] {arquivo} em {registro['tempo_transcricao']:.1f}s")
+            resumos[pool_resumo.submit(resumir, arquivo, titulo, caminho, indice)] = registro
+
+        indexados = 0
+        for futuro in as_completed(resumos):
+            registro = resumos[futuro]
+            try:
+                registro["tempo_resumo"] = futuro.result()
+                registro["estado"] = "ok"
+                log(f"[resumido] {registro['arquivo']} -> {registro['saida']} em {registro['tempo_resumo']:.1f}s")
+            except Exception as e:
+                registro.update(estado="erro", erro=str(e))
+                log(f"[erro] {registro['arquivo']}: resumo falhou: {e}")
+            resultados.append(registro)
+            indexados += registro["estado"] == "ok"
+            if indice_busca is not None and indexados >= LOTE_INDEXACAO:
+                indice_busca.salvar()
+                indexados = 0
+
+    if indice_busca is not None:
+        indice_busca.salvar()
+
+    return {"resultados": resultados, "tempo_total": time.perf_counter() - inicio_lote}
+
+def _percentis(valores):
+    if not valores:
+        return "-"
+    if len(valores) == 1:
+        return f"p50={valores[0]:.1f}s p95={valores[0]:.1f}s"
+    quantis = statistics.quantiles(valores, n=20, method="inclusive")
+    return f"p50={statistics.median(valores):.1f}s p95={quantis[18]:.1f}s"
+
+def formatar_relatorio(relatorio):
+    resultados = relatorio["resultados"]
+    ok = [r for r in resultados if r["estado"] == "ok"]
+    tempo_total = relatorio["tempo_total"]
+    megabytes = sum(r["bytes"] for r in ok) / 2**20
+    linhas = [
+        "",
+        "=== Relatório do lote ===",
+        f"Arquivos: {len(ok)} ok, {sum(r['estado'] == 'pulado' for r in resultados)} pulados, "
+        f"{sum(r['estado'] == 'erro' for r in resultados)} com erro",
+        f"Tempo total: {tempo_total:.1f}s",
+        f"Vazão: {len(ok) / tempo_total * 60:.2f} arquivos/min, {megabytes / tempo_total:.2f} MB de áudio/s" if tempo_total else "",
+        f"Transcrição: {_percentis([r['tempo_transcricao'] for r in ok])}",
+        f"Resumo: {_percentis([r['tempo_resumo'] for r in ok])}",
+    ]
+    linhas += [f"  erro em {r['arquivo']}: {r['erro']}" for r in resultados if r["estado"] == "erro"]
+    etapas = registro_metricas.resumo_por_etapa()
+    if etapas:
+        linhas.append("Por etapa:")
+        linhas += [
+            f"  {e['etapa']:<18} n={e['quantidade']:<4} médio={e['duracao_media']:.2f}s máx={e['duracao_max']:.2f}s "
+            f"tokens={e['tokens_prompt']}+{e['tokens_resposta']} retentativas={e['retentativas']} "
+            f"espera_limite={e['espera_limite']:.1f}s custo=US${e['custo_usd']:.4f}"
+            for e in etapas
+        ]
+    return "\n".join(linha for linha in linhas if linha is not None)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcreve e resume em lote uma pasta (ou glob) de aulas em MP3/WAV/M4A.")
+    parser.add_argument("entradas", nargs="+", help="pastas ou padrões glob, ex.: aulas/ 'aulas/*.m4a'")
+    parser.add_argument("-o", "--saida", default=".", help="pasta onde os JSON são gravados")
+    parser.add_argument("-m", "--modelo", default="gpt-4o-mini", choices=["gpt-4o-mini", "o1-mini", "o3-mini"])
+    parser.add_argument("--arquivos-simultaneos", type=int, default=2)
+    parser.add_argument("--max-transcricoes", type=int, default=4, help="chamadas simultâneas ao Whisper no lote todo")
+    parser.add_argument("--max-chat", type=int, default=2, help="chamadas simultâneas ao chat no lote todo")
+    parser.add_argument("--forcar", action="store_true", help="reprocessa mesmo se o JSON já existir")
+    parser.add_argument("--sem-cache", action="store_true", help="não usa os caches de transcrições e resumos")
+    parser.add_argument("--indexar", action="store_true", help="adiciona as aulas ao índice de busca (busca.py)")
+    parser.add_argument("--sem-acervo", action="store_true", help="não grava as aulas no histórico (acervo.py)")
+    parser.add_argument("--metricas", metavar="PREFIXO", help="grava PREFIXO.jsonl (spans) e PREFIXO.prom (Prometheus)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    args = parser.parse_args(argv)
+
+    if args.metricas:
+        registro_metricas.caminho_jsonl = f"{args.metricas}.jsonl"
+        registro_metricas.caminho_prometheus = f"{args.metricas}.prom"
+
+    arquivos = listar_arquivos(args.entradas)
+    if not arquivos:
+        parser.error("nenhum arquivo .mp3, .wav ou .m4a encontrado")
+    if not args.api_key:
+        parser.error("informe --api-key ou defina OPENAI_API_KEY")
+
+    client = get_openai_client(args.api_key)
+    relatorio = processar_lote(
+        arquivos, client, modelo=args.modelo, pasta_saida=args.saida,
+        max_arquivos=args.arquivos_simultaneos, max_transcricoes=args.max_transcricoes, max_chat=args.max_chat,
+        cache=None if args.sem_cache else CacheTranscricoes(),
+        cache_resumos=None if args.sem_cache else CacheResumos(), forcar=args.forcar,
+        indice_busca=IndiceBusca(embedder=criar_embedder(client=client)) if args.indexar else None,
+        acervo=None if args.sem_acervo else AcervoAulas(),
+    )
+    registro_metricas.descarregar()
+    print(formatar_relatorio(relatorio))
+    return 1 if any(r["estado"] == "erro" for r in relatorio["resultados"]) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
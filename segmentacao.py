@@ -0,0 +1,115 @@
+import re
+import subprocess
+import tempfile
+
+import numpy as np
+
+# Análise feita sobre PCM mono 16 kHz decodificado pelo ffmpeg, em quadros de 20 ms
+TAXA_ANALISE = 16000
+AMOSTRAS_QUADRO = 320
+DURACAO_QUADRO = AMOSTRAS_QUADRO / TAXA_ANALISE
+SEGUNDOS_POR_BLOCO = 30
+# Silêncio = quadros até MARGEM_RUIDO_DB acima do piso de ruído do trecho, sem passar de LIMIAR_MAXIMO_SILENCIO_DB
+MARGEM_RUIDO_DB = 10.0
+LIMIAR_MAXIMO_SILENCIO_DB = -30.0
+# Pausas mais curtas que isso ficam entre palavras; cortar nelas ainda pode partir uma frase
+MIN_SILENCIO = 0.3
+# Sem pausa no trecho de busca, corta no ponto de menor energia média nessa janela
+JANELA_SUAVIZACAO = 0.2
+
+def caminho_ffmpeg():
+    # Importado só quando há áudio a processar: o imageio_ffmpeg procura o binário ao ser carregado
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def duracao_audio(arquivo_audio):
+    # Lida do cabeçalho (ffmpeg -i sem saída sai com erro, mas imprime a duração); None se não houver
+    resultado = subprocess.run(
+        [caminho_ffmpeg(), "-hide_banner", "-nostdin", "-i", arquivo_audio],
+        capture_output=True, text=True, errors="replace"
+    )
+    encontrado = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", resultado.stderr)
+    if not encontrado:
+        return None
+    horas, minutos, segundos = encontrado.groups()
+    return int(horas) * 3600 + int(minutos) * 60 + float(segundos)
+
+def energia_quadros(pcm):
+    # Energia (dBFS) de cada quadro completo de um bloco int16
+    quadros = len(pcm) // AMOSTRAS_QUADRO
+    amostras = pcm[:quadros * AMOSTRAS_QUADRO].astype(np.float32).reshape(quadros, AMOSTRAS_QUADRO)
+    media_quadrados = np.einsum("ij,ij->i", amostras, amostras) / AMOSTRAS_QUADRO
+    return 10 * np.log10(media_quadrados / 32768.0 ** 2 + 1e-10)
+
+def energias_em_blocos(arquivo_audio):
+    # Gera a energia por quadro à medida que o ffmpeg decodifica, sem guardar o PCM inteiro na memória
+    comando = [
+        caminho_ffmpeg(), "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", arquivo_audio, "-vn", "-ac", "1", "-ar", str(TAXA_ANALISE), "-f", "s16le", "pipe:1",
+    ]
+    bytes_bloco = SEGUNDOS_POR_BLOCO * TAXA_ANALISE * 2
+    with tempfile.TemporaryFile() as log_erros:
+        processo = subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=log_erros)
+        try:
+            sobra = b""
+            while True:
+                dados = processo.stdout.read(bytes_bloco)
+                if not dados:
+                    break
+                dados = sobra + dados
+                utilizavel = len(dados) - len(dados) % (AMOSTRAS_QUADRO * 2)
+                sobra = dados[utilizavel:]
+                yield energia_quadros(np.frombuffer(dados[:utilizavel], dtype=np.int16))
+            if processo.wait() != 0:
+                log_erros.seek(0)
+                erro = log_erros.read().decode("utf-8", errors="replace").strip()
+                raise RuntimeError(f"Falha ao decodificar o áudio com ffmpeg: {erro}")
+        finally:
+            if processo.poll() is None:
+                processo.kill()
+                processo.wait()
+            processo.stdout.close()
+
+def escolher_corte(energias_db):
+    # Devolve (quadro do corte dentro do trecho, forcado). Prefere o meio da pausa mais longa
+    # (a mais tardia, em caso de empate); sem pausa, o ponto mais baixo da energia suavizada.
+    piso = np.percentile(energias_db, 5)
+    limiar = min(piso + MARGEM_RUIDO_DB, LIMIAR_MAXIMO_SILENCIO_DB)
+    silencio = np.concatenate(([0], (energias_db < limiar).astype(np.int8), [0]))
+    bordas = np.diff(silencio)
+    inicios = np.flatnonzero(bordas == 1)
+    fins = np.flatnonzero(bordas == -1)
+    duracoes = fins - inicios
+    if len(duracoes) and duracoes.max() * DURACAO_QUADRO >= MIN_SILENCIO:
+        maior = len(duracoes) - 1 - int(np.argmax(duracoes[::-1]))
+        return int((inicios[maior] + fins[maior]) // 2), False
+    largura = max(1, int(JANELA_SUAVIZACAO / DURACAO_QUADRO))
+    suavizada = np.convolve(energias_db, np.ones(largura) / largura, mode="same")
+    return int(np.argmin(suavizada)), True
+
+def planejar_cortes(arquivo_audio, duracao_alvo, janela_busca):
+    # Gera (inicio, fim, corte_forcado) em segundos. Cada corte cai em [inicio + alvo - janela, inicio + alvo],
+    # de modo que nenhum trecho passa do alvo; corte_forcado indica que não havia pausa no trecho de busca.
+    quadros_alvo = max(1, int(duracao_alvo / DURACAO_QUADRO))
+    quadros_janela = min(quadros_alvo - 1, max(1, int(janela_busca / DURACAO_QUADRO)))
+    pendentes = []
+    energias = np.empty(0, dtype=np.float32)
+    deslocamento = 0  # quadro absoluto de energias[0]; o que já foi cortado é descartado
+    inicio = 0
+    total = 0
+    for bloco in energias_em_blocos(arquivo_audio):
+        pendentes.append(bloco)
+        total += len(bloco)
+        if total - inicio < quadros_alvo:
+            continue
+        energias = np.concatenate([energias[inicio - deslocamento:], *pendentes])
+        deslocamento, pendentes = inicio, []
+        while total - inicio >= quadros_alvo:
+            busca_inicio = inicio + quadros_alvo - quadros_janela
+            trecho = energias[busca_inicio - deslocamento:inicio + quadros_alvo - deslocamento]
+            corte, forcado = escolher_corte(trecho)
+            fim = busca_inicio + corte
+            yield inicio * DURACAO_QUADRO, fim * DURACAO_QUADRO, forcado
+            inicio = fim
+    if total > inicio:
+        yield inicio * DURACAO_QUADRO, total * DURACAO_QUADRO, False
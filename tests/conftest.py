@@ -0,0 +1,6 @@
+import os
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Os testes usam o cliente falso dos benchmarks (benchmarks/cliente_falso.py)
+sys.path[:0] = [RAIZ, os.path.join(RAIZ, "benchmarks")]
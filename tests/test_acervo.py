@@ -0,0 +1,90 @@
+import json
+import sqlite3
+
+import pytest
+
+from acervo import AcervoAulas
+from jobs import arquivar
+
+RESUMO = {"pontos_principais": "- tópico", "resumo_pratico": "texto", "perguntas_respostas": "", "exemplos_copy": ""}
+
+
+@pytest.fixture
+def acervo(tmp_path):
+    acervo = AcervoAulas(str(tmp_path / "acervo.sqlite3"))
+    yield acervo
+    acervo.fechar()
+
+
+def aula(**extras):
+    return {"titulo": "Aula 1", "resumo": RESUMO, "transcricao": "transcrição da aula", "modelo_escolhido": "o1-mini",
+            **extras}
+
+
+def test_regenerar_cria_versao_sem_apagar_o_chat(acervo):
+    audio_info = aula()
+    arquivar(acervo, audio_info, nova_versao=True)
+    chat = [{"role": "assistant", "content": RESUMO}, {"role": "user", "content": "Ajuste tudo"},
+            {"role": "assistant", "content": {**RESUMO, "resumo_pratico": "ajustado"}}]
+    arquivar(acervo, audio_info, chat)
+    primeira = audio_info["id_acervo"]
+
+    arquivar(acervo, audio_info, nova_versao=True)
+
+    assert audio_info["id_acervo"] != primeira
+    assert sorted(item["versao"] for item in acervo.listar()) == [1, 2]
+    assert acervo.carregar(primeira)["chat"] == chat
+    assert acervo.listar()[0]["ajustes"] == 0
+
+
+def test_ajuste_atualiza_a_entrada_reaberta(acervo):
+    id_entrada = acervo.salvar(aula())
+    audio_info, _ = acervo.audio_info(id_entrada)
+    arquivar(acervo, {**audio_info, "resumo": {**RESUMO, "resumo_pratico": "ajustado"}},
+             [{"role": "user", "content": "Ajuste tudo"}])
+    assert acervo.contar() == 1
+    assert acervo.carregar(id_entrada)["resumo"]["resumo_pratico"] == "ajustado"
+    assert acervo.carregar(id_entrada)["transcricao"] == "transcrição da aula"
+
+
+def test_salvar_sem_transcricao_exige_aula(acervo):
+    with pytest.raises(ValueError):
+        acervo.salvar(aula(transcricao=""))
+    # arquivar não derruba o resumo: só registra a falha
+    audio_info = aula(transcricao="")
+    arquivar(acervo, audio_info)
+    assert "id_acervo" not in audio_info
+    assert acervo.contar() == 0
+
+
+def test_importar_jsons_de_novo_nao_duplica(acervo, tmp_path):
+    pasta = tmp_path / "jsons"
+    pasta.mkdir()
+    (pasta / "aula.json").write_text(json.dumps({"titulo": "Aula 1", "resumo": RESUMO}), encoding="utf-8")
+    assert acervo.importar_jsons([str(pasta)], log=lambda mensagem: None) == 1
+    assert acervo.importar_jsons([str(pasta)], log=lambda mensagem: None) == 0
+    assert acervo.contar() == 1
+    audio_info, _ = acervo.audio_info(acervo.listar()[0]["id"])
+    assert audio_info["modelo_escolhido"] is None
+
+
+def test_migra_acervo_com_entrada_unica_por_modelo(tmp_path):
+    caminho = str(tmp_path / "acervo.sqlite3")
+    conexao = sqlite3.connect(caminho)
+    conexao.executescript("""
+        CREATE TABLE aulas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, usuario TEXT NOT NULL DEFAULT '',
+            aula TEXT NOT NULL, modelo TEXT NOT NULL, titulo TEXT NOT NULL,
+            criado_em REAL NOT NULL, atualizado_em REAL NOT NULL,
+            ajustes INTEGER NOT NULL DEFAULT 0, previa TEXT NOT NULL DEFAULT '',
+            indice_transcricao TEXT, tamanho INTEGER NOT NULL DEFAULT 0, tamanho_original INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (usuario, aula, modelo)
+        );
+        INSERT INTO aulas (aula, modelo, titulo, criado_em, atualizado_em) VALUES ('abc', 'o1-mini', 'Antiga', 1, 1);
+    """)
+    conexao.close()
+
+    acervo = AcervoAulas(caminho)
+    acervo.salvar({"titulo": "Antiga", "resumo": RESUMO, "transcricao": "", "modelo_escolhido": "o1-mini"}, aula="abc")
+    assert sorted((item["titulo"], item["versao"]) for item in acervo.listar()) == [("Antiga", 1), ("Antiga", 2)]
+    acervo.fechar()
@@ -0,0 +1,88 @@
+import multiprocessing
+import os
+import sqlite3
+
+import numpy as np
+
+import busca
+from busca import IndiceBusca
+
+
+def transcricao(aula, palavras=300):
+    return " ".join(f"{aula}palavra{i}" for i in range(palavras))
+
+
+def indexar_varias(pasta, prefixo, quantidade):
+    # Roda em outro processo, como o processar_lote.py --indexar ao lado do app. Compacta a cada poucas
+    # gravações: os fragmentos que o outro processo acabou de gravar não podem sumir
+    busca.MAX_FRAGMENTOS = 3
+    indice = IndiceBusca(pasta)
+    for i in range(quantidade):
+        indice.indexar_aula(f"{prefixo}{i}", f"{prefixo} {i}", transcricao=transcricao(f"{prefixo}{i}x"))
+        indice.salvar()
+    indice.fechar()
+
+
+def ids_nos_fragmentos(pasta):
+    conexao = sqlite3.connect(os.path.join(pasta, "metadados.sqlite3"))
+    nomes = [nome for (nome,) in conexao.execute("SELECT nome FROM fragmentos")]
+    conexao.close()
+    return np.concatenate([np.load(os.path.join(pasta, f"{nome}_ids.npy")) for nome in nomes])
+
+
+def test_processos_gravando_no_mesmo_indice_nao_repetem_ids(tmp_path):
+    pasta = str(tmp_path)
+    contexto = multiprocessing.get_context("spawn")
+    processos = [contexto.Process(target=indexar_varias, args=(pasta, prefixo, 8)) for prefixo in ("app", "lote")]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join(60)
+        assert processo.exitcode == 0
+
+    indice = IndiceBusca(pasta)
+    assert indice.estatisticas()["aulas"] == 16
+    ids = ids_nos_fragmentos(pasta)
+    assert len(ids) == len(set(ids.tolist())) == indice.estatisticas()["passagens"]
+    # Cada vetor continua apontando para a passagem da própria aula
+    resultado = indice.buscar("lote3xpalavra10 lote3xpalavra11 lote3xpalavra12", k=1)
+    assert resultado[0]["aula"] == "lote3"
+    indice.fechar()
+
+
+def test_ids_removidos_nao_sao_reaproveitados(tmp_path):
+    indice = IndiceBusca(str(tmp_path))
+    indice.indexar_aula("a", "A", transcricao=transcricao("a"))
+    indice.indexar_aula("b", "B", transcricao=transcricao("b"))
+    indice.salvar()
+    maior = max(ids_nos_fragmentos(str(tmp_path)).tolist())
+    # A aula com os maiores ids sai; a lápide dela ainda está no fragmento
+    indice.remover_aula("b")
+    indice.indexar_aula("c", "C", transcricao=transcricao("c"))
+    indice.salvar()
+    novos = indice._executar("SELECT id FROM passagens WHERE aula = 'c'")
+    assert min(i for (i,) in novos) > maior
+    assert indice.buscar("bpalavra1 bpalavra2 bpalavra3", k=3, aula="b") == []
+    indice.fechar()
+
+
+def test_indice_antigo_migra_sem_perder_a_sequencia(tmp_path):
+    pasta = str(tmp_path)
+    conexao = sqlite3.connect(os.path.join(pasta, "metadados.sqlite3"))
+    conexao.executescript("""
+        CREATE TABLE config (chave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+        CREATE TABLE passagens (
+            id INTEGER PRIMARY KEY, aula TEXT NOT NULL, tipo TEXT NOT NULL, secao TEXT,
+            inicio REAL, fim REAL, texto TEXT NOT NULL
+        );
+        CREATE INDEX passagens_aula ON passagens (aula);
+        INSERT INTO config VALUES ('proximo_id', '50');
+        INSERT INTO passagens VALUES (7, 'velha', 'transcricao', NULL, NULL, NULL, 'texto antigo');
+    """)
+    conexao.close()
+    indice = IndiceBusca(pasta)
+    assert indice._executar("SELECT id, aula FROM passagens") == [(7, "velha")]
+    indice.indexar_aula("nova", "Nova", transcricao=transcricao("nova", 10))
+    indice.salvar()
+    assert indice._executar("SELECT MIN(id) FROM passagens WHERE aula = 'nova'")[0][0] == 50
+    indice.fechar()
@@ -0,0 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import CacheResumos
+
+
+def test_salvar_variantes_concorrentes(tmp_path):
+    # Duas conexões no mesmo arquivo, como o app e o processar_lote.py, salvando a mesma chave ao mesmo tempo
+    caminho = str(tmp_path / "resumos.sqlite3")
+    caches = [CacheResumos(caminho, max_variantes=100) for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        variantes = list(executor.map(
+            lambda i: caches[i % 2].salvar("chave", {"resumo_pratico": f"versão {i}"}), range(40)
+        ))
+    assert sorted(variantes) == list(range(40))
+    assert len(caches[0].variantes("chave")) == 40
+    for cache in caches:
+        cache.fechar()
@@ -0,0 +1,38 @@
+import logging
+
+from functions import SECOES_RESUMO, _avisar_reescritas_fora_do_alvo, identificar_secoes_alvo
+
+TODAS = [chave for chave, _ in SECOES_RESUMO]
+
+
+def test_secoes_alvo_palavras_inteiras():
+    # "estudo" contém "tudo", mas não pede o resumo inteiro
+    assert identificar_secoes_alvo("Inclua o estudo de caso nas perguntas") == ["perguntas_respostas"]
+    assert identificar_secoes_alvo("Refaça tudo em tom mais formal") == TODAS
+    assert identificar_secoes_alvo("Mais exemplos de Copies, por favor") == ["exemplos_copy"]
+
+
+def test_secoes_alvo_por_numero():
+    assert identificar_secoes_alvo("Encurte as seções 2 e 4") == ["resumo_pratico", "exemplos_copy"]
+    assert identificar_secoes_alvo("Revise as partes 1, 3 e 4") == ["pontos_principais", "perguntas_respostas",
+                                                                   "exemplos_copy"]
+    assert identificar_secoes_alvo("Na secao 3 use linguagem simples") == ["perguntas_respostas"]
+
+
+def test_secoes_alvo_sem_pista_ajusta_todas():
+    assert identificar_secoes_alvo("Deixe mais curto") == TODAS
+
+
+def test_secoes_alvo_ignora_secao_aprovada_ou_negada():
+    assert identificar_secoes_alvo("Os pontos principais estão bons; mude as copies") == ["exemplos_copy"]
+    assert identificar_secoes_alvo("Não mude os pontos principais, só refaça as copies") == ["exemplos_copy"]
+    assert identificar_secoes_alvo("No geral está bom, mas troque os anúncios") == ["exemplos_copy"]
+    assert identificar_secoes_alvo("Gostei das perguntas. Seção 2: linguagem simples") == ["resumo_pratico"]
+
+
+def test_aviso_reescrita_fora_do_alvo(caplog):
+    anterior = {chave: f"texto de {chave}" for chave in TODAS}
+    secoes = {**anterior, "resumo_pratico": "reescrito", "exemplos_copy": "também reescrito"}
+    with caplog.at_level(logging.WARNING, logger="functions"):
+        _avisar_reescritas_fora_do_alvo(secoes, anterior, ["resumo_pratico"])
+    assert "exemplos_copy" in caplog.text and "resumo_pratico" not in caplog.text
@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+import jobs
+from functions import SECOES_RESUMO
+from jobs import CotaExcedida, ExecutorJusto, GerenciadorJobs, _acompanhar_stream, job_comparar_modelos
+
+
+def test_acompanhar_stream_sem_secoes_reaproveitadas():
+    # O ajuste do resumo inteiro começa com um passo sem nenhuma seção reaproveitada
+    resumo = {chave: f"texto de {chave}" for chave, _ in SECOES_RESUMO}
+    stream = iter([(set(), dict(resumo)), ({"pontos_principais"}, resumo)])
+    atualizacoes = []
+    assert _acompanhar_stream(stream, lambda **dados: atualizacoes.append(dados)) == resumo
+    assert [dados["mensagem"] for dados in atualizacoes] == [f"Gerando seção 1 de {len(SECOES_RESUMO)}..."]
+
+
+def test_comparar_modelos_publica_erro_sem_esperar_os_outros(monkeypatch):
+    erro_publicado = threading.Event()
+
+    def gerar_resumo_stream(transcricao, client, modelo, **kwargs):
+        if modelo == "quebrado":
+            raise RuntimeError("modelo indisponível")
+        # O modelo lento só termina depois que a falha do outro aparece no parcial
+        erro_publicado.wait(5)
+        yield set(), {"resumo_pratico": "pronto"}
+
+    def atualizar(parcial=None, **dados):
+        if parcial and parcial["quebrado"]["estado"] == "erro" and not erro_publicado.is_set():
+            assert parcial["lento"]["estado"] != "concluido"
+            erro_publicado.set()
+
+    monkeypatch.setattr(jobs, "gerar_resumo_stream", gerar_resumo_stream)
+    resultados = job_comparar_modelos({"transcricao": "aula"}, None, ["lento", "quebrado"], atualizar)["comparacao"]
+    assert erro_publicado.is_set()
+    assert resultados["quebrado"] == {"estado": "erro", "secoes": None, "erro": "modelo indisponível"}
+    assert resultados["lento"]["estado"] == "concluido"
+
+
+def test_executor_justo_cota_de_fila_por_dono():
+    iniciou, liberar = threading.Event(), threading.Event()
+
+    def ocupar():
+        iniciou.set()
+        return liberar.wait(5)
+
+    executor = ExecutorJusto(max_workers=1, max_por_dono=1, max_fila_por_dono=2)
+    rodando = executor.submit("ana", ocupar)
+    iniciou.wait(5)
+    # Com o único worker ocupado, os próximos jobs da ana esperam na fila dela, que tem lugar para dois
+    na_fila = [executor.submit("ana", lambda: "ana") for _ in range(2)]
+    with pytest.raises(CotaExcedida):
+        executor.submit("ana", lambda: "ana")
+    # A cota é por dono: outro usuário ainda enfileira
+    outro = executor.submit("bia", lambda: "bia")
+    liberar.set()
+    assert rodando.result(5) and outro.result(5) == "bia"
+    assert [futuro.result(5) for futuro in na_fila] == ["ana", "ana"]
+    executor.shutdown()
+
+
+@pytest.fixture
+def gerenciador(tmp_path):
+    gerenciador = GerenciadorJobs(str(tmp_path / "jobs.sqlite3"), max_workers=1)
+    yield gerenciador
+    gerenciador.encerrar()
+
+
+def test_job_passa_de_pendente_a_executando_e_concluido(gerenciador):
+    iniciou, liberar = threading.Event(), threading.Event()
+
+    def trabalho(valor, atualizar):
+        iniciou.set()
+        liberar.wait(5)
+        atualizar(mensagem="quase lá", progresso=0.5)
+        return {"valor": valor}
+
+    primeiro = gerenciador.submeter("teste", trabalho, 1)
+    # Com um worker só, o segundo espera na fila enquanto o primeiro roda
+    segundo = gerenciador.submeter("teste", trabalho, 2)
+    assert iniciou.wait(5)
+    assert gerenciador.obter(primeiro)["estado"] == "executando"
+    assert gerenciador.obter(segundo)["estado"] == "pendente"
+    liberar.set()
+    for job_id, valor in ((primeiro, 1), (segundo, 2)):
+        job = gerenciador.aguardar(job_id, intervalo=0.01, timeout=5)
+        assert job["estado"] == "concluido"
+        assert job["progresso"] == 1.0
+        assert job["mensagem"] == "quase lá"
+        assert job["resultado"] == {"valor": valor}
+
+
+def test_job_com_excecao_termina_em_erro(gerenciador, caplog):
+    def trabalho(atualizar):
+        raise RuntimeError("API fora do ar")
+
+    job_id = gerenciador.submeter("teste", trabalho)
+    job = gerenciador.aguardar(job_id, intervalo=0.01, timeout=5)
+    assert job["estado"] == "erro"
+    assert job["erro"] == "API fora do ar"
+    assert job["resultado"] is None
+    assert any(registro.exc_info and job_id in registro.getMessage() for registro in caplog.records)
+
+
+def test_cancelar_libera_a_cota_da_fila(gerenciador):
+    iniciou, liberar = threading.Event(), threading.Event()
+
+    def ocupar(atualizar):
+        iniciou.set()
+        liberar.wait(5)
+
+    gerenciador._executor.max_fila_por_dono = 1
+    rodando = gerenciador.submeter("teste", ocupar, dono="ana")
+    assert iniciou.wait(5)
+    na_fila = gerenciador.submeter("teste", ocupar, dono="ana")
+    with pytest.raises(CotaExcedida):
+        gerenciador.submeter("teste", ocupar, dono="ana")
+    assert gerenciador.cancelar(na_fila)
+    assert gerenciador.obter(na_fila)["estado"] == "cancelado"
+    assert gerenciador._executor.na_fila("ana") == 0
+    # O lugar na fila volta para a ana sem esperar um worker descartar o job cancelado
+    outro = gerenciador.submeter("teste", ocupar, dono="ana")
+    liberar.set()
+    for job_id in (rodando, outro):
+        assert gerenciador.aguardar(job_id, intervalo=0.01, timeout=5)["estado"] == "concluido"
@@ -0,0 +1,59 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import RegistroMetricas, como_atual, span_atual
+
+
+def test_exportacao_concorrente(tmp_path):
+    caminho = tmp_path / "gerador.prom"
+    registro = RegistroMetricas(caminho_prometheus=str(caminho), intervalo_prometheus=0)
+
+    def etapa(i):
+        with registro.medir("etapa", bytes=i):
+            pass
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(etapa, range(200)))
+    assert 'gerador_etapa_execucoes_total{etapa="etapa"} 200' in caminho.read_text(encoding="utf-8")
+    assert [arquivo.name for arquivo in tmp_path.iterdir()] == ["gerador.prom"]
+
+
+def test_erro_de_disco_nao_interrompe_a_etapa(tmp_path, caplog):
+    registro = RegistroMetricas(caminho_jsonl=str(tmp_path / "sem_pasta" / "spans.jsonl"),
+                                caminho_prometheus=str(tmp_path / "sem_pasta" / "gerador.prom"))
+    with registro.medir("etapa") as span:
+        span["bytes"] = 10
+    assert registro.resumo_por_etapa()[0]["bytes"] == 10
+    assert "spans.jsonl" in caplog.text and "gerador.prom" in caplog.text
+
+
+def test_exportacao_limitada_pelo_intervalo(tmp_path):
+    caminho = tmp_path / "gerador.prom"
+    registro = RegistroMetricas(caminho_prometheus=str(caminho), intervalo_prometheus=3600)
+    for _ in range(3):
+        with registro.medir("etapa"):
+            pass
+    # Só o primeiro span regravou o arquivo; o resto espera o intervalo ou o descarregar()
+    assert 'gerador_etapa_execucoes_total{etapa="etapa"} 1' in caminho.read_text(encoding="utf-8")
+    registro.descarregar()
+    assert 'gerador_etapa_execucoes_total{etapa="etapa"} 3' in caminho.read_text(encoding="utf-8")
+
+
+def test_span_de_gerador_nao_vaza_para_quem_consome(tmp_path):
+    registro = RegistroMetricas()
+    vistos = []
+
+    def gerador():
+        with registro.medir("etapa", atual=False) as span:
+            with como_atual(span):
+                vistos.append(span_atual())
+            yield 1
+            yield 2
+
+    itens = gerador()
+    assert next(itens) == 1
+    assert span_atual() is None
+    # Abandonado e fechado em outro contexto (outra sessão do Streamlit, coleta de lixo): registra sem erro
+    contextvars.copy_context().run(itens.close)
+    assert vistos[0] is not None and span_atual() is None
+    assert registro.resumo_por_etapa()[0]["quantidade"] == 1
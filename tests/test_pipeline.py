@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from cache import CacheTranscricoes
+from cliente_falso import ClienteOpenAIFalso, RESPOSTA_RESUMO_FALSA
+from entrada_audio import AudioEntrada
+from jobs import GerenciadorJobs, job_ajustar_resumo, job_gerar_resumo, job_transcrever
+
+RESPOSTA_AJUSTADA = RESPOSTA_RESUMO_FALSA.replace("falso gerado offline", "ajustado offline").replace(
+    "Copy falsa gerada offline", "Copy ajustada offline"
+)
+
+
+@pytest.fixture
+def gerenciador(tmp_path):
+    gerenciador = GerenciadorJobs(str(tmp_path / "jobs.sqlite3"), max_workers=2)
+    yield gerenciador
+    gerenciador.encerrar()
+
+
+def concluir(gerenciador, job_id):
+    job = gerenciador.aguardar(job_id, intervalo=0.01, timeout=10)
+    assert job["estado"] == "concluido", job["erro"]
+    return job["resultado"]
+
+
+def test_transcricao_resumo_e_ajuste_pelos_jobs(gerenciador, tmp_path):
+    # O mesmo caminho da interface, sem rede: upload pequeno -> transcrição -> resumo -> "Ajuste tudo"
+    gravacao = tmp_path / "gravacao.json"
+    gravacao.write_text(json.dumps({"chat": [RESPOSTA_RESUMO_FALSA, RESPOSTA_AJUSTADA]}), encoding="utf-8")
+    client = ClienteOpenAIFalso.de_gravacao(str(gravacao), latencia=0.0)
+    cache = CacheTranscricoes(str(tmp_path / "transcricoes.sqlite3"))
+    entrada = AudioEntrada.de_bytes(b"\0" * 4000, "aula.mp3", pasta=str(tmp_path))
+
+    transcricao = concluir(gerenciador, gerenciador.submeter(
+        "transcricao", job_transcrever, entrada, "Aula 1", client, cache=cache, dono="ana"
+    ))
+    assert transcricao["titulo"] == "Aula 1"
+    assert transcricao["transcricao"] == "início da transcrição de aula.mp3 fim da transcrição de aula.mp3"
+
+    audio_info = concluir(gerenciador, gerenciador.submeter(
+        "resumo", job_gerar_resumo, transcricao, client, "gpt-4o-mini", dono="ana"
+    ))["audio_info"]
+    assert audio_info["modelo_escolhido"] == "gpt-4o-mini"
+    assert audio_info["resumo"]["resumo_pratico"] == "Resumo falso gerado offline."
+
+    historico = [{"role": "assistant", "content": audio_info["resumo"]}, {"role": "user", "content": "Ajuste tudo"}]
+    ajuste = concluir(gerenciador, gerenciador.submeter(
+        "ajuste", job_ajustar_resumo, historico, audio_info, client, dono="ana"
+    ))
+    assert ajuste["audio_info"]["resumo"]["resumo_pratico"] == "Resumo ajustado offline."
+    assert ajuste["audio_info"]["resumo"]["exemplos_copy"] == "Copy ajustada offline."
+    assert ajuste["chat_history"][-1] == {"role": "assistant", "content": ajuste["audio_info"]["resumo"]}
+    # Uma transcrição, um resumo e um ajuste do resumo inteiro
+    assert client.chamadas == 3
+    cache.fechar()
@@ -0,0 +1,17 @@
+import os
+
+from processar_lote import _caminho_saida
+
+
+def test_caminho_saida_distingue_arquivos_com_mesmo_nome(tmp_path):
+    saidas = set()
+    for turma in ("turma1", "turma2"):
+        os.makedirs(tmp_path / turma)
+        arquivo = str(tmp_path / turma / "aula 01.mp3")
+        titulo, caminho = _caminho_saida(arquivo, "resumos")
+        assert titulo == "aula 01"
+        assert os.path.basename(caminho).startswith("aula 01-")
+        # Mesmo arquivo, mesmo JSON: a retomada continua pulando o que já foi feito
+        assert _caminho_saida(arquivo, "resumos") == (titulo, caminho)
+        saidas.add(caminho)
+    assert len(saidas) == 2
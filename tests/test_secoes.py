@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+from cliente_falso import RESPOSTA_RESUMO_FALSA, ClienteOpenAIFalso
+from functions import SECOES_RESUMO, ParserSecoes, _extrair_secoes, _transmitir_secoes
+from metricas import span_atual
+
+TODAS = {chave for chave, _ in SECOES_RESUMO}
+
+
+def cliente_stream(pedacos):
+    # Stream de chat com os pedaços exatamente como dados (o cliente falso corta de 8 em 8 caracteres)
+    def create(**kwargs):
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=pedaco))])
+                     for pedaco in pedacos])
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def fatiar(texto, tamanho):
+    return [texto[i:i + tamanho] for i in range(0, len(texto), tamanho)]
+
+
+def transmitir(client, padroes=None):
+    return list(_transmitir_secoes(client, "gpt-4o-mini", "prompt", 1000, padroes=padroes))
+
+
+@pytest.mark.parametrize("tamanho", [1, 3, 8, 37])
+def test_stream_com_cabecalhos_cortados_igual_ao_parse_completo(tamanho):
+    atualizacoes = transmitir(cliente_stream(fatiar(RESPOSTA_RESUMO_FALSA, tamanho)))
+    final = _extrair_secoes(RESPOSTA_RESUMO_FALSA)
+    assert atualizacoes[-1] == (TODAS, final)
+    # Cada parcial é o começo do texto final de cada seção, e as seções aparecem na ordem
+    for _, secoes in atualizacoes[:-1]:
+        for chave in TODAS:
+            assert final[chave].startswith(secoes[chave])
+    primeira_vez = [min(i for i, (alteradas, _) in enumerate(atualizacoes) if chave in alteradas)
+                    for chave, _ in SECOES_RESUMO]
+    assert primeira_vez == sorted(primeira_vez)
+
+
+def test_stream_do_cliente_falso():
+    atualizacoes = transmitir(ClienteOpenAIFalso(latencia=0.0))
+    assert atualizacoes[-1][1] == _extrair_secoes(RESPOSTA_RESUMO_FALSA)
+
+
+def test_secao_ausente_usa_o_padrao():
+    sem_perguntas = RESPOSTA_RESUMO_FALSA.replace(
+        "3) Perguntas e respostas baseadas no texto:\nP: Isso é falso? R: Sim.\n\n", ""
+    )
+    padroes = {chave: f"anterior de {chave}" for chave in TODAS}
+    _, secoes = transmitir(cliente_stream(fatiar(sem_perguntas, 5)), padroes=padroes)[-1]
+    assert secoes["perguntas_respostas"] == "anterior de perguntas_respostas"
+    assert secoes == {**_extrair_secoes(RESPOSTA_RESUMO_FALSA), "perguntas_respostas": padroes["perguntas_respostas"]}
+    assert ParserSecoes().finalizar()["perguntas_respostas"].startswith("Conteúdo não gerado")
+
+
+def test_stream_interrompido_no_meio_de_uma_secao():
+    # Resposta cortada (limite de tokens) no meio da seção 2, sem a quebra de linha final
+    corte = RESPOSTA_RESUMO_FALSA.index("Resumo falso") + len("Resumo fal")
+    _, secoes = transmitir(cliente_stream(fatiar(RESPOSTA_RESUMO_FALSA[:corte], 4)))[-1]
+    assert secoes["pontos_principais"] == "- Ponto falso gerado offline."
+    assert secoes["resumo_pratico"] == "Resumo fal"
+    assert secoes["exemplos_copy"].startswith("Conteúdo não gerado")
+    assert secoes == _extrair_secoes(RESPOSTA_RESUMO_FALSA[:corte])
+
+
+def test_stream_so_marca_o_span_atual_durante_a_chamada():
+    spans = []
+
+    def create(**kwargs):
+        spans.append(span_atual())
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=pedaco))])
+                     for pedaco in fatiar(RESPOSTA_RESUMO_FALSA, 8)])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    for _ in _transmitir_secoes(client, "gpt-4o-mini", "prompt", 1000):
+        assert span_atual() is None
+    assert spans[0]["modelo"] == "gpt-4o-mini"
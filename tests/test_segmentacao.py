@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+import segmentacao
+from segmentacao import DURACAO_QUADRO, escolher_corte, planejar_cortes
+
+FALA_DB = -20.0
+SILENCIO_DB = -60.0
+
+
+def energias(quadros, pausas=()):
+    # Fala constante com pausas em [inicio, fim) quadros
+    valores = np.full(quadros, FALA_DB, dtype=np.float32)
+    for inicio, fim in pausas:
+        valores[inicio:fim] = SILENCIO_DB
+    return valores
+
+
+def test_corte_no_meio_da_pausa():
+    assert escolher_corte(energias(500, [(200, 240)])) == (220, False)
+
+
+def test_pausas_empatadas_corta_na_mais_tardia():
+    assert escolher_corte(energias(500, [(100, 130), (300, 330)])) == (315, False)
+
+
+def test_pausa_curta_demais_forca_corte_no_ponto_mais_baixo():
+    # 0,1 s de silêncio fica abaixo de MIN_SILENCIO: é espaço entre palavras, mas ainda o melhor ponto
+    corte, forcado = escolher_corte(energias(500, [(300, 305)]))
+    assert forcado
+    assert abs(corte - 302) <= 5
+
+
+def test_sem_pausa_forca_corte_no_vale_de_energia():
+    valores = energias(500)
+    valores[400:405] = FALA_DB - 5
+    corte, forcado = escolher_corte(valores)
+    assert forcado
+    assert abs(corte - 402) <= 5
+
+
+@pytest.mark.parametrize("tamanho_bloco", [1, 700, 3000])
+def test_planejar_cortes_em_pausas_e_sem_passar_do_alvo(monkeypatch, tamanho_bloco):
+    # 60 s com pausas perto de 18 s e 37 s; alvo de 20 s, procurando o corte nos últimos 5 s
+    valores = energias(3000, [(900, 930), (1850, 1880)])
+    monkeypatch.setattr(segmentacao, "energias_em_blocos", lambda arquivo: (
+        valores[i:i + tamanho_bloco] for i in range(0, len(valores), tamanho_bloco)
+    ))
+    cortes = list(planejar_cortes("aula.mp3", 20.0, 5.0))
+    assert [forcado for _, _, forcado in cortes] == [False, False, True, False]
+    assert cortes[0][1] == pytest.approx(915 * DURACAO_QUADRO)
+    assert cortes[1][1] == pytest.approx(1865 * DURACAO_QUADRO)
+    assert cortes[0][0] == 0.0 and cortes[-1][1] == pytest.approx(60.0)
+    for (_, fim, _), (inicio, _, _) in zip(cortes, cortes[1:]):
+        assert inicio == fim
+    assert all(fim - inicio <= 20.0 + 1e-9 for inicio, fim, _ in cortes)
+
+
+def test_audio_mais_curto_que_o_alvo_sai_inteiro(monkeypatch):
+    monkeypatch.setattr(segmentacao, "energias_em_blocos", lambda arquivo: iter([energias(250)]))
+    assert list(planejar_cortes("aula.mp3", 20.0, 5.0)) == [(0.0, pytest.approx(5.0), False)]
@@ -0,0 +1,149 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cache import CacheTranscricoes
+from cliente_falso import ClienteOpenAIFalso, ErroAPIFalso
+import functions
+from functions import _costurar, costurar_segmentos, dividir_audio_em_chunks, transcrever_chunks_segmentos
+
+
+def criar_chunks(pasta, quantidade, duracao=10.0):
+    chunks = []
+    for i in range(quantidade):
+        caminho = os.path.join(pasta, f"chunk_{i:04d}.mp3")
+        with open(caminho, "wb") as f:
+            f.write(b"\0" * 1000)
+        chunks.append((caminho, i * duracao, (i + 1) * duracao))
+    return chunks
+
+
+def cliente_com_atrasos(atrasos, falhas=()):
+    # Cliente falso com latência (ou falha) escolhida pelo nome do chunk enviado
+    falso = ClienteOpenAIFalso(latencia=0.0)
+    criar = falso.audio.transcriptions.create
+
+    def create(**kwargs):
+        nome = os.path.basename(kwargs["file"][0])
+        time.sleep(atrasos.get(nome, 0.0))
+        if nome in falhas:
+            raise ErroAPIFalso(500, f"falha em {nome}")
+        return criar(**kwargs)
+
+    falso.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=create))
+    return falso
+
+
+def test_chunks_que_terminam_fora_de_ordem_saem_em_ordem(tmp_path):
+    chunks = criar_chunks(str(tmp_path), 4)
+    # O primeiro chunk é o último a terminar
+    client = cliente_com_atrasos({"chunk_0000.mp3": 0.3, "chunk_0001.mp3": 0.1})
+    concluidos = []
+    segmentos = transcrever_chunks_segmentos(
+        chunks, client, max_workers=4, ao_transcrever_chunk=lambda indice, _: concluidos.append(indice)
+    )
+    assert concluidos[-1] == 0
+    assert [texto for _, _, texto in segmentos] == [
+        f"{parte} da transcrição de chunk_{i:04d}.mp3" for i in range(4) for parte in ("início", "fim")
+    ]
+    # Tempos deslocados pelo início de cada chunk no áudio
+    assert [inicio for inicio, _, _ in segmentos] == [0.0, 4.0, 10.0, 14.0, 20.0, 24.0, 30.0, 34.0]
+
+
+def test_chunk_que_falhou_e_retomado_do_cache(tmp_path):
+    chunks = criar_chunks(str(tmp_path), 4)
+    cache = CacheTranscricoes(str(tmp_path / "cache.sqlite3"))
+
+    def salvar(indice, segmentos):
+        cache.salvar_chunk("aula:segmentos", indice, json.dumps(segmentos, ensure_ascii=False))
+
+    # O chunk 2 demora a falhar, então os outros já terminaram e foram para o cache
+    with pytest.raises(ErroAPIFalso):
+        transcrever_chunks_segmentos(chunks, cliente_com_atrasos({"chunk_0002.mp3": 0.2}, falhas={"chunk_0002.mp3"}),
+                                     max_workers=4, ao_transcrever_chunk=salvar)
+    prontos = {i: json.loads(segmentos) for i, segmentos in cache.obter_chunks("aula:segmentos").items()}
+    assert sorted(prontos) == [0, 1, 3]
+
+    client = ClienteOpenAIFalso(latencia=0.0)
+    segmentos = transcrever_chunks_segmentos(chunks, client, max_workers=4, prontos=prontos, ao_transcrever_chunk=salvar)
+    # Só o chunk que faltava é reenviado
+    assert client.chamadas == 1
+    assert len(segmentos) == 8 and segmentos[4][2] == "início da transcrição de chunk_0002.mp3"
+    cache.fechar()
+
+
+def test_costurar_remove_repeticao_da_sobreposicao():
+    assert _costurar("um dois três quatro cinco", "três quatro cinco seis sete") == (
+        "um dois três quatro cinco", "seis sete"
+    )
+    # A palavra cortada pela borda do chunk anterior sai; a inteira, do chunk seguinte, fica
+    assert _costurar("um dois três quatro cinco se", "três quatro cinco seis sete") == (
+        "um dois três quatro cinco", "seis sete"
+    )
+
+
+def test_costurar_sem_sobreposicao_ou_vazio_nao_muda_nada():
+    assert _costurar("um dois três", "quatro cinco seis") == ("um dois três", "quatro cinco seis")
+    # Duas palavras iguais podem ser coincidência
+    assert _costurar("um dois três", "dois três quatro") == ("um dois três", "dois três quatro")
+    assert _costurar("", "quatro cinco") == ("", "quatro cinco")
+    assert _costurar("um dois", "") == ("um dois", "")
+
+
+def test_costurar_segmentos_desloca_e_tira_repeticao_so_onde_sobrepoe():
+    segmentos = [
+        [(0.0, 10.0, "um dois três quatro cinco")],
+        [(0.0, 3.0, "três quatro cinco seis"), (3.0, 11.0, " sete oito ")],
+        [],
+        [(0.0, 5.0, "sete oito nove dez")],
+    ]
+    # O chunk 1 começa 1 s antes do fim do 0 (corte forçado); o 3 começa onde o 2 (vazio) termina
+    intervalos = [(0.0, 10.0), (9.0, 20.0), (20.0, 25.0), (25.0, 30.0)]
+    assert costurar_segmentos(segmentos, intervalos) == [
+        (0.0, 10.0, "um dois três quatro cinco"), (9.0, 12.0, "seis"), (12.0, 20.0, "sete oito"),
+        (25.0, 30.0, "sete oito nove dez"),
+    ]
+
+
+def test_costurar_segmentos_sem_intervalos_emenda_pelo_ultimo_segmento():
+    segmentos = [[(0.0, 4.0, "a"), (4.0, 8.0, "b")], [(0.0, 4.0, "c")], [(0.0, 2.0, "   ")]]
+    assert costurar_segmentos(segmentos, [(None, None)] * 3) == [(0.0, 4.0, "a"), (4.0, 8.0, "b"), (8.0, 12.0, "c")]
+
+
+@pytest.fixture
+def divisao_falsa(monkeypatch, tmp_path):
+    # Três cortes fixos e um ffmpeg que só grava um arquivo e anota o que extraiu
+    extraidos = []
+
+    def extrair(arquivo, inicio, fim, caminho, copiar):
+        extraidos.append((os.path.basename(caminho), copiar))
+        with open(caminho, "wb") as f:
+            f.write(b"\0" * 100)
+
+    monkeypatch.setattr(functions, "planejar_cortes", lambda arquivo, alvo, janela: iter([
+        (0.0, 10.0, False), (10.0, 20.0, False), (20.0, 25.0, False)
+    ]))
+    monkeypatch.setattr(functions, "_extrair_trecho", extrair)
+    arquivo = tmp_path / "aula.mp3"
+    arquivo.write_bytes(b"\0" * 1000)
+    return str(arquivo), str(tmp_path), extraidos
+
+
+def test_divisao_nao_extrai_chunks_ja_transcritos(monkeypatch, divisao_falsa):
+    arquivo, pasta, extraidos = divisao_falsa
+    monkeypatch.setattr(functions, "duracao_audio", lambda arquivo: 25.0)
+    chunks = list(dividir_audio_em_chunks(arquivo, pasta_destino=pasta, pular={0, 2}))
+    assert [caminho is None for caminho, _, _ in chunks] == [True, False, True]
+    assert [(inicio, fim) for _, inicio, fim in chunks] == [(0.0, 10.0), (10.0, 20.0), (20.0, 25.0)]
+    assert extraidos == [("chunk_0001.mp3", True)]
+
+
+def test_divisao_sem_duracao_recodifica(monkeypatch, divisao_falsa):
+    # Sem a duração, o bitrate do original é desconhecido: copiar poderia passar do limite do upload
+    arquivo, pasta, extraidos = divisao_falsa
+    monkeypatch.setattr(functions, "duracao_audio", lambda arquivo: None)
+    list(dividir_audio_em_chunks(arquivo, pasta_destino=pasta))
+    assert extraidos == [(f"chunk_{i:04d}.mp3", False) for i in range(3)]
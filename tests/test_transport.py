@@ -0,0 +1,161 @@
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+import transport
+from cliente_falso import ClienteOpenAIFalso, ErroAPIFalso
+from metricas import medir
+from transport import BaldeTokens, CircuitoAberto, ClienteResiliente, retry_after
+
+
+class ErroHTTP(Exception):
+    def __init__(self, status_code, cabecalhos=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=cabecalhos or {})
+
+
+class Relogio:
+    # Substitui o time do transport: as esperas avançam o relógio em vez de dormir
+    def __init__(self):
+        self.agora = 1000.0
+        self.esperas = []
+
+    def monotonic(self):
+        return self.agora
+
+    def sleep(self, segundos):
+        self.esperas.append(segundos)
+        self.agora += segundos
+
+    def time(self):
+        return time.time()
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(transport, "time", relogio)
+    return relogio
+
+
+def cliente_com_respostas(respostas, max_tentativas=1, espera_base=0.0):
+    # Cada chamada consome a próxima resposta; exceções são levantadas
+    def criar(**kwargs):
+        resposta = respostas.pop(0)
+        if isinstance(resposta, BaseException):
+            raise resposta
+        return resposta
+
+    falso = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=criar)))
+    cliente = ClienteResiliente(falso, limites={"chat": {}}, max_tentativas=max_tentativas, espera_base=espera_base)
+    disjuntor = cliente.endpoints["chat"].disjuntor
+    disjuntor.falhas_para_abrir = 2
+    disjuntor.tempo_aberto = 0.0
+    return cliente, disjuntor
+
+
+def chamar(cliente):
+    return cliente.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "oi"}])
+
+
+@pytest.mark.parametrize("erro_no_teste", [ErroHTTP(429), KeyboardInterrupt()])
+def test_pedido_de_teste_sem_veredito_libera_o_circuito(erro_no_teste):
+    cliente, disjuntor = cliente_com_respostas([ErroHTTP(503), ErroHTTP(503), erro_no_teste, "ok"])
+    for _ in range(2):
+        with pytest.raises(ErroHTTP):
+            chamar(cliente)
+    # Circuito meio aberto: o próximo pedido é o teste, e ele não responde nada sobre a saúde do servidor
+    with pytest.raises(type(erro_no_teste)):
+        chamar(cliente)
+    assert disjuntor.estado == "meio_aberto"
+    assert chamar(cliente) == "ok"
+    assert disjuntor.estado == "fechado"
+
+
+def test_circuito_aberto_recusa_outros_pedidos_durante_o_teste():
+    cliente, disjuntor = cliente_com_respostas([ErroHTTP(503), ErroHTTP(503)])
+    for _ in range(2):
+        with pytest.raises(ErroHTTP):
+            chamar(cliente)
+    assert disjuntor.permitir() is True
+    with pytest.raises(CircuitoAberto):
+        chamar(cliente)
+
+
+def test_balde_vazio_faz_esperar_na_ordem_de_chegada(relogio):
+    balde = BaldeTokens(60)
+    assert balde.reservar(60) == 0.0
+    # Vazio, enche 1 por segundo: cada reserva espera a sua vez depois das anteriores
+    assert balde.reservar(1) == pytest.approx(1.0)
+    assert balde.reservar(2) == pytest.approx(3.0)
+    relogio.agora += 3.0
+    assert balde.reservar(1) == pytest.approx(1.0)
+
+
+def test_cliente_espera_o_limite_de_requisicoes(relogio):
+    falso = ClienteOpenAIFalso(latencia=0.0)
+    cliente = ClienteResiliente(falso, limites={"chat": {"rpm": 2}}, espera_base=0.0)
+    with medir("chat_teste") as span:
+        for _ in range(3):
+            chamar(cliente)
+    # 2 por minuto: a terceira chamada espera 30 s pela ficha
+    assert relogio.esperas == [pytest.approx(30.0)]
+    assert span["espera_limite"] == pytest.approx(30.0)
+    assert falso.chamadas == 3
+
+
+@pytest.mark.parametrize("formato", ["segundos", "milissegundos", "data"])
+def test_429_respeita_o_retry_after(relogio, formato):
+    cabecalhos = {
+        "segundos": {"retry-after": "7"},
+        "milissegundos": {"retry-after-ms": "7000", "retry-after": "1"},
+        "data": {"retry-after": format_datetime(datetime.now(timezone.utc) + timedelta(seconds=7), usegmt=True)},
+    }[formato]
+    # A data HTTP tem resolução de segundos
+    assert retry_after(ErroHTTP(429, cabecalhos)) == pytest.approx(7.0, abs=2.0)
+    cliente, _ = cliente_com_respostas([ErroHTTP(429, cabecalhos), "ok"], max_tentativas=3, espera_base=100.0)
+    assert chamar(cliente) == "ok"
+    # A espera vem do servidor, não do backoff (que seria de 100 s ou mais)
+    assert len(relogio.esperas) == 1
+    assert relogio.esperas[0] == pytest.approx(7.0, abs=2.0)
+
+
+def test_erro_do_servidor_repete_com_backoff_exponencial(relogio):
+    cliente, disjuntor = cliente_com_respostas([ErroHTTP(503), ErroHTTP(502), "ok"], max_tentativas=3, espera_base=1.0)
+    disjuntor.falhas_para_abrir = 10
+    with medir("chat_teste") as span:
+        assert chamar(cliente) == "ok"
+    assert len(relogio.esperas) == 2
+    assert 1.0 <= relogio.esperas[0] <= 2.0
+    assert 2.0 <= relogio.esperas[1] <= 3.0
+    assert span["retentativas"] == 2
+
+
+def test_desiste_depois_das_tentativas_e_nao_repete_erro_do_pedido(relogio):
+    cliente, disjuntor = cliente_com_respostas([ErroHTTP(503)] * 3, max_tentativas=3, espera_base=1.0)
+    disjuntor.falhas_para_abrir = 10
+    with pytest.raises(ErroHTTP):
+        chamar(cliente)
+    assert len(relogio.esperas) == 2
+    cliente, _ = cliente_com_respostas([ErroHTTP(400), "ok"], max_tentativas=3, espera_base=1.0)
+    with pytest.raises(ErroHTTP):
+        chamar(cliente)
+    assert len(relogio.esperas) == 2
+
+
+def test_falhas_do_cliente_falso_sao_repetidas(relogio):
+    # A cada 2 chamadas o cliente falso devolve 429 (sem Retry-After): cada falha vira uma nova tentativa
+    falso = ClienteOpenAIFalso(latencia=0.0, falhar_a_cada=2)
+    cliente = ClienteResiliente(falso, limites={"chat": {}}, max_tentativas=3, espera_base=1.0)
+    for _ in range(3):
+        assert chamar(cliente).choices[0].message.content
+    assert falso.chamadas == 5
+    assert len(relogio.esperas) == 2 and all(1.0 <= espera <= 2.0 for espera in relogio.esperas)
+    with pytest.raises(ErroAPIFalso):
+        ClienteResiliente(falso, limites={"chat": {}}, max_tentativas=1).chat.completions.create(
+            model="gpt-4o-mini", messages=[{"role": "user", "content": "oi"}]
+        )
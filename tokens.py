@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from functools import lru_cache
+
+from cache import PASTA_CACHE_PADRAO
+
+# Janela de contexto (prompt + resposta) e maior resposta aceita por cada modelo oferecido na interface
+LIMITES_MODELOS = {
+    "gpt-4o-mini": {"contexto": 128000, "max_saida": 16384, "encoding": "o200k_base"},
+    "o1-mini": {"contexto": 128000, "max_saida": 65536, "encoding": "o200k_base"},
+    "o3-mini": {"contexto": 200000, "max_saida": 100000, "encoding": "o200k_base"},
+}
+LIMITES_PADRAO = {"contexto": 128000, "max_saida": 16384, "encoding": "o200k_base"}
+# Tokens que a API acrescenta por mensagem (papel, separadores), com folga
+TOKENS_POR_MENSAGEM = 8
+# Folga para diferenças entre a contagem local e a do servidor
+MARGEM_SEGURANCA = 256
+
+# O tiktoken baixa o arquivo BPE na primeira vez e guarda em TIKTOKEN_CACHE_DIR. Sem internet, o arquivo
+# pode ser copiado para GERADOR_TIKTOKEN_BPE (ex.: o200k_base.tiktoken) ou baixado antes com `python tokens.py`.
+PASTA_TIKTOKEN = os.path.join(PASTA_CACHE_PADRAO, "tiktoken")
+URL_ENCODINGS = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+# Transcrições acima disso são contadas em pedaços paralelos e ficam no cache de contagens
+MIN_CARACTERES_CACHE = 20000
+CARACTERES_POR_PEDACO = 100000
+
+log = logging.getLogger(__name__)
+
+_codificadores = {}
+_lock_codificadores = threading.Lock()
+
+def _preparar_arquivo_offline(nome_encoding):
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", PASTA_TIKTOKEN)
+    arquivo_local = os.environ.get("GERADOR_TIKTOKEN_BPE")
+    if not arquivo_local or not os.path.exists(arquivo_local):
+        return
+    # Mesmo nome que o tiktoken usa no cache dele, para não tentar baixar
+    url = URL_ENCODINGS.format(nome_encoding)
+    destino = os.path.join(os.environ["TIKTOKEN_CACHE_DIR"], hashlib.sha1(url.encode()).hexdigest())
+    if not os.path.exists(destino):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        shutil.copyfile(arquivo_local, destino)
+
+def obter_codificador(modelo=None):
+    # None quando o tiktoken não está instalado ou o arquivo do encoding não está disponível offline
+    nome_encoding = limites_modelo(modelo)["encoding"]
+    with _lock_codificadores:
+        if nome_encoding not in _codificadores:
+            try:
+                import tiktoken
+                _preparar_arquivo_offline(nome_encoding)
+                _codificadores[nome_encoding] = tiktoken.get_encoding(nome_encoding)
+            except Exception as e:
+                log.warning("Tokenizador %s indisponível (%s); usando estimativa.", nome_encoding, type(e).__name__)
+                _codificadores[nome_encoding] = None
+        return _codificadores[nome_encoding]
+
+def _estimar(texto):
+    # Conservadora de propósito (português fica perto de 4 caracteres por token no o200k_base)
+    return max(len(texto.split()), len(texto) // 3)
+
+def _dividir_em_pedacos(texto, tamanho):
+    # Corta antes de um espaço: o pré-tokenizador junta o espaço à palavra seguinte, então a soma bate com o total
+    pedacos = []
+    inicio = 0
+    while inicio < len(texto):
+        fim = min(len(texto), inicio + tamanho)
+        if fim < len(texto):
+            espaco = texto.rfind(" ", inicio + 1, fim)
+            fim = espaco if espaco > inicio else fim
+        pedacos.append(texto[inicio:fim])
+        inicio = fim
+    return pedacos
+
+@lru_cache(maxsize=64)
+def _contar_grande(texto, nome_encoding):
+    codificador = _codificadores[nome_encoding]
+    pedacos = _dividir_em_pedacos(texto, CARACTERES_POR_PEDACO)
+    return sum(len(tokens) for tokens in codificador.encode_ordinary_batch(pedacos))
+
+def contar_tokens(texto, modelo=None):
+    if not texto:
+        return 0
+    codificador = obter_codificador(modelo)
+    if codificador is None:
+        return _estimar(texto)
+    if len(texto) >= MIN_CARACTERES_CACHE:
+        # A interface e o resumo contam a mesma transcrição várias vezes por rerun
+        return _contar_grande(texto, codificador.name)
+    return len(codificador.encode_ordinary(texto))
+
+def contar_tokens_lote(textos, modelo=None):
+    codificador = obter_codificador(modelo)
+    if codificador is None:
+        return [_estimar(texto) if texto else 0 for texto in textos]
+    return [len(tokens) for tokens in codificador.encode_ordinary_batch(list(textos))]
+
+def limites_modelo(modelo):
+    return LIMITES_MODELOS.get(modelo, LIMITES_PADRAO)
+
+def espaco_resposta(modelo, tokens_prompt):
+    # Quanto sobra para a resposta depois do prompt, respeitando o teto de saída do modelo
+    limites = limites_modelo(modelo)
+    return max(0, min(limites["max_saida"], limites["contexto"] - tokens_prompt - MARGEM_SEGURANCA))
+
+def escolher_max_tokens(modelo, tokens_prompt, desejado, minimo):
+    # None quando não sobra nem o mínimo aceitável: quem chama precisa encolher o prompt
+    disponivel = espaco_resposta(modelo, tokens_prompt)
+    if disponivel < minimo:
+        return None
+    return min(desejado, disponivel)
+
+if __name__ == "__main__":
+    # Baixa (ou copia de GERADOR_TIKTOKEN_BPE) os encodings dos modelos para uso offline
+    for modelo in LIMITES_MODELOS:
+        estado = "ok" if obter_codificador(modelo) is not None else "indisponível"
+        print(f"{modelo}: {LIMITES_MODELOS[modelo]['encoding']} {estado} ({os.environ.get('TIKTOKEN_CACHE_DIR')})")
@@ -0,0 +1,308 @@
+import email.utils
+import hashlib
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from metricas import registro, span_atual
+from tokens import contar_tokens, contar_tokens_lote, TOKENS_POR_MENSAGEM
+
+# Limites por endpoint, em requisições e tokens por minuto (padrões do tier 1 da OpenAI). Podem ser trocados
+# pelo ambiente, ex.: GERADOR_RPM_CHAT=5000 GERADOR_TPM_CHAT=2000000; 0 desliga o limite.
+LIMITES_ENDPOINTS = {
+    "chat": {"rpm": 500, "tpm": 200_000},
+    "transcricao": {"rpm": 500, "tpm": 0},
+    "embeddings": {"rpm": 3000, "tpm": 1_000_000},
+}
+MAX_TENTATIVAS = 5
+ESPERA_BASE_RETRY = 1.0
+ESPERA_MAXIMA_RETRY = 60.0
+# Falhas seguidas do servidor (5xx, timeout, conexão) que abrem o circuito, e por quanto tempo ele fica aberto
+FALHAS_ABRIR_CIRCUITO = 5
+TEMPO_CIRCUITO_ABERTO = 30.0
+# Conexões reaproveitadas entre chamadas e threads; leitura longa para gerações grandes e uploads do Whisper
+MAX_CONEXOES = 32
+MAX_CONEXOES_OCIOSAS = 16
+TIMEOUTS_HTTP = {"connect": 10.0, "read": 600.0, "write": 120.0, "pool": 60.0}
+
+class CircuitoAberto(RuntimeError):
+    pass
+
+class BaldeTokens:
+    # Balde que enche continuamente até `por_minuto`. Quem reserva já desconta a sua parte e recebe quanto
+    # precisa esperar: o saldo pode ficar negativo, e as próximas reservas esperam na ordem de chegada.
+    def __init__(self, por_minuto):
+        self.capacidade = float(por_minuto)
+        self.taxa = self.capacidade / 60.0
+        self._disponivel = self.capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, quantidade):
+        with self._lock:
+            agora = time.monotonic()
+            self._disponivel = min(self.capacidade, self._disponivel + (agora - self._atualizado) * self.taxa)
+            self._atualizado = agora
+            # Um pedido maior que o balde inteiro passaria a esperar para sempre
+            self._disponivel -= min(quantidade, self.capacidade)
+            return max(0.0, -self._disponivel / self.taxa)
+
+class Disjuntor:
+    # Fechado: tudo passa. Depois de FALHAS_ABRIR_CIRCUITO falhas seguidas, abre e recusa na hora por
+    # `tempo_aberto` segundos; então deixa passar um pedido de teste (meio aberto) e fecha se ele der certo.
+    def __init__(self, nome, falhas_para_abrir=FALHAS_ABRIR_CIRCUITO, tempo_aberto=TEMPO_CIRCUITO_ABERTO):
+        self.nome = nome
+        self.falhas_para_abrir = falhas_para_abrir
+        self.tempo_aberto = tempo_aberto
+        self.falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self.falhas < self.falhas_para_abrir:
+            return "fechado"
+        return "aberto" if time.monotonic() < self._aberto_ate or self._testando else "meio_aberto"
+
+    def permitir(self):
+        # Devolve True quando o pedido liberado é o de teste; quem o recebe tem de chamar liberar_teste() ao terminar
+        with self._lock:
+            if self.falhas < self.falhas_para_abrir:
+                return False
+            restante = self._aberto_ate - time.monotonic()
+            if restante > 0 or self._testando:
+                raise CircuitoAberto(
+                    f"API ({self.nome}) indisponível após {self.falhas} falhas seguidas; "
+                    f"nova tentativa em {max(0.0, restante):.0f}s"
+                )
+            self._testando = True
+            return True
+
+    def liberar_teste(self):
+        # Fim do pedido de teste sem veredito sobre o servidor (429, erro local, interrupção): o próximo pedido
+        # vira o novo teste, em vez de o circuito ficar recusando tudo para sempre
+        with self._lock:
+            self._testando = False
+
+    def sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self.falhas += 1
+            self._testando = False
+            if self.falhas >= self.falhas_para_abrir:
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+                abriu = True
+            else:
+                abriu = False
+        if abriu:
+            registro.registrar("circuito_aberto", 0.0, endpoint=self.nome, falhas=self.falhas)
+
+def status_erro(erro):
+    return getattr(erro, "status_code", None)
+
+def erro_retentavel(erro):
+    # 429 (rate limit) e 5xx valem nova tentativa; 4xx restantes são erro do pedido
+    status = status_erro(erro)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    # Só chega aqui depois de uma chamada, com o SDK já carregado
+    import httpx
+    from openai import APIConnectionError
+    return isinstance(erro, (APIConnectionError, httpx.TransportError))
+
+def retry_after(erro):
+    # Segundos pedidos pelo servidor (retry-after-ms da OpenAI, Retry-After em segundos ou data HTTP)
+    resposta = getattr(erro, "response", None)
+    cabecalhos = getattr(resposta, "headers", None) or {}
+    try:
+        if cabecalhos.get("retry-after-ms"):
+            return float(cabecalhos["retry-after-ms"]) / 1000
+        valor = cabecalhos.get("retry-after")
+        if not valor:
+            return None
+        try:
+            return float(valor)
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _estimar_tokens_chat(kwargs):
+    # O limite de TPM da OpenAI conta o prompt mais o máximo de resposta pedido
+    modelo = kwargs.get("model")
+    prompt = sum(
+        contar_tokens(mensagem["content"], modelo) + TOKENS_POR_MENSAGEM
+        for mensagem in kwargs.get("messages", ()) if isinstance(mensagem.get("content"), str)
+    )
+    return prompt + (kwargs.get("max_completion_tokens") or kwargs.get("max_tokens") or 0)
+
+def _estimar_tokens_embeddings(kwargs):
+    entrada = kwargs.get("input") or []
+    return sum(contar_tokens_lote([entrada] if isinstance(entrada, str) else list(entrada), kwargs.get("model")))
+
+ESTIMADORES_TOKENS = {
+    "chat": _estimar_tokens_chat,
+    "transcricao": lambda kwargs: 0,
+    "embeddings": _estimar_tokens_embeddings,
+}
+
+class Endpoint:
+    def __init__(self, nome, rpm=0, tpm=0):
+        self.nome = nome
+        self.requisicoes = BaldeTokens(rpm) if rpm else None
+        self.tokens = BaldeTokens(tpm) if tpm else None
+        self.disjuntor = Disjuntor(nome)
+        self._pausado_ate = 0.0
+
+    def reservar(self, tokens):
+        esperas = [0.0, self._pausado_ate - time.monotonic()]
+        if self.requisicoes is not None:
+            esperas.append(self.requisicoes.reservar(1))
+        if self.tokens is not None and tokens:
+            esperas.append(self.tokens.reservar(tokens))
+        return max(esperas)
+
+    def pausar(self, segundos):
+        # Depois de um 429, todos os pedidos do endpoint esperam o Retry-After, não só quem recebeu o erro
+        self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+
+def _limites_do_ambiente():
+    return {
+        nome: {
+            chave: int(os.environ.get(f"GERADOR_{chave.upper()}_{nome.upper()}", padrao))
+            for chave, padrao in limites.items()
+        }
+        for nome, limites in LIMITES_ENDPOINTS.items()
+    }
+
+class ClienteResiliente:
+    # Envolve um cliente com a superfície da OpenAI (o real ou um falso): antes de cada chamada reserva
+    # requisição e tokens estimados no balde do endpoint, e repete erros transitórios com backoff exponencial
+    # com jitter, respeitando o Retry-After. Falhas seguidas do servidor abrem o circuito do endpoint, e as
+    # chamadas falham na hora em vez de empilhar timeouts. Streams só são repetidos se falharem ao abrir.
+    def __init__(self, client, limites=None, max_tentativas=MAX_TENTATIVAS, espera_base=ESPERA_BASE_RETRY):
+        self._client = client
+        self.max_tentativas = max_tentativas
+        self.espera_base = espera_base
+        limites = limites or _limites_do_ambiente()
+        self.endpoints = {nome: Endpoint(nome, **limites.get(nome, {})) for nome in ESTIMADORES_TOKENS}
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(
+            create=self._envolver("transcricao", lambda: client.audio.transcriptions.create)
+        ))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            create=self._envolver("chat", lambda: client.chat.completions.create)
+        ))
+        self.embeddings = SimpleNamespace(create=self._envolver("embeddings", lambda: client.embeddings.create))
+
+    def _envolver(self, nome, obter_metodo):
+        def chamar(*args, **kwargs):
+            return self._executar(self.endpoints[nome], obter_metodo(), args, kwargs)
+        return chamar
+
+    def _esperar(self, segundos, endpoint):
+        span = span_atual()
+        if span is not None:
+            span["espera_limite"] = span.get("espera_limite", 0.0) + segundos
+        registro.registrar("espera_limite_api", segundos, endpoint=endpoint.nome)
+        time.sleep(segundos)
+
+    def _executar(self, endpoint, funcao, args, kwargs):
+        tokens = ESTIMADORES_TOKENS[endpoint.nome](kwargs)
+        arquivo = kwargs.get("file")
+        if isinstance(arquivo, tuple):
+            arquivo = arquivo[1]
+        for tentativa in range(self.max_tentativas):
+            teste = endpoint.disjuntor.permitir()
+            try:
+                espera = endpoint.reservar(tokens)
+                if espera > 0:
+                    self._esperar(espera, endpoint)
+                if tentativa and hasattr(arquivo, "seek"):
+                    # A tentativa anterior já leu o upload até o fim
+                    arquivo.seek(0)
+                try:
+                    resposta = funcao(*args, **kwargs)
+                except Exception as e:
+                    status = status_erro(e)
+                    if not erro_retentavel(e):
+                        # Erro do próprio pedido (4xx): não diz nada contra o servidor
+                        endpoint.disjuntor.sucesso()
+                        raise
+                    # Um 429 mostra que o servidor responde, mas não que aguenta a carga: não conta como falha
+                    # nem fecha o circuito; o teste é liberado no finally
+                    if status != 429:
+                        endpoint.disjuntor.falha()
+                    if tentativa == self.max_tentativas - 1:
+                        raise
+                    pedido = retry_after(e)
+                    espera = min(ESPERA_MAXIMA_RETRY, pedido if pedido is not None else
+                                 self.espera_base * 2 ** tentativa + random.uniform(0, self.espera_base))
+                    span = span_atual()
+                    if span is not None:
+                        span["retentativas"] = span.get("retentativas", 0) + 1
+                    registro.registrar("retentativa_api", espera, endpoint=endpoint.nome, status=status)
+                    if status == 429:
+                        # A espera vem do balde pausado na próxima reserva, junto com os outros pedidos
+                        endpoint.pausar(espera)
+                    else:
+                        time.sleep(espera)
+                    continue
+                endpoint.disjuntor.sucesso()
+                return resposta
+            finally:
+                if teste:
+                    endpoint.disjuntor.liberar_teste()
+
+    def estado(self):
+        return {nome: endpoint.disjuntor.estado for nome, endpoint in self.endpoints.items()}
+
+_clientes = {}
+_lock_clientes = threading.Lock()
+
+def criar_cliente_http():
+    import httpx
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=MAX_CONEXOES, max_keepalive_connections=MAX_CONEXOES_OCIOSAS, keepalive_expiry=60.0
+        ),
+        timeout=httpx.Timeout(**TIMEOUTS_HTTP),
+    )
+
+class _ClienteAdiado:
+    # Só importa o SDK da OpenAI (~0,5 s com o httpx) e cria o cliente na primeira chamada à API, que acontece
+    # num job em segundo plano; assim a interface abre sem esse custo
+    def __init__(self, fabrica):
+        self._fabrica = fabrica
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, nome):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._fabrica()
+        return getattr(self._client, nome)
+
+def _criar_cliente_openai(api_key, base_url):
+    import httpx
+    from openai import OpenAI
+    return OpenAI(
+        api_key=api_key, base_url=base_url, http_client=criar_cliente_http(), max_retries=0,
+        timeout=httpx.Timeout(**TIMEOUTS_HTTP),
+    )
+
+def obter_cliente(api_key, base_url=None):
+    # Um cliente por chave no processo: pool de conexões, baldes e circuitos são compartilhados por todas as
+    # sessões e threads. As retentativas do SDK ficam desligadas; quem repete é o ClienteResiliente.
+    chave = (hashlib.sha256((api_key or "").encode("utf-8")).hexdigest(), base_url)
+    with _lock_clientes:
+        if chave not in _clientes:
+            _clientes[chave] = ClienteResiliente(_ClienteAdiado(lambda: _criar_cliente_openai(api_key, base_url)))
+        return _clientes[chave]
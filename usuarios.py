@@ -0,0 +1,29 @@
+import hashlib
+import hmac
+import os
+import re
+
+# Espaço de quem entra com a credencial única do formato antigo: o mesmo histórico, índice e pastas de antes
+ESPACO_COMPARTILHADO = ""
+
+def contas(credenciais):
+    # [credentials.usuarios] com um usuário = "senha" por linha, ou o formato antigo (user/password) com uma conta só
+    if "usuarios" in credenciais:
+        return dict(credenciais["usuarios"]), True
+    return {credenciais["user"]: credenciais["password"]}, False
+
+def autenticar(credenciais, usuario, senha):
+    # Devolve o espaço de trabalho do usuário (None se a senha não confere). Com várias contas cada uma tem o seu;
+    # com a credencial única todos compartilham o espaço padrão
+    configuradas, multiusuario = contas(credenciais)
+    esperada = configuradas.get(usuario)
+    if esperada is None or not hmac.compare_digest(str(esperada).encode("utf-8"), senha.encode("utf-8")):
+        return None
+    return usuario if multiusuario else ESPACO_COMPARTILHADO
+
+def pasta_do_espaco(base, espaco):
+    # Subpasta do usuário dentro de `base`; o hash evita que nomes diferentes caiam na mesma pasta depois do saneamento
+    if espaco == ESPACO_COMPARTILHADO:
+        return base
+    nome = re.sub(r"[^A-Za-z0-9_-]", "_", espaco)[:40]
+    return os.path.join(base, "usuarios", f"{nome}-{hashlib.sha256(espaco.encode('utf-8')).hexdigest()[:8]}")